@@ -1,26 +1,54 @@
+import functools
+import logging
 from flask import Flask, render_template, redirect, request, make_response
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO
 from src.game import Goatan, GameManager, GameState
 from src.interface import GoatanNamespace, LobbyNamespace
 from src.user import UserManager, User
+from src.actor import ActorPool
+from src import settings
+from src import board_generator
 
 app = Flask(__name__)
-socketio = SocketIO(app)
 
-users = UserManager()
-games = GameManager()
+# Workers of a sharded deployment can share a message queue (e.g. redis://), so that events emitted on one of them
+# reach clients connected to the others.
+socketio = SocketIO(app, message_queue=settings.MESSAGE_QUEUE)
 
-game_namespace = GoatanNamespace(games)
+# Game events are emitted from the actors' worker threads, outside of any request.
+game_emitter = functools.partial(socketio.emit, namespace="/goatan")
+users, games = settings.managers(game_emitter)
+
+actors = ActorPool()
+
+game_namespace = GoatanNamespace(games, actors)
 socketio.on_namespace(game_namespace)
 
-lobby_namespace = LobbyNamespace(games)
+lobby_namespace = LobbyNamespace(games, actors)
 socketio.on_namespace(lobby_namespace)
 
+# Board layouts are built when the server starts rather than by the first game of each size.
+board_generator.precompute_layouts()
+
 
 def error_page(message):
     return make_response(render_template("error.html", message=message))
 
 
+# Users that were forgotten after a while are still known to the games they joined.
+def known_user(user_id, game):
+    if user_id is None:
+        return False
+    return users.get(user_id) is not None or game.players.player_for_user(user_id) is not None
+
+
+def owner_redirect(game_id):
+    owner_url = games.owner_url(game_id)
+    if owner_url is None:
+        return None
+    return redirect(owner_url + request.path)
+
+
 @app.route("/")
 def base():
     return render_template("index.html")
@@ -34,6 +62,9 @@ def create_game():
 
 @app.route("/game/join/<game_id>")
 def join_game(game_id):
+    if (response := owner_redirect(game_id)) is not None:
+        return response
+
     game = games.get(game_id)
     if game is None:
         return error_page(f"Game not found: {game_id}")
@@ -46,6 +77,9 @@ def join_game(game_id):
 
 @app.route("/game/lobby/<game_id>")
 def lobby(game_id):
+    if (response := owner_redirect(game_id)) is not None:
+        return response
+
     game = games.get(game_id)
     if game is None:
         return error_page(f"Game not found: {game_id}")
@@ -56,7 +90,7 @@ def lobby(game_id):
     response = make_response(render_template("lobby.html", game_id=game_id))
 
     user_id = request.cookies.get("user_id")
-    if user_id is None or users.get(user_id) is None:
+    if not known_user(user_id, game):
         user = users.create_user()
         response.set_cookie("user_id", user.id)
 
@@ -65,6 +99,9 @@ def lobby(game_id):
 
 @app.route("/game/play/<game_id>")
 def play(game_id):
+    if (response := owner_redirect(game_id)) is not None:
+        return response
+
     game = games.get(game_id)
     if game is None:
         return error_page(f"Game not found: {game_id}")
@@ -73,7 +110,7 @@ def play(game_id):
         return error_page(f"Invalid game state: {game.state.name}")
 
     user_id = request.cookies.get("user_id")
-    if user_id is None or users.get(user_id) is None:
+    if not known_user(user_id, game):
         return error_page(f"User not found: {user_id}")
 
     player = game.players.player_for_user(user_id)
@@ -94,4 +131,5 @@ def play(game_id):
 
 
 if __name__ == '__main__':
-    socketio.run(app, port=8000, debug=True, allow_unsafe_werkzeug=True)
+    logging.basicConfig(level=logging.INFO)
+    socketio.run(app, port=settings.PORT, debug=settings.SHARD_URLS is None, allow_unsafe_werkzeug=True)
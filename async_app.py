@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import re
+from http.cookies import SimpleCookie
+
+import jinja2
+import socketio
+import uvicorn
+
+from src.game import GameState
+from src.async_interface import AsyncEmitter, AsyncGoatanNamespace, AsyncLobbyNamespace
+from src.actor import ActorPool
+from src import settings
+from src import board_generator
+
+# The same game as app.py, served from an event loop instead of a thread per connection, so that idle sockets only
+# cost their buffers.
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+client_manager = socketio.AsyncRedisManager(settings.MESSAGE_QUEUE) if settings.MESSAGE_QUEUE is not None else None
+sio = socketio.AsyncServer(async_mode="asgi", client_manager=client_manager)
+
+game_emitter = AsyncEmitter(sio, "/goatan")
+users, games = settings.managers(game_emitter)
+actors = ActorPool()
+
+sio.register_namespace(AsyncGoatanNamespace(games, actors))
+sio.register_namespace(AsyncLobbyNamespace(games, actors))
+
+# Board layouts are built when the server starts rather than by the first game of each size.
+board_generator.precompute_layouts()
+
+templates = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(os.path.join(ROOT, "templates")),
+    autoescape=jinja2.select_autoescape(),
+)
+
+
+class Response:
+    def __init__(self, body: str = "", status: int = 200, headers: dict = None):
+        self.body = body.encode()
+        self.status = status
+        self.headers = {"Content-Type": "text/html; charset=utf-8", **(headers or {})}
+
+    async def send(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status,
+            "headers": [(name.encode(), value.encode()) for name, value in self.headers.items()],
+        })
+        await send({"type": "http.response.body", "body": self.body})
+
+
+def render_template(name: str, **context) -> Response:
+    return Response(templates.get_template(name).render(**context))
+
+
+def redirect(location: str) -> Response:
+    return Response(status=302, headers={"Location": location})
+
+
+def error_page(message):
+    return render_template("error.html", message=message)
+
+
+# Users that were forgotten after a while are still known to the games they joined.
+def known_user(user_id, game):
+    if user_id is None:
+        return False
+    return users.get(user_id) is not None or game.players.player_for_user(user_id) is not None
+
+
+def owner_redirect(game_id, path):
+    owner_url = games.owner_url(game_id)
+    if owner_url is None:
+        return None
+    return redirect(owner_url + path)
+
+
+def base(cookies, path):
+    return render_template("index.html")
+
+
+def create_game(cookies, path):
+    game = games.create_game()
+    return redirect(f"/game/join/{game.id}")
+
+
+def join_game(cookies, path, game_id):
+    if (response := owner_redirect(game_id, path)) is not None:
+        return response
+
+    game = games.get(game_id)
+    if game is None:
+        return error_page(f"Game not found: {game_id}")
+
+    if game.state == GameState.LOBBY:
+        return redirect(f"/game/lobby/{game.id}")
+    else:
+        return redirect(f"/game/play/{game.id}")
+
+
+def lobby(cookies, path, game_id):
+    if (response := owner_redirect(game_id, path)) is not None:
+        return response
+
+    game = games.get(game_id)
+    if game is None:
+        return error_page(f"Game not found: {game_id}")
+
+    if game.state != GameState.LOBBY:
+        return error_page(f"Invalid game state: {game.state.name}")
+
+    response = render_template("lobby.html", game_id=game_id)
+
+    user_id = cookies.get("user_id")
+    if not known_user(user_id, game):
+        user = users.create_user()
+        response.headers["Set-Cookie"] = f"user_id={user.id}; Path=/"
+
+    return response
+
+
+def play(cookies, path, game_id):
+    if (response := owner_redirect(game_id, path)) is not None:
+        return response
+
+    game = games.get(game_id)
+    if game is None:
+        return error_page(f"Game not found: {game_id}")
+
+    if game.state == GameState.LOBBY:
+        return error_page(f"Invalid game state: {game.state.name}")
+
+    user_id = cookies.get("user_id")
+    if not known_user(user_id, game):
+        return error_page(f"User not found: {user_id}")
+
+    player = game.players.player_for_user(user_id)
+    if player is None:
+        return error_page(f"User did not join the game: {user_id}")
+
+    player_list = game.players.serialize()["players"]
+    for player_dict in player_list:
+        if player_dict["id"] == player.id:
+            player_dict["name"] = player_dict["name"] + " (you)"
+            break
+
+    return render_template("game.html", game_id=game_id, players=player_list)
+
+
+ROUTES = [
+    (re.compile(r"/"), base),
+    (re.compile(r"/game/create"), create_game),
+    (re.compile(r"/game/join/([^/]+)"), join_game),
+    (re.compile(r"/game/lobby/([^/]+)"), lobby),
+    (re.compile(r"/game/play/([^/]+)"), play),
+]
+
+
+async def http_app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+
+    cookie = SimpleCookie()
+    for name, value in scope["headers"]:
+        if name == b"cookie":
+            cookie.load(value.decode())
+    cookies = {name: morsel.value for name, morsel in cookie.items()}
+
+    path = scope["path"]
+    for pattern, route in ROUTES:
+        match = pattern.fullmatch(path)
+        if match is not None:
+            await route(cookies, path, *match.groups()).send(send)
+            return
+
+    await Response("Not Found", status=404).send(send)
+
+
+async def startup():
+    game_emitter.bind(asyncio.get_running_loop())
+
+
+app = socketio.ASGIApp(
+    sio,
+    other_asgi_app=http_app,
+    static_files={"/static": os.path.join(ROOT, "static")},
+    on_startup=startup,
+)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, port=settings.PORT)
@@ -0,0 +1,175 @@
+from array import array
+from typing import Callable, List, Any, Dict, Tuple
+
+from src.board import Board, Tile
+from src.board_generator import StandardGenerator, Layout, layout
+from src.topology import Topology
+from src.engine import GameEngine, RandomAgent
+from src import event
+from src import wire
+from src import analytics
+from src.wire import Protocol
+
+RADII = list(range(1, 11))
+GAME_RADII = [2, 5, 10]
+PLAYER_COUNTS = [2, 4, 6]
+
+
+class Benchmark:
+    def __init__(self, name: str, run: Callable[[Any], Any], setup: Callable[[], Any] = lambda: None, repeat: int = 20):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.repeat = repeat
+
+
+# Games are shared between benchmarks of the same size, and are played with random agents until pieces are on the
+# board. The win condition is raised so that the game phase doesn't end while it's being measured. Benchmarks that
+# change the game run on a fresh clone for each repetition, so the shared games stay as they were set up and every run
+# measures the same state.
+_games: Dict[Tuple[int, int, str], GameEngine] = {}
+
+
+def _game(radius: int, players: int, phase: str) -> GameEngine:
+    key = (radius, players, phase)
+    if key in _games:
+        return _games[key]
+
+    engine = GameEngine([RandomAgent(seed=index) for index in range(players)], radius=radius, seed=0)
+    engine.game.win_condition.required_points = 1000
+    if phase == "game":
+        while engine.game.phase.name() == "placement":
+            engine.step()
+        for _ in range(40 * players):
+            engine.step()
+        _roll(engine)
+
+    _games[key] = engine
+    return engine
+
+
+def _roll(engine: GameEngine):
+    # Get to the start of a turn, then roll so that hints are available.
+    game = engine.game
+    if not game.phase.expecting_roll:
+        game.end_turn(game.phase.active_player)
+    game.roll(game.phase.active_player)
+
+
+def _unrolled_clone(engine: GameEngine):
+    game = engine.game.clone()
+    if not game.phase.expecting_roll:
+        game.end_turn(game.phase.active_player)
+    return game, game.phase.active_player
+
+
+# Clones start with an empty projection, so the next encode starts from scratch.
+def _uncached(engine: GameEngine):
+    game = engine.game.clone()
+    return game, game.phase.active_player
+
+
+def _roll_and_undo(game, player):
+    game.roll(player)
+    game.undo()
+
+
+def _unconstructed_board(radius: int) -> Tuple[Board, array]:
+    topology = layout(radius).topology
+    board = Board()
+    for _ in range(topology.tile_count):
+        board.add_tile(Tile())
+    return board, topology.tile_neighbors
+
+
+def benchmarks() -> List[Benchmark]:
+    cases = []
+
+    for radius in RADII:
+        cases.append(Benchmark(
+            f"layout/radius={radius}",
+            lambda _, radius=radius: Layout(radius),
+            repeat=5 if radius > 5 else 20,
+        ))
+        cases.append(Benchmark(
+            f"generate/radius={radius}",
+            lambda _, radius=radius: StandardGenerator(radius=radius).generate(),
+            repeat=5 if radius > 5 else 20,
+        ))
+        cases.append(Benchmark(
+            f"generate_balanced/radius={radius}",
+            lambda _, radius=radius: StandardGenerator(radius=radius, balanced=True).generate(),
+            repeat=5 if radius > 5 else 20,
+        ))
+        cases.append(Benchmark(
+            f"construct_edge_graph/radius={radius}",
+            lambda args: args[0]._construct_edge_graph(Topology(args[1])),
+            setup=lambda radius=radius: _unconstructed_board(radius),
+            repeat=5 if radius > 5 else 20,
+        ))
+
+    for radius in GAME_RADII:
+        for players in PLAYER_COUNTS:
+            size = f"radius={radius},players={players}"
+
+            cases.append(Benchmark(
+                f"serialize_hints/placement/{size}",
+                lambda engine: engine.game.phase.serialize_hints(),
+                setup=lambda radius=radius, players=players: _game(radius, players, "placement"),
+            ))
+            cases.append(Benchmark(
+                f"serialize_hints/game/{size}",
+                lambda engine: engine.game.phase.serialize_hints(),
+                setup=lambda radius=radius, players=players: _game(radius, players, "game"),
+            ))
+            cases.append(Benchmark(
+                f"legal_actions/game/{size}",
+                lambda engine: engine.game.legal_actions(engine.active_player),
+                setup=lambda radius=radius, players=players: _game(radius, players, "game"),
+            ))
+            cases.append(Benchmark(
+                f"roll/{size}",
+                lambda args: args[0].roll(args[1]),
+                setup=lambda radius=radius, players=players: _unrolled_clone(_game(radius, players, "game")),
+            ))
+            cases.append(Benchmark(
+                f"clone/{size}",
+                lambda engine: engine.game.clone(),
+                setup=lambda radius=radius, players=players: _game(radius, players, "game"),
+            ))
+            cases.append(Benchmark(
+                f"roll_undo/{size}",
+                lambda args: _roll_and_undo(*args),
+                setup=lambda radius=radius, players=players: _unrolled_clone(_game(radius, players, "game")),
+            ))
+            cases.append(Benchmark(
+                f"serialize/{size}",
+                lambda engine: engine.game.serialize(),
+                setup=lambda radius=radius, players=players: _game(radius, players, "game"),
+            ))
+            cases.append(Benchmark(
+                f"encode_game_state/{size}",
+                lambda args: event.GameState(*args).encode(),
+                setup=lambda radius=radius, players=players: _uncached(_game(radius, players, "game")),
+            ))
+            cases.append(Benchmark(
+                f"encode_game_state_per_player/{size}",
+                lambda args: [event.GameState(args[0], player).encode() for player in args[0].players],
+                setup=lambda radius=radius, players=players: _uncached(_game(radius, players, "game")),
+            ))
+            if wire.msgpack is not None:
+                cases.append(Benchmark(
+                    f"encode_game_state_msgpack/{size}",
+                    lambda args: event.GameState(*args).encode(Protocol.MSGPACK),
+                    setup=lambda radius=radius, players=players: _uncached(_game(radius, players, "game")),
+                ))
+            if analytics.available():
+                cases.append(Benchmark(
+                    f"analytics_summary/{size}",
+                    lambda engine: analytics.BoardAnalytics(engine.game.board.topology, engine.game.board.tile_list)
+                    .summary(engine.game.board, list(engine.game.players)),
+                    setup=lambda radius=radius, players=players: _game(radius, players, "game"),
+                    repeat=5,
+                ))
+
+    return cases
@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict
+
+from benchmarks.cases import benchmarks, Benchmark
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def measure(benchmark: Benchmark) -> Dict[str, float]:
+    times = []
+    for _ in range(benchmark.repeat):
+        args = benchmark.setup()
+        start = time.perf_counter()
+        benchmark.run(args)
+        times.append(time.perf_counter() - start)
+
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the goatan rules engine and compare against a baseline.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before flagging, e.g. 0.25")
+    parser.add_argument("--filter", default="", help="only run benchmarks containing this string")
+    settings = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(settings.baseline):
+        with open(settings.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    for benchmark in benchmarks():
+        if settings.filter not in benchmark.name:
+            continue
+
+        result = measure(benchmark)
+        results[benchmark.name] = result
+
+        line = f"{benchmark.name:<50} {result['min'] * 1000:>10.3f}ms {result['median'] * 1000:>10.3f}ms"
+        previous = baseline.get(benchmark.name)
+        if previous is not None:
+            change = result["min"] / previous["min"] - 1
+            line += f" {change:>+8.1%}"
+            if change > settings.threshold:
+                regressions.append(benchmark.name)
+                line += " REGRESSION"
+        print(line, flush=True)
+
+    if settings.save:
+        baseline.update(results)
+        with open(settings.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"saved baseline to {settings.baseline}")
+
+    if len(regressions) > 0:
+        print(f"{len(regressions)} regression(s) over {settings.threshold:.0%}:")
+        for name in regressions:
+            print(f"  {name}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
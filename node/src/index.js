@@ -5,6 +5,7 @@ import {Viewport} from 'pixi-viewport'
 import arrayShuffle from 'array-shuffle'
 import Cookies from 'js-cookie'
 import {io} from "socket.io-client"
+import {encode as encode_msgpack, decode as decode_msgpack} from "@msgpack/msgpack"
 import $ from "jquery";
 
 import {standard_board_definition, standard_tile_set} from './standard_board'
@@ -96,35 +97,10 @@ class Tile {
         this.number_text_sprite = undefined;
     }
 
-    static from_neighbor(viewport, neighbor, side) {
-        let x_pos = neighbor.x_pos;
-        let y_pos = neighbor.y_pos;
-
-        switch (side) {
-            case TileSide.NORTH:
-                y_pos += TILE_HEIGHT;
-                break;
-            case TileSide.NORTH_EAST:
-                y_pos += TILE_HEIGHT / 2;
-                x_pos += TILE_WIDTH - TILE_DIAGONAL_WIDTH;
-                break;
-            case TileSide.SOUTH_EAST:
-                y_pos -= TILE_HEIGHT / 2;
-                x_pos += TILE_WIDTH - TILE_DIAGONAL_WIDTH;
-                break;
-            case TileSide.SOUTH:
-                y_pos -= TILE_HEIGHT;
-                break;
-            case TileSide.SOUTH_WEST:
-                y_pos -= TILE_HEIGHT / 2;
-                x_pos = x_pos - TILE_WIDTH + TILE_DIAGONAL_WIDTH;
-                break;
-            case TileSide.NORTH_WEST:
-                y_pos += TILE_HEIGHT / 2;
-                x_pos = x_pos - TILE_WIDTH + TILE_DIAGONAL_WIDTH;
-                break;
-        }
-
+    // Axial coordinates, see topology.DIRECTIONS on the server.
+    static from_coordinates(viewport, q, r) {
+        let x_pos = q * (TILE_WIDTH - TILE_DIAGONAL_WIDTH);
+        let y_pos = -(r + q / 2) * TILE_HEIGHT;
         return new Tile(viewport, x_pos, y_pos);
     }
 
@@ -343,75 +319,57 @@ function clear_board() {
     intersections = {};
 }
 
-function draw_board(game_state) {
+function draw_board(board, game_state) {
     console.log("draw board");
     console.log(game_state);
 
     let players = game_state["players"]["player_map"];
-    let board = game_state["board"];
+    let pieces = game_state["pieces"];
     let hints = game_state["hints"];
 
     let anchor_id = board["anchor_tile"];
-    let anchor = new Tile(viewport, 0, 0);
-    tiles[anchor_id] = anchor;
-    anchor.draw_resource(board["tiles"][anchor_id]["type"]);
-    let resource_number = board["tiles"][anchor_id]["resource_number"];
-    if (resource_number !== null) {
-        anchor.draw_number_tile(resource_number);
-    }
-
-    let tile_ids = [anchor_id];
-    while (tile_ids.length > 0) {
-        let tile_id = tile_ids.shift();
-        assert(tile_id in tiles);
+    let [anchor_q, anchor_r] = board["tiles"][anchor_id]["coordinates"];
+    for (let [tile_id, tile_def] of Object.entries(board["tiles"])) {
+        let [q, r] = tile_def["coordinates"];
+        let tile = Tile.from_coordinates(viewport, q - anchor_q, r - anchor_r);
+        tiles[tile_id] = tile;
+        tile.draw_resource(tile_def["type"]);
+        let resource_number = tile_def["resource_number"];
+        if (resource_number !== null) {
+            tile.draw_number_tile(resource_number);
+        }
+    }
+
+    for (let [tile_id, tile_def] of Object.entries(board["tiles"])) {
         let tile = tiles[tile_id];
 
-        let tile_def = board["tiles"][tile_id];
         for (let [side_name, edge_id] of Object.entries(tile_def["edges"])) {
-            let side = TileSide[side_name];
-            let edge_def = board["edges"][edge_id];
-
-            if (!(edge_id in edges)) {
-                let edge = Edge.from_tile(viewport, tile, side);
-                edges[edge_id] = edge;
-
-                let road = board["pieces"]["edges"][edge_id];
-                if (road !== undefined) {
-                    let color = players[road["player"]]["color"];
-                    edge.draw_road(color);
-                }
-
-                let road_hint = hints["edges"][edge_id];
-                if (road_hint !== undefined && game_state["active_player"] === player_id) {
-                    let sprite = edge.draw_road("hint");
-                    sprite.eventMode = "static";
-                    sprite.cursor = "pointer";
-                    sprite.on("pointerdown", function () {
-                        console.log("click edge: " + edge_id);
-                        socket.emit("place", {
-                            "piece_type": "road",
-                            "item": edge_id,
-                        });
-                    });
-                }
+            if (edge_id in edges) {
+                continue;
             }
 
-            let neighbor_tile_id = undefined;
-            for (let edge_tile_id of edge_def["tiles"]) {
-                if (edge_tile_id !== tile_id) {
-                    neighbor_tile_id = edge_tile_id;
-                }
+            let side = TileSide[side_name];
+            let edge = Edge.from_tile(viewport, tile, side);
+            edges[edge_id] = edge;
+
+            let road = pieces["edges"][edge_id];
+            if (road !== undefined) {
+                let color = players[road["player"]]["color"];
+                edge.draw_road(color);
             }
 
-            if (neighbor_tile_id !== undefined && !(neighbor_tile_id in tiles)) {
-                let neighbor = Tile.from_neighbor(viewport, tile, side);
-                tiles[neighbor_tile_id] = neighbor;
-                tile_ids.push(neighbor_tile_id);
-                neighbor.draw_resource(board["tiles"][neighbor_tile_id]["type"]);
-                let resource_number = board["tiles"][neighbor_tile_id]["resource_number"];
-                if (resource_number !== null) {
-                    neighbor.draw_number_tile(resource_number);
-                }
+            let road_hint = hints["edges"][edge_id];
+            if (road_hint !== undefined && game_state["active_player"] === player_id) {
+                let sprite = edge.draw_road("hint");
+                sprite.eventMode = "static";
+                sprite.cursor = "pointer";
+                sprite.on("pointerdown", function () {
+                    console.log("click edge: " + edge_id);
+                    socket.emit("place", encode({
+                        "piece_type": "road",
+                        "item": wire_id(edge_id),
+                    }));
+                });
             }
         }
 
@@ -424,7 +382,7 @@ function draw_board(game_state) {
             let intersection = Intersection.from_tile(viewport, tile, side);
             intersections[intersection_id] = intersection;
 
-            let piece = board["pieces"]["intersections"][intersection_id];
+            let piece = pieces["intersections"][intersection_id];
             if (piece !== undefined) {
                 if (piece["type"] === "house") {
                     let color = players[piece["player"]]["color"];
@@ -439,19 +397,37 @@ function draw_board(game_state) {
                 sprite.cursor = "pointer";
                 sprite.on("pointerdown", function () {
                     console.log("click intersection: " + intersection_id);
-                    socket.emit("place", {
+                    socket.emit("place", encode({
                         "piece_type": "house",
-                        "item": intersection_id,
-                    });
+                        "item": wire_id(intersection_id),
+                    }));
                 });
             }
         }
     }
 }
 
+// The player list is rendered in the order of the game's players. It's looked up by position, since player ids depend on
+// the protocol.
+function player_content(id) {
+    let index = game_state["players"]["players"].findIndex(player => same_id(player["id"], id));
+    return $(".player-content").eq(index);
+}
+
 function set_active_player(player_id) {
     $(".player-content").removeClass("active");
-    $("#player-content-" + player_id).addClass("active");
+    player_content(player_id).addClass("active");
+}
+
+function update_points(game_state) {
+    let longest_road = game_state["longest_road"];
+    for (let [id, points] of Object.entries(game_state["points"])) {
+        let text = points["total"] + " VP";
+        if (longest_road && longest_road["holder"] !== null && same_id(longest_road["holder"], id)) {
+            text += ", longest road";
+        }
+        player_content(id).find("small").text(text);
+    }
 }
 
 function update_dice(game_state) {
@@ -585,24 +561,152 @@ console.log(user_id);
 
 let player_id = undefined;
 
+// The last applied game state. Deltas are applied on top of it in version order.
+let game_state = undefined;
+
+// Large boards can be played over MessagePack instead of JSON with ?protocol=msgpack. The server says which protocol it
+// picked when the socket connects.
+let requested_protocol = new URLSearchParams(window.location.search).get("protocol");
+let protocol = "json";
+
 let socket = io("/goatan", {
-    auth: {
-        game: game_id,
-        user: user_id
+    auth: function (callback) {
+        callback({
+            game: game_id,
+            user: user_id,
+            version: game_state === undefined ? null : game_state["version"],
+            protocol: requested_protocol,
+        });
     }
 });
 socket.on("connect", function (event) {
     console.log("socket connect");
 });
-socket.on("player_info", function (event) {
+socket.on("connect_error", function (error) {
+    // Sharded servers refuse games that another worker owns, and say which one does.
+    if (error.data !== undefined && error.data["owner"] !== undefined) {
+        window.location.replace(error.data["owner"] + window.location.pathname);
+    }
+});
+// Game events arrive encoded, since the server encodes them once for everyone it sends them to.
+function decode(payload) {
+    if (protocol === "msgpack") {
+        return decode_msgpack(payload);
+    }
+    return JSON.parse(new TextDecoder().decode(payload));
+}
+
+function encode(event) {
+    if (protocol === "msgpack") {
+        return encode_msgpack(event);
+    }
+    return event;
+}
+
+// Ids are integers, but object keys are always strings. Ids taken from keys are converted back before they're sent, and
+// ids are compared as strings.
+function wire_id(id) {
+    return Number(id);
+}
+
+function same_id(a, b) {
+    return String(a) === String(b);
+}
+
+socket.on("protocol", function (payload) {
+    protocol = JSON.parse(new TextDecoder().decode(payload))["protocol"];
+});
+
+socket.on("action_error", function (payload) {
+    console.warn(decode(payload)["error"]);
+});
+
+socket.on("player_info", function (payload) {
+    let event = decode(payload);
     console.log("player info");
     console.log(event);
     player_id = event["id"];
 });
-socket.on("game_state", function (event) {
+// The board topology is sent once on connect, and game states only contain what can change.
+let board_topology = undefined;
+let pending_game_state = undefined;
+
+socket.on("board_topology", function (event) {
+    board_topology = decode(event);
+    if (pending_game_state !== undefined) {
+        update_game_state(pending_game_state);
+        pending_game_state = undefined;
+    }
+});
+socket.on("game_state", function (payload) {
+    let event = decode(payload);
+    game_state = event;
+    if (board_topology === undefined) {
+        pending_game_state = event;
+        return;
+    }
+    update_game_state(event);
+});
+// A player's own hints and bank trades are sent separately, just before the delta of the same version.
+let pending_private_state = undefined;
+
+socket.on("private_state", function (payload) {
+    let event = decode(payload);
+    if (game_state !== undefined && event["version"] === game_state["version"]) {
+        apply_delta(game_state, event);
+        if (board_topology !== undefined) {
+            update_game_state(game_state);
+        }
+        return;
+    }
+    pending_private_state = event;
+});
+socket.on("game_delta", function (payload) {
+    let event = decode(payload);
+    if (game_state === undefined || event["version"] !== game_state["version"] + 1) {
+        // A delta was missed, so the whole state needs to be resent.
+        socket.emit("sync");
+        return;
+    }
+
+    apply_delta(game_state, event);
+    if (pending_private_state !== undefined && pending_private_state["version"] === event["version"]) {
+        apply_delta(game_state, pending_private_state);
+    }
+    pending_private_state = undefined;
+    if (board_topology !== undefined) {
+        update_game_state(game_state);
+    }
+});
+
+function apply_delta(state, delta) {
+    for (let [key, value] of Object.entries(delta)) {
+        switch (key) {
+            case "pieces":
+                Object.assign(state["pieces"]["intersections"], value["intersections"]);
+                Object.assign(state["pieces"]["edges"], value["edges"]);
+                break;
+            case "players":
+                for (let [id, player_delta] of Object.entries(value)) {
+                    Object.assign(state["players"]["player_map"][id], player_delta);
+                    for (let player of state["players"]["players"]) {
+                        if (same_id(player["id"], id)) {
+                            Object.assign(player, player_delta);
+                        }
+                    }
+                }
+                break;
+            default:
+                state[key] = value;
+        }
+    }
+}
+
+function update_game_state(event) {
     clear_board();
-    draw_board(event);
+    draw_board(board_topology, event);
     set_active_player(event["active_player"]);
+    update_points(event);
     resources = event["players"]["player_map"][player_id]["resources"];
     update_resource_counts();
     update_dice(event);
@@ -616,11 +720,11 @@ socket.on("game_state", function (event) {
     update_bank_trades(event);
 
     if (event["victor"] !== null) {
-        $("#player-content-" + event["victor"]["id"] + " strong").text(
+        player_content(event["victor"]["id"]).find("strong").text(
             event["victor"]["name"] + " (winner)"
         )
     }
-});
+}
 
 $(document).ready(function () {
     $("#end-turn-button").click(function () {
@@ -637,6 +741,6 @@ $(document).ready(function () {
         reset_trade(true);
     });
     $("#bank-trade-button").click(function() {
-        socket.emit("bank_trade", proposed_trade);
+        socket.emit("bank_trade", encode(proposed_trade));
     });
 });
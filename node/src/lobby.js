@@ -17,6 +17,12 @@ let socket = io("/lobby", {
 socket.on("connect", function(event) {
     console.log("lobby socket connect");
 });
+socket.on("connect_error", function(error) {
+    // Sharded servers refuse games that another worker owns, and say which one does.
+    if (error.data !== undefined && error.data["owner"] !== undefined) {
+        window.location.replace(error.data["owner"] + window.location.pathname);
+    }
+});
 socket.on("player_update", function(event) {
     console.log("player_update");
     console.log(event);
@@ -37,6 +43,9 @@ socket.on("player_id", function(event) {
 
     player_id = event["player_id"];
 });
+socket.on("action_error", function(event) {
+    alert(event["error"]);
+});
 socket.on("game_start", function(event) {
     window.location.replace(event["route"]);
 });
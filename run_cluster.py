@@ -0,0 +1,46 @@
+import argparse
+import os
+import secrets
+import subprocess
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a sharded goatan deployment with one worker per port.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--host", default="localhost", help="the host clients reach the workers on")
+    parser.add_argument("--port", type=int, default=8000, help="the port of the first worker")
+    parser.add_argument("--message-queue", default=None, help="e.g. redis://localhost:6379")
+    settings = parser.parse_args()
+
+    urls = [f"http://{settings.host}:{settings.port + index}" for index in range(settings.workers)]
+    environment = {
+        **os.environ,
+        "GOATAN_SHARD_URLS": ",".join(urls),
+        "GOATAN_SECRET": os.environ.get("GOATAN_SECRET", secrets.token_hex(32)),
+    }
+    if settings.message_queue is not None:
+        environment["GOATAN_MESSAGE_QUEUE"] = settings.message_queue
+
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    workers = [
+        subprocess.Popen(
+            [sys.executable, app],
+            env={**environment, "GOATAN_SHARD": str(index), "GOATAN_PORT": str(settings.port + index)},
+        ) for index in range(settings.workers)
+    ]
+    for url in urls:
+        print(f"worker on {url}")
+
+    try:
+        for worker in workers:
+            worker.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+from src.engine import GameEngine
+from src.bot import AGENTS
+
+
+def play(args):
+    seed, settings = args
+    agents = [AGENTS[settings.agent](seed=seed * len(AGENTS) + index) for index in range(settings.players)]
+    engine = GameEngine(
+        agents, radius=settings.radius, seed=seed, max_actions=settings.max_actions, balanced=settings.balanced
+    )
+    engine.run()
+    return engine.serialize()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play complete goatan games without a server.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cores")
+    parser.add_argument("--players", type=int, default=3)
+    parser.add_argument("--radius", type=int, default=2)
+    parser.add_argument("--balanced", action="store_true", help="play on balanced boards")
+    parser.add_argument("--agent", choices=list(AGENTS), default="random")
+    parser.add_argument("--max-actions", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    settings = parser.parse_args()
+
+    jobs = [(settings.seed + game, settings) for game in range(settings.games)]
+
+    start = time.perf_counter()
+    with Pool(settings.workers) as pool:
+        results = list(pool.imap_unordered(play, jobs, chunksize=max(1, settings.games // 64)))
+    elapsed = time.perf_counter() - start
+
+    victors = Counter(result["victor"] for result in results)
+    actions = sum(result["actions"] for result in results)
+
+    print(f"games: {len(results)} in {elapsed:.2f}s ({len(results) / elapsed:.1f} games/sec)")
+    print(f"actions: {actions} ({actions / elapsed:.0f} actions/sec, {actions / len(results):.0f} per game)")
+    for victor, count in sorted(victors.items(), key=lambda item: str(item[0])):
+        print(f"  {victor if victor is not None else 'unfinished'}: {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+from enum import Enum
+from typing import Optional
+
+from src.piece import PieceType
+from src.player import Player
+from src.resource import Transaction
+from src import error
+
+
+class ActionType(Enum):
+    PLACE = "place"
+    ROLL = "roll"
+    END_TURN = "end_turn"
+    BANK_TRADE = "bank_trade"
+
+
+class Action:
+    def __init__(
+            self,
+            type_: ActionType,
+            piece_type: Optional[PieceType] = None,
+            location_id: Optional[int] = None,
+            transaction: Optional[Transaction] = None,
+    ):
+        self.type = type_
+        self.piece_type = piece_type
+        self.location_id = location_id
+        self.transaction = transaction
+
+    # Actions are applied through the same Goatan methods as the socket handlers.
+    def apply(self, game: "Goatan", player: Player):
+        if self.type == ActionType.PLACE:
+            game.place(player, self.piece_type, self.location_id)
+        elif self.type == ActionType.ROLL:
+            game.roll(player)
+        elif self.type == ActionType.END_TURN:
+            game.end_turn(player)
+        elif self.type == ActionType.BANK_TRADE:
+            game.bank_trade(player, self.transaction)
+        else:
+            raise error.InvalidAction(f"Invalid action type {self.type}")
+
+    def _key(self):
+        return self.type, self.piece_type, self.location_id, self.transaction
+
+    def __eq__(self, other):
+        return isinstance(other, Action) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __str__(self):
+        if self.type == ActionType.PLACE:
+            return f"{self.type.value} {self.piece_type.value} on {self.location_id}"
+        if self.type == ActionType.BANK_TRADE:
+            return f"{self.type.value} {self.transaction.serialize()}"
+        return self.type.value
+
+    def __repr__(self):
+        return str(self)
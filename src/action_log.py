@@ -0,0 +1,26 @@
+import json
+from typing import List, Optional, TextIO
+
+
+# The actions that changed a game, in order. Together with the game's seed they're enough to rebuild it, see
+# src.replay. Board items are referenced by their topology index and players by their user id, since the other ids are
+# generated again whenever a game is rebuilt.
+class ActionLog:
+    def __init__(self, entries: List[dict] = None, sink: Optional[TextIO] = None):
+        self.entries: List[dict] = entries if entries is not None else []
+        self._sink = sink
+
+    def append(self, entry: dict):
+        self.entries.append(entry)
+        if self._sink is not None:
+            # One line per entry, so a crash can only ever cut off the last one.
+            self._sink.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._sink.flush()
+
+    def close(self):
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+    def __len__(self):
+        return len(self.entries)
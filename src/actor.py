@@ -0,0 +1,107 @@
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, Hashable, Optional, Tuple
+
+from src import error
+
+logger = logging.getLogger(__name__)
+
+Command = Callable[[], object]
+
+
+class _Mailbox:
+    __slots__ = ("commands", "keys", "scheduled")
+
+    def __init__(self):
+        self.commands: Deque[Tuple[Command, Future, Optional[Hashable]]] = deque()
+        self.keys: Dict[Hashable, Future] = {}
+        self.scheduled = False
+
+
+# Runs the commands for each game strictly in the order they were submitted, while different games run at the same
+# time on a pool of worker threads. A game is only ever handled by one worker at a time, so commands never race with
+# each other inside the rules engine.
+class ActorPool:
+    def __init__(self, workers: Optional[int] = None, max_pending: int = 64, batch: int = 16):
+        # Games with more pending commands than this refuse new ones until they've caught up.
+        self.max_pending = max_pending
+        # A busy game goes back to the end of the line after this many commands, so it can't starve the others.
+        self.batch = batch
+
+        self._mailboxes: Dict[str, _Mailbox] = {}
+        self._lock = threading.Lock()
+        self._ready: queue.Queue = queue.Queue()
+
+        self._workers = [
+            threading.Thread(target=self._run, daemon=True) for _ in range(workers if workers else os.cpu_count())
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    # Commands submitted with a key are coalesced with a pending command of the same key, e.g. repeated requests for
+    # the game state, and share its result. Required commands, e.g. the state a connecting client is waiting for, are
+    # queued however many commands are pending. They should be keyed, so that they can't pile up either.
+    def submit(self, game_id: str, command: Command, key: Optional[Hashable] = None, required: bool = False) -> Future:
+        with self._lock:
+            mailbox = self._mailboxes.get(game_id)
+            if mailbox is None:
+                mailbox = _Mailbox()
+                self._mailboxes[game_id] = mailbox
+
+            if key is not None and key in mailbox.keys:
+                return mailbox.keys[key]
+
+            if len(mailbox.commands) >= self.max_pending and not required:
+                raise error.InvalidAction(f"Too many pending commands for {game_id}")
+
+            future = Future()
+            mailbox.commands.append((command, future, key))
+            if key is not None:
+                mailbox.keys[key] = future
+
+            if not mailbox.scheduled:
+                mailbox.scheduled = True
+                self._ready.put(game_id)
+
+        return future
+
+    def call(self, game_id: str, command: Command, key: Optional[Hashable] = None):
+        return self.submit(game_id, command, key).result()
+
+    def _next(self, game_id: str) -> Optional[Tuple[Command, Future]]:
+        with self._lock:
+            mailbox = self._mailboxes[game_id]
+            if len(mailbox.commands) == 0:
+                # Idle games don't keep a mailbox around.
+                self._mailboxes.pop(game_id)
+                return None
+
+            command, future, key = mailbox.commands.popleft()
+            if key is not None:
+                mailbox.keys.pop(key)
+            return command, future
+
+    def _run(self):
+        while True:
+            game_id = self._ready.get()
+
+            for _ in range(self.batch):
+                item = self._next(game_id)
+                if item is None:
+                    break
+
+                command, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(command())
+                except Exception as e:
+                    logger.exception(f"command for {game_id} failed")
+                    future.set_exception(e)
+            else:
+                # The game still has commands waiting, so it stays scheduled for another round.
+                self._ready.put(game_id)
@@ -0,0 +1,143 @@
+from typing import Dict, List, Optional
+
+from src.board import Board, Tile
+from src.piece import PieceType, House, Road
+from src.player import Player
+from src.resource import Resource, Transaction
+from src.topology import Topology, NONE, INTERSECTION_TILES
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+RESOURCES = list(Resource)
+COSTS = {
+    PieceType.HOUSE.value: House.cost(),
+    PieceType.ROAD.value: Road.cost(),
+}
+
+# The sums of two dice, from 2 to 12, are indexed from 0.
+ROLL_COUNT = 11
+
+
+def available() -> bool:
+    return numpy is not None
+
+
+# Statistics of a board's production, computed with numpy for every intersection at once. Expectations and variances
+# per roll are exact. Anything that depends on a sequence of rolls, like how long it takes to afford a piece, is
+# estimated from a batch of simulated games.
+#
+# Analytics only depend on the topology and the tiles, so they can be computed for boards that are still being
+# generated, e.g. by Balancer. They don't change during a game, except for who owns which intersection.
+class BoardAnalytics:
+    def __init__(self, topology: Topology, tiles: List[Tile], seed: Optional[int] = None):
+        assert numpy is not None, "BoardAnalytics needs numpy"
+        self._topology = topology
+        self._random = numpy.random.default_rng(seed)
+
+        outcomes = numpy.add.outer(numpy.arange(1, 7), numpy.arange(1, 7)).ravel()
+        self.probabilities = numpy.bincount(outcomes - 2, minlength=ROLL_COUNT) / len(outcomes)
+
+        # What each tile produces by roll and resource. The extra last tile is the one empty slots point at.
+        tile_income = numpy.zeros((topology.tile_count + 1, ROLL_COUNT, len(RESOURCES)))
+        for index, tile in enumerate(tiles):
+            resource = tile.resource_type
+            if resource is not None and tile.resource_number is not None:
+                tile_income[index, tile.resource_number.value - 2, RESOURCES.index(resource)] = 1
+
+        intersection_tiles = numpy.array(topology.intersection_tiles, dtype=numpy.int64)
+        intersection_tiles = intersection_tiles.reshape(-1, INTERSECTION_TILES)
+        intersection_tiles[intersection_tiles == NONE] = topology.tile_count
+
+        # Intersection, roll, resource: what a house on the intersection collects when the roll comes up.
+        self.income = tile_income[intersection_tiles].sum(axis=1)
+
+    # Intersection, resource: the resources a house collects per roll on average.
+    def expected_income(self) -> "numpy.ndarray":
+        return numpy.einsum("k,ikr->ir", self.probabilities, self.income)
+
+    # The variance per roll of all the resources a house on each intersection collects.
+    def income_variance(self) -> "numpy.ndarray":
+        totals = self.income.sum(axis=2)
+        expected = totals @ self.probabilities
+        return (totals ** 2) @ self.probabilities - expected ** 2
+
+    # How much each intersection collects by player, weighted by how much each of the player's settlements gathers.
+    def ownership(self, board: Board, players: List[Player]) -> "numpy.ndarray":
+        weights = numpy.zeros((len(players), self._topology.intersection_count))
+        rows = {player: row for row, player in enumerate(players)}
+        for intersection in board.settled_intersections:
+            settlement = intersection.settlement
+            row = rows.get(settlement.player)
+            if row is not None:
+                weights[row, intersection.index] += settlement.gather_amount
+        return weights
+
+    # Player, resource: what each player collects per roll on average with the settlements they have.
+    def player_income(self, weights: "numpy.ndarray") -> "numpy.ndarray":
+        return weights @ self.expected_income()
+
+    # Game, roll, player, resource: what each player collects in a batch of simulated games.
+    def simulate(self, weights: "numpy.ndarray", rolls: int, games: int) -> "numpy.ndarray":
+        dice = self._random.integers(1, 7, size=(2, games, rolls))
+        outcomes = dice[0] + dice[1] - 2
+
+        # Player, roll, resource. Nothing collects more than a few resources per roll, so small integers will do.
+        per_roll = numpy.einsum("pi,ikr->pkr", weights, self.income).astype(numpy.int16)
+        return per_roll[:, outcomes].transpose(1, 2, 0, 3)
+
+    # Player, game: the number of rolls until each player has collected a piece's cost, or inf if they haven't after
+    # the given number of rolls. Resources players already have and trades aren't taken into account.
+    def time_to_build(self, weights: "numpy.ndarray", cost: Transaction, rolls: int = 100,
+                      games: int = 2000) -> "numpy.ndarray":
+        collected = self.simulate(weights, rolls, games).cumsum(axis=1, dtype=numpy.int16)
+        return self._first_affordable(collected, cost)
+
+    @staticmethod
+    def _first_affordable(collected: "numpy.ndarray", cost: Transaction) -> "numpy.ndarray":
+        needed = numpy.array([-cost.resources[resource] for resource in RESOURCES], dtype=numpy.int16)
+
+        # Game, roll, player.
+        affordable = (collected >= needed).all(axis=3)
+        first = affordable.argmax(axis=1) + 1.0
+        return numpy.where(affordable.any(axis=1), first, numpy.inf).T
+
+    # Each player's expected income per roll and the distribution of rolls until they can afford each piece.
+    def summary(self, board: Board, players: List[Player], costs: Optional[Dict[str, Transaction]] = None,
+                rolls: int = 100, games: int = 2000) -> Dict[Player, dict]:
+        costs = costs if costs is not None else COSTS
+        weights = self.ownership(board, players)
+        income = self.player_income(weights)
+
+        summary = {
+            player: {
+                "income": {resource.value: float(income[row, index]) for index, resource in enumerate(RESOURCES)},
+                "time_to_build": {},
+            } for row, player in enumerate(players)
+        }
+        # Every piece is measured against the same simulated games.
+        collected = self.simulate(weights, rolls, games).cumsum(axis=1, dtype=numpy.int16)
+        for name, cost in costs.items():
+            times = self._first_affordable(collected, cost)
+            for row, player in enumerate(players):
+                finite = times[row][numpy.isfinite(times[row])]
+                summary[player]["time_to_build"][name] = {
+                    "affordable": len(finite) / games,
+                    "median": float(numpy.median(finite)) if len(finite) > 0 else None,
+                    "p90": float(numpy.percentile(finite, 90)) if len(finite) > 0 else None,
+                }
+        return summary
+
+    # The precomputed overlay sent to clients that ask for it, by intersection index.
+    def serialize(self) -> dict:
+        expected = self.expected_income()
+        return {
+            "expected": numpy.round(expected.sum(axis=1), 4).tolist(),
+            "variance": numpy.round(self.income_variance(), 4).tolist(),
+            "resources": {
+                resource.value: numpy.round(expected[:, index], 4).tolist()
+                for index, resource in enumerate(RESOURCES)
+            },
+        }
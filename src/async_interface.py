@@ -0,0 +1,95 @@
+import asyncio
+from abc import ABCMeta, abstractmethod
+from typing import Optional
+
+import socketio
+
+from src.game import GameManager
+from src.actor import ActorPool
+from src.interface import SocketRegistry, LobbyRegistry
+
+
+# The rules engine runs on the actors' worker threads, which hand the events they emit over to the event loop.
+class AsyncEmitter:
+    def __init__(self, server: socketio.AsyncServer, namespace: str):
+        self._server = server
+        self._namespace = namespace
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def __call__(self, name: str, payload, to=None):
+        asyncio.run_coroutine_threadsafe(
+            self._server.emit(name, payload, to=to, namespace=self._namespace),
+            self._loop,
+        )
+
+
+class AsyncAuthenticatedNamespace(SocketRegistry, socketio.AsyncNamespace, metaclass=ABCMeta):
+    def __init__(self, games: GameManager, actors: ActorPool):
+        SocketRegistry.__init__(self, games, actors)
+        socketio.AsyncNamespace.__init__(self, self.namespace_str)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    @abstractmethod
+    def namespace_str(self) -> str:
+        pass
+
+    # Commands on the actors' worker threads hand what they emit over to the loop the handlers run on.
+    async def trigger_event(self, event_name, *args):
+        self._loop = asyncio.get_running_loop()
+        return await super().trigger_event(event_name, *args)
+
+    def _emit(self, name: str, payload, to: str):
+        asyncio.run_coroutine_threadsafe(self.emit(name, payload, to=to), self._loop)
+
+
+class AsyncGoatanNamespace(AsyncAuthenticatedNamespace):
+    @property
+    def namespace_str(self) -> str:
+        return "/goatan"
+
+    # Games can have to be restored from a snapshot or their log before the socket is registered, so that's done off
+    # the event loop.
+    async def on_connect(self, sid, environ, token):
+        auth = await asyncio.get_running_loop().run_in_executor(None, self.register_socket, sid, token)
+        for room in self.game_rooms(auth):
+            await self.enter_room(sid, room)
+        self.send_state(sid, token)
+
+    async def on_disconnect(self, sid, reason=None):
+        self.leave_game(sid)
+
+    async def on_sync(self, sid):
+        self.sync(sid)
+
+    async def on_end_turn(self, sid):
+        self.end_turn(sid)
+
+    async def on_place(self, sid, data):
+        self.place(sid, data)
+
+    async def on_roll(self, sid):
+        self.roll(sid)
+
+    async def on_bank_trade(self, sid, data):
+        self.bank_trade(sid, data)
+
+
+class AsyncLobbyNamespace(LobbyRegistry, AsyncAuthenticatedNamespace):
+    @property
+    def namespace_str(self) -> str:
+        return "/lobby"
+
+    async def on_connect(self, sid, environ, token):
+        auth = await asyncio.get_running_loop().run_in_executor(None, self.register_lobby_socket, sid, token)
+        await self.enter_room(sid, auth.game.id)
+        self.join_lobby(sid, auth, token["user"])
+
+    async def on_disconnect(self, sid, reason=None):
+        self.leave_lobby(sid)
+
+    async def on_game_init(self, sid, settings):
+        self.init_game(sid, settings)
@@ -0,0 +1,205 @@
+import random
+from typing import List, Optional
+
+from src.board import Tile, ResourceNumber, TILE_RESOURCES
+from src.topology import Topology, SIDES
+
+# How many of the 36 rolls of two dice produce a number, the dots printed under it.
+PIPS = {number: 6 - abs(7 - number.value) for number in ResourceNumber}
+HOT_PIPS = PIPS[ResourceNumber.SIX]
+
+# Hot numbers next to each other outweigh anything fairness can make up for.
+HOT_WEIGHT = 1000
+RESOURCE_WEIGHT = 4
+
+# Local search steps per tile, and how many tiles each conflicting tile considers swapping with. Boards are usually
+# settled well before the budget runs out.
+STEPS_PER_TILE = 30
+SWAP_CANDIDATES = 8
+
+# How many times the search starts over from shuffled tiles when it ends with tiles of the same type or 6s and 8s next
+# to each other.
+RESTARTS = 8
+
+
+# Rearranges the tiles of a generated board so that no two tiles of the same type or two 6s and 8s are next to each
+# other, and so that the production of its intersections and resources is spread evenly. The tiles themselves are the
+# ones the provider drew, only their positions change, so boards keep the provider's tile and number frequencies.
+class Balancer:
+    def __init__(self, topology: Topology, rng: Optional[random.Random] = None):
+        self.random = rng if rng is not None else random.Random()
+
+        self._neighbors = [list(topology.neighbors_of_tile(tile)) for tile in range(topology.tile_count)]
+        self._tile_intersections = [
+            list(topology.tile_intersections[tile * SIDES:(tile + 1) * SIDES]) for tile in range(topology.tile_count)
+        ]
+        self._intersection_tiles = [
+            list(topology.tiles_of_intersection(intersection)) for intersection in range(topology.intersection_count)
+        ]
+
+    # Returns whether the board meets the hard constraints, no neighbors of the same type and no neighboring 6s and 8s.
+    # The tiles can make that impossible, e.g. four 6s and 8s among seven tiles, in which case the last arrangement
+    # tried is kept and it's up to the caller to draw other tiles.
+    def balance(self, tiles: List[Tile]) -> bool:
+        types = [tile.type for tile in tiles]
+        numbers = [tile.resource_number for tile in tiles if tile.resource_number is not None]
+
+        for attempt in range(RESTARTS):
+            if attempt > 0:
+                self.random.shuffle(types)
+                self.random.shuffle(numbers)
+
+            self._arrange_types(types)
+
+            positions = [index for index, type_ in enumerate(types) if type_ in TILE_RESOURCES]
+            assert len(positions) == len(numbers)
+            pips = [0] * len(tiles)
+            placed: List[Optional[ResourceNumber]] = [None] * len(tiles)
+            for position, number in zip(positions, numbers):
+                placed[position] = number
+                pips[position] = PIPS[number]
+
+            self._arrange_numbers(types, positions, placed, pips)
+
+            balanced = self._hot_neighbors(pips) == 0 and all(
+                self._conflicts(types, tile) == 0 for tile in range(len(types))
+            )
+            if balanced:
+                break
+
+        for tile, type_, number in zip(tiles, types, placed):
+            tile.type = type_
+            tile.resource_number = number
+        return balanced
+
+    # Lower is better, and comparable between boards of the same size. Hot neighbors dominate the score, followed by
+    # the squared deviations of the pips around each intersection from their mean, and of each resource's pips from
+    # what its tiles would have at the board's average.
+    def score(self, tiles: List[Tile]) -> float:
+        pips = [PIPS[tile.resource_number] if tile.resource_number is not None else 0 for tile in tiles]
+
+        hot = self._hot_neighbors(pips)
+
+        sums = [sum(pips[tile] for tile in tiles_) for tiles_ in self._intersection_tiles]
+        mean = sum(sums) / len(sums)
+        spread = sum((value - mean) ** 2 for value in sums)
+
+        totals = {}
+        counts = {}
+        for tile, value in zip(tiles, pips):
+            resource = tile.resource_type
+            if resource is not None:
+                totals[resource] = totals.get(resource, 0) + value
+                counts[resource] = counts.get(resource, 0) + 1
+        if len(counts) > 0:
+            average = sum(totals.values()) / sum(counts.values())
+            spread += RESOURCE_WEIGHT * sum(
+                (totals[resource] - counts[resource] * average) ** 2 / counts[resource] for resource in counts
+            )
+
+        return HOT_WEIGHT * hot + spread
+
+    def _hot_neighbors(self, pips) -> int:
+        return sum(
+            1 for tile, neighbors in enumerate(self._neighbors) if pips[tile] == HOT_PIPS
+            for neighbor in neighbors if neighbor > tile and pips[neighbor] == HOT_PIPS
+        )
+
+    def _conflicts(self, types, tile: int) -> int:
+        type_ = types[tile]
+        return sum(1 for neighbor in self._neighbors[tile] if types[neighbor] == type_)
+
+    # Min-conflicts search over swaps of two tiles, which keeps the tile counts. Each pass tries to move every tile that
+    # still has a neighbor of its own type, to whichever of a few random tiles it conflicts with the least.
+    def _arrange_types(self, types):
+        count = len(types)
+        for _ in range(STEPS_PER_TILE):
+            conflicted = [tile for tile in range(count) if self._conflicts(types, tile) > 0]
+            if len(conflicted) == 0:
+                break
+
+            for a in conflicted:
+                best, best_change = None, 1
+                for _ in range(SWAP_CANDIDATES):
+                    b = self.random.randrange(count)
+                    if types[a] == types[b]:
+                        continue
+
+                    before = self._conflicts(types, a) + self._conflicts(types, b)
+                    types[a], types[b] = types[b], types[a]
+                    change = self._conflicts(types, a) + self._conflicts(types, b) - before
+                    types[a], types[b] = types[b], types[a]
+                    if change < best_change:
+                        best, best_change = b, change
+
+                if best is not None:
+                    types[a], types[best] = types[best], types[a]
+
+    # Local search over swaps of two numbers, accepting any swap that doesn't make the board worse. The pips around
+    # each intersection are kept up to date, so a swap is scored by the at most twelve intersections it touches. Since
+    # the pips of the whole board don't change, minimizing the sum of their squares minimizes their variance.
+    def _arrange_numbers(self, types, positions, placed, pips):
+        if len(positions) < 2:
+            return
+
+        resources = list(TILE_RESOURCES.values())
+        resource_of = [resources.index(TILE_RESOURCES[type_]) if type_ in TILE_RESOURCES else -1 for type_ in types]
+
+        # Each resource's pips, and what they'd be if its tiles had the board's average.
+        totals = [0] * len(resources)
+        counts = [0] * len(resources)
+        for position in positions:
+            totals[resource_of[position]] += pips[position]
+            counts[resource_of[position]] += 1
+        average = sum(pips) / len(positions)
+        targets = [count * average for count in counts]
+
+        sums = [sum(pips[tile] for tile in tiles_) for tiles_ in self._intersection_tiles]
+        neighbors = self._neighbors
+        tile_intersections = self._tile_intersections
+
+        for _ in range(STEPS_PER_TILE * len(positions)):
+            a = positions[self.random.randrange(len(positions))]
+            b = positions[self.random.randrange(len(positions))]
+            pips_a = pips[a]
+            pips_b = pips[b]
+            if pips_a == pips_b:
+                continue
+
+            change = 0.0
+            if pips_a == HOT_PIPS or pips_b == HOT_PIPS:
+                hot_neighbors_a = sum(1 for neighbor in neighbors[a] if neighbor != b and pips[neighbor] == HOT_PIPS)
+                hot_neighbors_b = sum(1 for neighbor in neighbors[b] if neighbor != a and pips[neighbor] == HOT_PIPS)
+                hot_before = (pips_a == HOT_PIPS) * hot_neighbors_a + (pips_b == HOT_PIPS) * hot_neighbors_b
+                hot_after = (pips_b == HOT_PIPS) * hot_neighbors_a + (pips_a == HOT_PIPS) * hot_neighbors_b
+                change += HOT_WEIGHT * (hot_after - hot_before)
+
+            # Intersections of both tiles keep their pips.
+            difference = pips_b - pips_a
+            intersections_a = tile_intersections[a]
+            intersections_b = tile_intersections[b]
+            for intersection in intersections_a:
+                if intersection not in intersections_b:
+                    change += difference * (2 * sums[intersection] + difference)
+            for intersection in intersections_b:
+                if intersection not in intersections_a:
+                    change += difference * (difference - 2 * sums[intersection])
+
+            resource_a = resource_of[a]
+            resource_b = resource_of[b]
+            if resource_a != resource_b:
+                for resource, shift in ((resource_a, difference), (resource_b, -difference)):
+                    offset = totals[resource] - targets[resource]
+                    change += RESOURCE_WEIGHT * shift * (2 * offset + shift) / counts[resource]
+
+            if change > 0:
+                continue
+
+            for intersection in intersections_a:
+                sums[intersection] += difference
+            for intersection in intersections_b:
+                sums[intersection] -= difference
+            totals[resource_a] += difference
+            totals[resource_b] -= difference
+            placed[a], placed[b] = placed[b], placed[a]
+            pips[a], pips[b] = pips_b, pips_a
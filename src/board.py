@@ -1,10 +1,14 @@
+from abc import ABC, abstractmethod
+from array import array
 from enum import Enum
-from typing import Dict, Optional, Set, List
+from typing import Dict, Optional, Set, List, Sequence
 
 from src.util import GameItem
 from src.player import Player
 from src.piece import Settlement, Road, Piece
 from src.resource import Resource
+from src.topology import Topology, SIDES
+from src.journal import Journal
 
 
 class TileType(Enum):
@@ -17,6 +21,15 @@ class TileType(Enum):
     UNKNOWN = "unknown"
 
 
+TILE_RESOURCES = {
+    TileType.BRICK: Resource.BRICK,
+    TileType.STONE: Resource.STONE,
+    TileType.WHEAT: Resource.WHEAT,
+    TileType.SHEEP: Resource.SHEEP,
+    TileType.WOOD: Resource.WOOD,
+}
+
+
 class ResourceNumber(Enum):
     TWO = 2
     THREE = 3
@@ -54,37 +67,44 @@ class TileSide(Enum):
         return TileSide(side % len(TileSide))
 
 
-class Tile(GameItem):
-    def __init__(self):
-        self.type = TileType.UNKNOWN
-        self.resource_number: Optional[ResourceNumber] = None
+# Board items are identified by their topology index.
+class BoardItem(GameItem):
+    __slots__ = ("index", "_board")
 
-        self.neighbors: Dict[TileSide, Tile] = {}
-        self.edges: Dict[TileSide, Edge] = {}
-        self.intersections: Dict[TileSide, Intersection] = {}
+    @property
+    def id(self) -> Optional[int]:
+        return self.index
 
-        super().__init__()
 
-    def associate_neighbor(self, neighbor, side):
-        if self.neighbors.get(side) == neighbor:
-            return
+class Tile(BoardItem):
+    __slots__ = ("type", "resource_number")
 
-        assert self.neighbors.get(side) is None
-        self.neighbors[side] = neighbor
+    def __init__(self):
+        self.type = TileType.UNKNOWN
+        self.resource_number: Optional[ResourceNumber] = None
 
-    def associate_edge(self, edge, side):
-        if self.edges.get(side) == edge:
-            return
+        # Assigned when the tile is added to a board.
+        self.index: Optional[int] = None
+        self._board: Optional[Board] = None
 
-        assert self.edges.get(side) is None
-        self.edges[side] = edge
+    def _sides(self, table: array, items: list) -> Dict[TileSide, BoardItem]:
+        base = self.index * SIDES
+        return {
+            side: items[table[base + side.value]]
+            for side in TileSide if table[base + side.value] >= 0
+        }
 
-    def associate_intersection(self, intersection, side):
-        if self.intersections.get(side) == intersection:
-            return
+    @property
+    def neighbors(self) -> Dict[TileSide, "Tile"]:
+        return self._sides(self._board.topology.tile_neighbors, self._board.tile_list)
 
-        assert self.intersections.get(side) is None
-        self.intersections[side] = intersection
+    @property
+    def edges(self) -> Dict[TileSide, "Edge"]:
+        return self._sides(self._board.topology.tile_edges, self._board.edge_list)
+
+    @property
+    def intersections(self) -> Dict[TileSide, "Intersection"]:
+        return self._sides(self._board.topology.tile_intersections, self._board.intersection_list)
 
     def bfs(self):
         visited = set()
@@ -96,7 +116,7 @@ class Tile(GameItem):
                 continue
 
             visited.add(tile)
-            for neighbor in self.neighbors.values():
+            for neighbor in tile.neighbors.values():
                 if neighbor not in visited:
                     tiles.append(neighbor)
 
@@ -104,13 +124,7 @@ class Tile(GameItem):
 
     @property
     def resource_type(self):
-        return {
-            TileType.BRICK: Resource.BRICK,
-            TileType.STONE: Resource.STONE,
-            TileType.WHEAT: Resource.WHEAT,
-            TileType.SHEEP: Resource.SHEEP,
-            TileType.WOOD: Resource.WOOD,
-        }.get(self.type)
+        return TILE_RESOURCES.get(self.type)
 
     def serialize(self):
         return {
@@ -118,34 +132,31 @@ class Tile(GameItem):
         }
 
     def __str__(self):
-        return self.id
+        return f"tile {self.id}"
 
     def __repr__(self):
         return str(self)
 
 
-class Intersection(GameItem):
-    def __init__(self):
-        self.tiles: Set[Tile] = set()
-        self.edges: Set[Edge] = set()
-
-        self.settlement: Optional[Settlement] = None
-
-        super().__init__()
+# Intersections and edges are views over the board's topology and piece tables.
+class Intersection(BoardItem):
+    __slots__ = ()
 
-    def associate_tile(self, tile: Tile):
-        if tile in self.tiles:
-            return
+    def __init__(self, board, index: int):
+        self.index = index
+        self._board: Board = board
 
-        assert len(self.tiles) < 3
-        self.tiles.add(tile)
+    @property
+    def tiles(self) -> List[Tile]:
+        return [self._board.tile_list[tile] for tile in self._board.topology.tiles_of_intersection(self.index)]
 
-    def associate_edge(self, edge):
-        if edge in self.edges:
-            return
+    @property
+    def edges(self) -> List["Edge"]:
+        return [self._board.edge_list[edge] for edge in self._board.topology.edges_of_intersection(self.index)]
 
-        assert len(self.edges) < 3
-        self.edges.add(edge)
+    @property
+    def settlement(self) -> Optional[Settlement]:
+        return self._board.settlements[self.index]
 
     def other_edges(self, edge):
         assert edge in self.edges
@@ -155,28 +166,10 @@ class Intersection(GameItem):
             yield other_edge
 
     def borders_house(self):
-        # If an intersection contains a house, we can say it borders a house.
-        if self.settlement is not None:
-            return True
-
-        # The intersection borders a house if any edge connects to an intersection with a house.
-        for edge in self.edges:
-            neighboring_intersection = edge.other_intersection(self)
-            if neighboring_intersection.settlement is not None:
-                return True
-
-        return False
+        return self._board.intersection_borders_house(self.index)
 
     def borders_road_for_player(self, player: Player):
-        # A bordering edge must contain a road owned by the player.
-        for edge in self.edges:
-            road = edge.road
-            if road is None:
-                continue
-            if road.player == player:
-                return True
-
-        return False
+        return self._board.intersection_borders_road_for_player(self.index, player)
 
     def collect(self, resource_number: ResourceNumber = None) -> [Resource]:
         assert self.settlement is not None
@@ -193,76 +186,116 @@ class Intersection(GameItem):
             for _ in range(self.settlement.gather_amount):
                 yield resource
 
-class Edge(GameItem):
-    def __init__(self):
-        self.tiles: Set[Tile] = set()
-        self.intersections: Set[Intersection] = set()
-
-        self.road: Optional[Road] = None
 
-        super().__init__()
+class Edge(BoardItem):
+    __slots__ = ()
 
-    def associate_tile(self, tile: Tile):
-        if tile in self.tiles:
-            return
+    def __init__(self, board, index: int):
+        self.index = index
+        self._board: Board = board
 
-        assert len(self.tiles) < 2
-        self.tiles.add(tile)
+    @property
+    def tiles(self) -> List[Tile]:
+        return [self._board.tile_list[tile] for tile in self._board.topology.tiles_of_edge(self.index)]
 
-    def associate_intersection(self, intersection: Intersection):
-        if intersection in self.intersections:
-            return
+    @property
+    def intersections(self) -> List[Intersection]:
+        return [
+            self._board.intersection_list[intersection]
+            for intersection in self._board.topology.intersections_of_edge(self.index)
+        ]
 
-        assert len(self.intersections) < 2
-        self.intersections.add(intersection)
+    @property
+    def road(self) -> Optional[Road]:
+        return self._board.roads[self.index]
 
     def other_intersection(self, intersection: Intersection):
-        assert intersection in self.intersections
-        set_ = self.intersections.copy()
-        set_.remove(intersection)
-        return set_.pop()
+        other = self._board.topology.other_intersection(self.index, intersection.index)
+        return self._board.intersection_list[other]
 
     def borders_settlement_for_player(self, player: Player):
-        for intersection in self.intersections:
-            if intersection.settlement is None:
-                continue
-            if intersection.settlement.player == player:
-                return True
-        return False
+        return self._board.edge_borders_settlement_for_player(self.index, player)
 
     def borders_settlement_or_road_for_player(self, player: Player):
-        return self._borders_house_for_player(player) or self._borders_road_for_player(player)
+        return self._board.edge_borders_settlement_or_road_for_player(self.index, player)
 
-    def _borders_house_for_player(self, player: Player):
-        for intersection in self.intersections:
-            if intersection.settlement is None:
-                continue
-            if intersection.settlement.player == player:
-                return True
-        return False
 
-    def _borders_road_for_player(self, player: Player):
-        for intersection in self.intersections:
-            for neighboring_edge in intersection.other_edges(self):
-                road = neighboring_edge.road
-                if road is None:
-                    continue
-                if road.player == player:
-                    return True
-        return False
+# A board's intersections or edges by index. Views are only made the first time they're needed, so that boards are cheap
+# to create for clones, which only ever look at a few of them.
+class BoardItems(Sequence):
+    __slots__ = ("_board", "_item_type", "_items")
+
+    def __init__(self, board, item_type: type, count: int):
+        self._board = board
+        self._item_type = item_type
+        self._items: List[Optional[BoardItem]] = [None] * count
+
+    def __getitem__(self, index: int):
+        item = self._items[index]
+        if item is None:
+            item = self._items[index] = self._item_type(self._board, index)
+        return item
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# Pieces are None when their placement is undone on a journaled board, see src.journal.
+class BoardListener(ABC):
+    @abstractmethod
+    def settlement_set(self, intersection: int, settlement: Settlement):
+        pass
+
+    @abstractmethod
+    def road_set(self, edge: int, road: Road):
+        pass
 
 
 class Board:
     def __init__(self):
         self.anchor_tile = None
-        self.tiles: Dict[str, Tile] = {}
-        self.edges: Dict[str, Edge] = {}
-        self.intersections: Dict[str, Intersection] = {}
+        self.topology: Optional[Topology] = None
+
+        # Board items by topology index, which is also their id.
+        self.tile_list: List[Tile] = []
+        self.edge_list: Sequence[Edge] = BoardItems(self, Edge, 0)
+        self.intersection_list: Sequence[Intersection] = BoardItems(self, Intersection, 0)
+
+        # Pieces by topology index.
+        self.settlements: List[Optional[Settlement]] = []
+        self.roads: List[Optional[Road]] = []
 
         self.settled_intersections: Set[Intersection] = set()
         self.settled_edges: Set[Edge] = set()
 
-    def set_piece(self, piece: Piece, location_id: str):
+        self._listeners: List[BoardListener] = []
+
+        # Set for the boards of journaled games.
+        self.journal: Optional[Journal] = None
+
+    def subscribe(self, listener: BoardListener):
+        self._listeners.append(listener)
+
+    def add_tile(self, tile: Tile) -> int:
+        assert tile.index is None
+
+        tile.index = len(self.tile_list)
+        tile._board = self
+        self.tile_list.append(tile)
+        return tile.index
+
+    # Location ids come from clients, so they're checked before they're used as indices.
+    def intersection_index(self, location_id: int) -> Optional[int]:
+        if type(location_id) is not int or not 0 <= location_id < len(self.intersection_list):
+            return None
+        return location_id
+
+    def edge_index(self, location_id: int) -> Optional[int]:
+        if type(location_id) is not int or not 0 <= location_id < len(self.edge_list):
+            return None
+        return location_id
+
+    def set_piece(self, piece: Piece, location_id: int):
         if isinstance(piece, Settlement):
             self.set_settlement(piece, location_id)
         elif isinstance(piece, Road):
@@ -270,132 +303,176 @@ class Board:
         else:
             raise ValueError(f"Invalid piece type: {piece}")
 
-    def set_settlement(self, settlement: Settlement, location_id: str):
-        intersection = self.intersections[location_id]
-        intersection.settlement = settlement
-        self.settled_intersections.add(intersection)
+    def set_settlement(self, settlement: Settlement, location_id: int):
+        intersection = self.intersection_list[location_id]
+        if self.journal is not None:
+            previous = self.settlements[intersection.index]
+            self.journal.record(lambda: self._put_settlement(intersection, previous))
+        self._put_settlement(intersection, settlement)
+
+    def _put_settlement(self, intersection: Intersection, settlement: Optional[Settlement]):
+        self.settlements[intersection.index] = settlement
+        if settlement is not None:
+            self.settled_intersections.add(intersection)
+        else:
+            self.settled_intersections.discard(intersection)
+
+        for listener in self._listeners:
+            listener.settlement_set(intersection.index, settlement)
+
+    def set_road(self, road: Road, location_id: int):
+        edge = self.edge_list[location_id]
+        if self.journal is not None:
+            previous = self.roads[edge.index]
+            self.journal.record(lambda: self._put_road(edge, previous))
+        self._put_road(edge, road)
+
+    def _put_road(self, edge: Edge, road: Optional[Road]):
+        self.roads[edge.index] = road
+        if road is not None:
+            self.settled_edges.add(edge)
+        else:
+            self.settled_edges.discard(edge)
 
-    def set_road(self, road: Road, location_id: str):
-        edge = self.edges[location_id]
-        edge.road = road
-        self.settled_edges.add(edge)
+        for listener in self._listeners:
+            listener.road_set(edge.index, road)
 
-    @staticmethod
-    def from_definition(definition: [dict]):
-        pass
+    def intersection_borders_house(self, intersection: int) -> bool:
+        settlements = self.settlements
 
-    def initialize(self, anchor_tile: Tile):
-        self._construct_edge_graph()
-        self.anchor_tile = anchor_tile
+        # If an intersection contains a house, we can say it borders a house.
+        if settlements[intersection] is not None:
+            return True
 
-    def _construct_edge_graph(self):
-        for tile in self.tiles.values():
+        # The intersection borders a house if any edge connects to an intersection with a house.
+        for neighbor in self.topology.neighbors_of_intersection(intersection):
+            if settlements[neighbor] is not None:
+                return True
 
-            # create new intersections
-            for side in TileSide:
-                if side in tile.intersections:
-                    continue
+        return False
 
-                intersection = Intersection()
-                self.intersections[intersection.id] = intersection
-
-                # associate the new intersection with the tile
-                tile.intersections[side] = intersection
-                intersection.associate_tile(tile)
-
-                # if the tile has neighboring tiles, associate the new intersection with them too
-                neighbor_0_intersect_side, neighbor_1_intersect_side = {
-                    TileSide.NORTH: (TileSide.SOUTH_EAST, TileSide.SOUTH_WEST),
-                    TileSide.NORTH_EAST: (TileSide.SOUTH, TileSide.NORTH_WEST),
-                    TileSide.SOUTH_EAST: (TileSide.SOUTH_WEST, TileSide.NORTH),
-                    TileSide.SOUTH: (TileSide.NORTH_WEST, TileSide.NORTH_EAST),
-                    TileSide.SOUTH_WEST: (TileSide.NORTH, TileSide.SOUTH_EAST),
-                    TileSide.NORTH_WEST: (TileSide.NORTH_EAST, TileSide.SOUTH)
-                }.get(side)
-
-                neighbor_0 = tile.neighbors.get(side)
-                if neighbor_0 is not None:
-                    neighbor_0.associate_intersection(intersection, neighbor_0_intersect_side)
-                    intersection.associate_tile(neighbor_0)
-
-                neighbor_1 = tile.neighbors.get(TileSide.wrap(side.value + 1))
-                if neighbor_1 is not None:
-                    neighbor_1.associate_intersection(intersection, neighbor_1_intersect_side)
-                    intersection.associate_tile(neighbor_1)
-
-            # create new edges
-            for side in TileSide:
-                if side in tile.edges:
-                    continue
+    def intersection_borders_road_for_player(self, intersection: int, player: Player) -> bool:
+        # A bordering edge must contain a road owned by the player.
+        for edge in self.topology.edges_of_intersection(intersection):
+            road = self.roads[edge]
+            if road is not None and road.player is player:
+                return True
+        return False
 
-                edge = Edge()
-                self.edges[edge.id] = edge
+    def edge_borders_settlement_for_player(self, edge: int, player: Player) -> bool:
+        for intersection in self.topology.intersections_of_edge(edge):
+            settlement = self.settlements[intersection]
+            if settlement is not None and settlement.player is player:
+                return True
+        return False
 
-                edge.associate_tile(tile)
-                tile.associate_edge(edge, side)
+    def edge_borders_road_for_player(self, edge: int, player: Player) -> bool:
+        for neighbor in self.topology.neighbors_of_edge(edge):
+            road = self.roads[neighbor]
+            if road is not None and road.player is player:
+                return True
+        return False
 
-                neighbor = tile.neighbors.get(side)
-                if neighbor is not None:
-                    edge.associate_tile(neighbor)
-                    neighbor.associate_edge(edge, TileSide.opposite(side))
+    def edge_borders_settlement_or_road_for_player(self, edge: int, player: Player) -> bool:
+        return self.edge_borders_settlement_for_player(edge, player) or self.edge_borders_road_for_player(edge, player)
 
-            # connect edges to intersections
-            for side in TileSide:
-                edge = tile.edges.get(side)
-                intersection = tile.intersections.get(side)
+    @staticmethod
+    def from_definition(definition: [dict]):
+        pass
 
-                edge.associate_intersection(intersection)
-                intersection.associate_edge(edge)
+    # Topologies are never modified, so boards of the same shape can share one, see board_generator.Layout.
+    def initialize(self, anchor_tile: Tile, topology: Topology):
+        self._construct_edge_graph(topology)
+        self.anchor_tile = anchor_tile
 
-                previous_intersection = tile.intersections.get(TileSide.wrap(side.value - 1))
-                previous_intersection.associate_edge(edge)
-                edge.associate_intersection(previous_intersection)
+    def _construct_edge_graph(self, topology: Topology):
+        assert topology.tile_count == len(self.tile_list)
+        self.topology = topology
+
+        self.intersection_list = BoardItems(self, Intersection, self.topology.intersection_count)
+        self.edge_list = BoardItems(self, Edge, self.topology.edge_count)
+
+        self.settlements = [None] * self.topology.intersection_count
+        self.roads = [None] * self.topology.edge_count
+
+    # A copy of the board for a cloned game, with the pieces of the clone's players. Tiles and the topology never change
+    # once the board is initialized, so they're shared with the copy, and only the piece tables and the pieces on them
+    # are copied. Shared tiles still belong to this board, so the copy's own edges and intersections are reached through
+    # its topology rather than through tile.edges and tile.intersections. The copy has no listeners or journal.
+    def clone(self, players: Dict[Player, Player]) -> "Board":
+        board = Board()
+        board.anchor_tile = self.anchor_tile
+        board.topology = self.topology
+        board.tile_list = self.tile_list
+        board.intersection_list = BoardItems(board, Intersection, self.topology.intersection_count)
+        board.edge_list = BoardItems(board, Edge, self.topology.edge_count)
+
+        board.settlements = self.settlements.copy()
+        board.roads = self.roads.copy()
+        for intersection in self.settled_intersections:
+            settlement = self.settlements[intersection.index]
+            board.settlements[intersection.index] = type(settlement)(players[settlement.player])
+            board.settled_intersections.add(board.intersection_list[intersection.index])
+        for edge in self.settled_edges:
+            road = self.roads[edge.index]
+            board.roads[edge.index] = type(road)(players[road.player])
+            board.settled_edges.add(board.edge_list[edge.index])
+        return board
 
     def serialize(self):
+        return {
+            **self.serialize_topology(),
+            "pieces": self.serialize_pieces(),
+        }
+
+    # The topology of a board never changes after it's initialized, and only needs to be sent to a client once. Tiles are
+    # placed by their axial coordinates, see topology.DIRECTIONS.
+    def serialize_topology(self):
+        topology = self.topology
+        side_names = [side.name for side in TileSide]
+
         return {
             "tiles": {
                 tile.id: {
                     "edges": {
-                        side.name: edge.id for side, edge in tile.edges.items()
+                        side_names[side]: topology.tile_edges[tile.index * SIDES + side] for side in range(SIDES)
                     },
                     "intersections": {
-                        side.name: intersection.id for side, intersection in tile.intersections.items()
+                        side_names[side]: topology.tile_intersections[tile.index * SIDES + side] for side in range(SIDES)
                     },
                     "type": tile.type.value,
                     "resource_number": tile.resource_number.value if tile.resource_number is not None else None,
-                } for tile in self.tiles.values()
+                    "coordinates": topology.coordinates_of_tile(tile.index),
+                } for tile in self.tile_list
+            },
+            "anchor_tile": self.anchor_tile.id,
+        }
+
+    def serialize_pieces(self):
+        return {
+            "intersections": {
+                intersection.id: {
+                    "type": intersection.settlement.type.value,
+                    "player": intersection.settlement.player.id,
+                } for intersection in self.settled_intersections
             },
             "edges": {
                 edge.id: {
-                    "tiles": [tile.id for tile in edge.tiles]
-                } for edge in self.edges.values()
-            },
-            "anchor_tile": self.anchor_tile.id,
-            "pieces": {
-                "intersections": {
-                    intersection.id: {
-                        "type": intersection.settlement.type.value,
-                        "player": intersection.settlement.player.id,
-                    } for intersection in self.settled_intersections
-                },
-                "edges": {
-                    edge.id: {
-                        "type": edge.road.type.value,
-                        "player": edge.road.player.id,
-                    } for edge in self.settled_edges
-                }
+                    "type": edge.road.type.value,
+                    "player": edge.road.player.id,
+                } for edge in self.settled_edges
             }
         }
 
     def tile_graph(self):
         graph: Dict[Tile, List[Tile]] = {}
-        for tile in self.tiles.values():
+        for tile in self.tile_list:
             graph[tile] = list(tile.neighbors.values())
         return graph
 
     def __str__(self):
         return f"""
-        len: {len(self.tiles)}
+        len: {len(self.tile_list)}
         """
 
     def __repr__(self):
@@ -1,7 +1,14 @@
 from abc import ABC, abstractmethod
-from src.board import Board, Tile, TileSide, TileType, ResourceNumber
+from array import array
+from src.board import Board, Tile, TileType, ResourceNumber
+from src.topology import Topology, NONE, DIRECTIONS
+from src.balance import Balancer
 from typing import Dict
+import logging
 import random
+import threading
+
+logger = logging.getLogger(__name__)
 
 
 class TileProvider(ABC):
@@ -32,7 +39,8 @@ class StandardProvider(TileProvider):
         ResourceNumber.TWELVE,
     ]
 
-    def __init__(self):
+    def __init__(self, rng: random.Random = None):
+        self.random = rng if rng is not None else random.Random()
         self.tiles = []
         self.resource_numbers = []
 
@@ -41,11 +49,11 @@ class StandardProvider(TileProvider):
 
     def _fill_tile_pool(self):
         self.tiles = self.TILES.copy()
-        random.shuffle(self.tiles)
+        self.random.shuffle(self.tiles)
 
     def _fill_resource_pool(self):
         self.resource_numbers = self.RESOURCE_NUMBERS.copy()
-        random.shuffle(self.resource_numbers)
+        self.random.shuffle(self.resource_numbers)
 
     def get_tile(self) -> Tile:
         # If a board is generated larger than the standard catan board, refresh the tile/resource pools to generate
@@ -55,7 +63,7 @@ class StandardProvider(TileProvider):
         if len(self.resource_numbers) == 0:
             self._fill_resource_pool()
 
-        # TODO: prevent neighboring 6s/8s
+        # Neighboring 6s and 8s are only prevented for balanced boards, see Balancer.
         tile = Tile()
         tile.type = self.tiles.pop()
         if tile.resource_type is not None:
@@ -69,60 +77,113 @@ class Generator(ABC):
         pass
 
 
+# Boards are hexagons of tiles around a center tile, radius tiles deep. Layouts up to the standard radius are built when
+# a server starts, and larger ones the first time they're needed.
+STANDARD_RADIUS = 10
+MAX_RADIUS = 50
+
+# Tiles are placed by their axial coordinates (q, r), see topology.DIRECTIONS. They have their flat sides to the north and
+# south, and r grows towards the south.
+def distance(q: int, r: int) -> int:
+    return (abs(q) + abs(r) + abs(q + r)) // 2
+
+
+# The shape of a board only depends on its radius, so its topology is built once per radius and shared by every board of
+# that size. Boards only differ in their tiles.
+class Layout:
+    def __init__(self, radius: int):
+        self.radius = radius
+
+        # Tiles are indexed in breadth first order from the center, going around each tile's sides in order. Boards
+        # have always been built in this order, so the logs of older games still replay onto the same boards. Positions
+        # are looked up in a dense grid around the board with a margin of one tile, which is never on the board.
+        size = 2 * radius + 3
+        steps = [dq * size + dr for dq, dr in DIRECTIONS]
+        on_board = bytearray(
+            distance(q, r) <= radius for q in range(-radius - 1, radius + 2) for r in range(-radius - 1, radius + 2)
+        )
+        center = (radius + 1) * size + radius + 1
+        index = array("i", [NONE]) * (size * size)
+        index[center] = 0
+        cells = [center]
+        for cell in cells:
+            for step in steps:
+                neighbor = cell + step
+                if on_board[neighbor] and index[neighbor] == NONE:
+                    index[neighbor] = len(cells)
+                    cells.append(neighbor)
+
+        # Tile neighbors by tile index, SIDES slots per tile.
+        neighbors = array("i", [index[cell + step] for cell in cells for step in steps])
+        coordinates = array("i", [
+            value for cell in cells for value in (cell // size - radius - 1, cell % size - radius - 1)
+        ])
+
+        self.center = 0
+        self.topology = Topology(neighbors, coordinates)
+
+
+_layouts: Dict[int, Layout] = {}
+_layouts_lock = threading.Lock()
+
+
+def layout(radius: int) -> Layout:
+    cached = _layouts.get(radius)
+    if cached is not None:
+        return cached
+
+    with _layouts_lock:
+        if radius not in _layouts:
+            _layouts[radius] = Layout(radius)
+        return _layouts[radius]
+
+
+# Builds the layouts of the standard sizes up front, e.g. when a server starts, so that no game waits for one.
+def precompute_layouts(max_radius: int = STANDARD_RADIUS):
+    for radius in range(max_radius + 1):
+        layout(radius)
+
+
+# The topology for a board that was stored with its tile neighbors, shared with the layout of the same shape if there's
+# one already.
+def topology(tile_neighbors: array) -> Topology:
+    for cached in list(_layouts.values()):
+        if cached.topology.tile_neighbors == tile_neighbors:
+            return cached.topology
+    return Topology(tile_neighbors)
+
+
 class StandardGenerator(Generator):
     PROVIDER = StandardProvider
+    # How many sets of tiles a balanced board draws before it settles for one that doesn't meet the constraints, which
+    # only happens on the smallest boards.
+    BALANCE_DRAWS = 20
 
-    def __init__(self, radius=2):
+    # Balanced boards are rearranged so that no tiles of the same type or 6s and 8s are next to each other, see Balancer.
+    def __init__(self, radius=2, rng: random.Random = None, balanced: bool = False):
         self.radius = radius
-        self.provider = self.PROVIDER()
+        self.random = rng
+        self.provider = self.PROVIDER(rng)
+        self.balanced = balanced
 
     def generate(self) -> Board:
-        tile_depth: Dict[Tile, int] = {}
-
-        center_tile = self.provider.get_tile()
-        tile_depth[center_tile] = 0
-        tiles = [center_tile]
+        layout_ = layout(self.radius)
+
+        tiles = [self.provider.get_tile() for _ in range(layout_.topology.tile_count)]
+        if self.balanced:
+            # Some draws can't be balanced, e.g. four 6s and 8s among seven tiles, so those are drawn again.
+            balancer = Balancer(layout_.topology, self.random)
+            draws = 1
+            while not balancer.balance(tiles):
+                if draws == self.BALANCE_DRAWS:
+                    logger.warning("No balanced board of radius %d after %d draws", self.radius, draws)
+                    break
+                tiles = [self.provider.get_tile() for _ in range(layout_.topology.tile_count)]
+                draws += 1
 
         board = Board()
-        while len(tiles) > 0:
-            tile = tiles.pop(0)
-            board.tiles[tile.id] = tile
-
-            # create new neighboring tiles
-            if tile_depth[tile] < self.radius:
-                for tile_side in TileSide:
-                    if tile_side in tile.neighbors:
-                        continue
-
-                    new_tile = self.provider.get_tile()
-                    board.tiles[new_tile.id] = new_tile
-                    tile_depth[new_tile] = tile_depth[tile] + 1
-                    tiles.append(new_tile)
-
-                    tile.neighbors[tile_side] = new_tile
-                    new_tile.neighbors[TileSide.opposite(tile_side)] = tile
-
-            # associate neighboring tiles with each other
-            for tile_side in TileSide:
-                tile_1 = tile.neighbors.get(tile_side)
-                if not tile_1:
-                    continue
-                tile_2 = tile.neighbors.get(TileSide.wrap(tile_side.value + 1))
-                if not tile_2:
-                    continue
-
-                tile_1_side, tile_2_side = {
-                    TileSide.NORTH: (TileSide.SOUTH_EAST, TileSide.NORTH_WEST),
-                    TileSide.NORTH_EAST: (TileSide.SOUTH, TileSide.NORTH),
-                    TileSide.SOUTH_EAST: (TileSide.SOUTH_WEST, TileSide.NORTH_EAST),
-                    TileSide.SOUTH: (TileSide.NORTH_WEST, TileSide.SOUTH_EAST),
-                    TileSide.SOUTH_WEST: (TileSide.NORTH, TileSide.SOUTH),
-                    TileSide.NORTH_WEST: (TileSide.NORTH_EAST, TileSide.SOUTH_WEST),
-                }.get(tile_side)
-
-                tile_1.neighbors[tile_1_side] = tile_2
-                tile_2.neighbors[tile_2_side] = tile_1
-
-        board.initialize(center_tile)
-
-        return board
\ No newline at end of file
+        for tile in tiles:
+            board.add_tile(tile)
+        board.initialize(board.tile_list[layout_.center], layout_.topology)
+
+        return board
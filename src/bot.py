@@ -0,0 +1,243 @@
+import math
+import random
+import time
+import weakref
+from typing import Dict, List, Optional
+
+from src.game import Goatan
+from src.player import Player
+from src.action import Action, ActionType
+from src.engine import Agent, RandomAgent
+from src.piece import PieceType, House, Road
+from src.balance import PIPS
+
+# Seats filled by bots belong to users named bot:<kind>:<index>. Their agents are created from the name whenever
+# they're needed, so bots keep playing in games that were restored from a snapshot or a log.
+BOT_PREFIX = "bot:"
+
+# How long a bot may think about a single action, in seconds.
+BUDGET = 0.25
+
+
+def _pips(game: Goatan, intersection: int) -> int:
+    board = game.board
+    total = 0
+    for tile in board.topology.tiles_of_intersection(intersection):
+        resource_number = board.tile_list[tile].resource_number
+        if resource_number is not None:
+            total += PIPS[resource_number]
+    return total
+
+
+# Builds wherever the dice pay the most. Roads lead towards the best open intersections, and bank trades are only made
+# when they make a house or road affordable.
+class GreedyAgent(Agent):
+    def __init__(self, seed: Optional[int] = None):
+        self.random = random.Random(seed)
+
+    def _open(self, game: Goatan, intersection: int) -> bool:
+        board = game.board
+        return board.settlements[intersection] is None and not board.intersection_borders_house(intersection)
+
+    def _road_value(self, game: Goatan, edge: int) -> int:
+        return max(
+            (_pips(game, intersection) for intersection in game.board.topology.intersections_of_edge(edge)
+             if self._open(game, intersection)),
+            default=0,
+        )
+
+    @staticmethod
+    def _enables(player: Player, action: Action) -> bool:
+        resources = {
+            resource: count + action.transaction.resources[resource] for resource, count in player.resources.items()
+        }
+        for cost in (House.cost(), Road.cost()):
+            affordable_before = player.can_transact(cost)
+            affordable_after = all(resources[resource] + amount >= 0 for resource, amount in cost.resources.items())
+            if affordable_after and not affordable_before:
+                return True
+        return False
+
+    # The actions worth considering, best first. Rolls come before anything else, and only the best few places and the
+    # trades that make something affordable are kept.
+    def candidates(self, game: Goatan, player: Player, actions: List[Action], width: int = 3) -> List[Action]:
+        by_type: Dict[ActionType, List[Action]] = {}
+        for action in actions:
+            by_type.setdefault(action.type, []).append(action)
+
+        if ActionType.ROLL in by_type:
+            return by_type[ActionType.ROLL]
+
+        places = by_type.get(ActionType.PLACE, [])
+        houses = [action for action in places if action.piece_type == PieceType.HOUSE]
+        houses.sort(key=lambda action: (_pips(game, action.location_id), self.random.random()), reverse=True)
+        roads = [action for action in places if action.piece_type == PieceType.ROAD]
+        roads.sort(key=lambda action: (self._road_value(game, action.location_id), self.random.random()), reverse=True)
+        trades = [action for action in by_type.get(ActionType.BANK_TRADE, []) if self._enables(player, action)]
+        self.random.shuffle(trades)
+
+        candidates = houses[:width] + roads[:width] + trades[:width] + by_type.get(ActionType.END_TURN, [])
+        return candidates if len(candidates) > 0 else actions
+
+    def act(self, game: Goatan, player: Player, actions: List[Action]) -> Action:
+        return self.candidates(game, player, actions, width=1)[0]
+
+
+class _Node:
+    def __init__(self, mover: int):
+        # The turn order index of the player that took the action leading here.
+        self.mover = mover
+        self.visits = 0
+        self.value = 0.0
+        self.children: Dict[Action, "_Node"] = {}
+
+
+# Monte Carlo tree search over the actions of all players. Dice make the game stochastic, so the tree is open loop: each
+# iteration plays the actions of a path on a clone of the game with newly seeded dice, and only follows the children
+# that are still legal. The clone is made once per decision, and every iteration undoes its actions afterwards. Only the
+# greedy agent's candidates are searched. Rollouts are played by greedy agents for a bounded number of actions, and
+# every player is rewarded with their share of the points needed to win.
+class MCTSAgent(Agent):
+    def __init__(self, seed: Optional[int] = None, budget: float = BUDGET, exploration: float = 1.4,
+                 rollout_actions: int = 60):
+        self.random = random.Random(seed)
+        self.budget = budget
+        self.exploration = exploration
+        self.rollout_actions = rollout_actions
+        self._rollout = GreedyAgent(self.random.getrandbits(32))
+
+    def _reward(self, game: Goatan) -> List[float]:
+        victor = game.win_condition.victor(game.board)
+        required = game.win_condition.required_points
+        return [
+            1.0 if player == victor else min(game.win_condition.points(player) / required, 1.0) * 0.5
+            for player in game.players
+        ]
+
+    def _select(self, node: _Node, actions: List[Action]) -> Action:
+        log_visits = math.log(node.visits + 1)
+
+        def uct(action: Action) -> float:
+            child = node.children[action]
+            return child.value / child.visits + self.exploration * math.sqrt(log_visits / child.visits)
+
+        return max(actions, key=uct)
+
+    def _iterate(self, root: _Node, game: Goatan):
+        game.random.seed(self.random.getrandbits(64))
+        path = [root]
+        actions_taken = 0
+
+        node = root
+        while not game.finished:
+            player = game.phase.active_player
+            actions = self._rollout.candidates(game, player, game.legal_actions(player))
+            untried = [action for action in actions if action not in node.children]
+            mover = game.players.index(player)
+
+            if len(untried) > 0:
+                action = self.random.choice(untried)
+                node.children[action] = _Node(mover)
+                action.apply(game, player)
+                actions_taken += 1
+                path.append(node.children[action])
+                break
+
+            action = self._select(node, actions)
+            action.apply(game, player)
+            actions_taken += 1
+            node = node.children[action]
+            path.append(node)
+
+        for _ in range(self.rollout_actions):
+            if game.finished:
+                break
+            player = game.phase.active_player
+            self._rollout.act(game, player, game.legal_actions(player)).apply(game, player)
+            actions_taken += 1
+
+        reward = self._reward(game)
+        for _ in range(actions_taken):
+            game.undo()
+        root.visits += 1
+        for node in path[1:]:
+            node.visits += 1
+            node.value += reward[node.mover]
+
+    def act(self, game: Goatan, player: Player, actions: List[Action]) -> Action:
+        actions = self._rollout.candidates(game, player, actions)
+        if len(actions) == 1:
+            return actions[0]
+
+        start = time.perf_counter()
+        deadline = start + self.budget
+        clone = game.clone()
+        root = _Node(game.players.index(player))
+
+        # Iterations stop early enough that the last one doesn't overrun the budget.
+        now = start
+        while now + (now - start) / max(root.visits, 1) < deadline:
+            self._iterate(root, clone)
+            now = time.perf_counter()
+
+        return max(actions, key=lambda action: root.children[action].visits if action in root.children else -1)
+
+
+AGENTS = {
+    "random": RandomAgent,
+    "greedy": GreedyAgent,
+    "mcts": MCTSAgent,
+}
+
+_agents: "weakref.WeakKeyDictionary[Goatan, Dict[Player, Agent]]" = weakref.WeakKeyDictionary()
+
+
+def is_bot(player: Player) -> bool:
+    return player.user_id.startswith(BOT_PREFIX)
+
+
+# Fills the game's empty seats with up to count bots of the given kind. Bots join like any other user, so their seats
+# are in the game's log and snapshots.
+def fill_seats(game: Goatan, count: int, kind: str = "greedy"):
+    if kind not in AGENTS:
+        kind = "greedy"
+    index = 0
+    while count > 0 and len(game.players.available_colors) > 0:
+        user_id = f"{BOT_PREFIX}{kind}:{index}"
+        index += 1
+        if game.players.player_for_user(user_id) is not None:
+            continue
+        game.join(user_id)
+        count -= 1
+
+
+def agent_for(game: Goatan, player: Player) -> Optional[Agent]:
+    if not is_bot(player):
+        return None
+
+    agents = _agents.setdefault(game, {})
+    agent = agents.get(player)
+    if agent is None:
+        kind = player.user_id[len(BOT_PREFIX):].split(":")[0]
+        # Bots are seeded from the game, so that simulations with bots can be repeated.
+        agent = AGENTS.get(kind, GreedyAgent)(seed=game.seed * 8 + player.id)
+        agents[player] = agent
+    return agent
+
+
+# Whether it's a bot's turn to act.
+def waiting(game: Goatan) -> bool:
+    if game.phase is None or game.finished:
+        return False
+    return is_bot(game.phase.active_player)
+
+
+# Takes one action for the bot whose turn it is, through the same Goatan methods as the socket handlers.
+def play(game: Goatan) -> bool:
+    if not waiting(game):
+        return False
+
+    player = game.phase.active_player
+    agent = agent_for(game, player)
+    agent.act(game, player, game.legal_actions(player)).apply(game, player)
+    return True
@@ -0,0 +1,118 @@
+import hashlib
+import hmac
+import queue
+import threading
+import zlib
+from typing import List, Optional, Dict
+
+from socketio.pubsub_manager import PubSubManager
+
+from src.game import GameManager, Goatan, Emitter, EvictionPolicy
+from src.user import UserManager, User
+
+
+# Splits games between the workers of a sharded deployment. Every game belongs to exactly one worker, picked from a
+# hash of its id, so any worker can tell where a game lives without asking the others.
+class ShardRouter:
+    def __init__(self, urls: List[str], index: int):
+        assert 0 <= index < len(urls)
+        self.urls = urls
+        self.index = index
+
+    def owner(self, game_id: str) -> int:
+        # crc32 rather than hash(), which differs between processes.
+        return zlib.crc32(game_id.encode()) % len(self.urls)
+
+    def owns(self, game_id: str) -> bool:
+        return self.owner(game_id) == self.index
+
+    def url(self, game_id: str) -> str:
+        return self.urls[self.owner(game_id)]
+
+
+class ShardedGameManager(GameManager):
+    def __init__(
+            self,
+            router: ShardRouter,
+            emitter: Optional[Emitter] = None,
+            snapshots=None,
+            logs=None,
+            eviction: Optional[EvictionPolicy] = None,
+    ):
+        super().__init__(emitter, snapshots, logs, eviction)
+        self.router = router
+
+    def create_game(self):
+        game = Goatan(self.emitter, self.snapshots, self.logs)
+        # Ids are drawn until one belongs to this worker, so games are always created where they're owned.
+        while not self.router.owns(game.id):
+            game.id = Goatan._generate_id()
+        self._add(game)
+        return game
+
+    def get(self, id_: str):
+        if not self.router.owns(id_):
+            return None
+        return super().get(id_)
+
+    def owner_url(self, id_: str) -> Optional[str]:
+        if self.router.owns(id_):
+            return None
+        return self.router.url(id_)
+
+
+# Users are created on whichever worker serves their first page, but may play on any of them. Their ids are signed with
+# a secret shared by the workers, so each worker can recognize them without keeping a shared list.
+class SignedUserManager(UserManager):
+    def __init__(self, secret: str, ttl: Optional[float] = None, max_users: Optional[int] = None):
+        super().__init__(ttl, max_users)
+        self._secret = secret.encode()
+
+    def _signature(self, key: str) -> str:
+        return hmac.new(self._secret, key.encode(), hashlib.sha256).hexdigest()[:16]
+
+    def create_user(self):
+        user = User()
+        user.id = f"{user.id}.{self._signature(user.id)}"
+        self._add(user)
+        return user
+
+    def get(self, id_: str):
+        user = super().get(id_)
+        if user is not None:
+            return user
+
+        key, _, signature = id_.partition(".")
+        if not hmac.compare_digest(signature, self._signature(key)):
+            return None
+
+        user = User()
+        user.id = id_
+        self._add(user)
+        return user
+
+
+# A message queue for servers in the same process, standing in for redis or kombu in tests. Pass one instance per
+# server as its client_manager, with the same channel.
+class LocalPubSubManager(PubSubManager):
+    name = "local"
+
+    _subscribers: Dict[str, List[queue.Queue]] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, channel="socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._messages: queue.Queue = queue.Queue()
+        if not write_only:
+            with self._lock:
+                self._subscribers.setdefault(channel, []).append(self._messages)
+
+    def _publish(self, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(self.channel, []))
+        for messages in subscribers:
+            messages.put(data)
+
+    def _listen(self):
+        while True:
+            yield self._messages.get()
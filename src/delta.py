@@ -0,0 +1,87 @@
+from typing import Dict
+
+from src.board import BoardListener
+from src.piece import Settlement, Road, PlayerPiece
+from src.player import Player
+
+
+# Records what changed in a game between synchronizations, so that clients only need to be sent the difference.
+class DeltaTracker(BoardListener):
+    def __init__(self, game):
+        self._game = game
+
+        self._pieces = {"intersections": {}, "edges": {}}
+        public = game.projection.public()
+        self._resources = self._player_resources(public)
+        self._status = self._public_status(public)
+        # The private state each player was last sent.
+        self._private: Dict[Player, dict] = {}
+
+        game.board.subscribe(self)
+
+    # Deltas are taken from the game's projection, so the public state is only serialized once per version however it's
+    # sent.
+    @staticmethod
+    def _player_resources(public: dict) -> Dict[str, Dict[str, int]]:
+        return {player_id: player["resources"] for player_id, player in public["players"]["player_map"].items()}
+
+    @staticmethod
+    def _public_status(public: dict) -> dict:
+        return {key: value for key, value in public.items() if key not in ("version", "pieces", "players")}
+
+    @staticmethod
+    def _serialize_piece(piece: PlayerPiece):
+        return {
+            "type": piece.type.value,
+            "player": piece.player.id,
+        }
+
+    def settlement_set(self, intersection: int, settlement: Settlement):
+        self._pieces["intersections"][intersection] = self._serialize_piece(settlement)
+
+    def road_set(self, edge: int, road: Road):
+        self._pieces["edges"][edge] = self._serialize_piece(road)
+
+    def delta(self) -> dict:
+        delta = {
+            "version": self._game.version,
+        }
+
+        if len(self._pieces["intersections"]) > 0 or len(self._pieces["edges"]) > 0:
+            delta["pieces"] = self._pieces
+            self._pieces = {"intersections": {}, "edges": {}}
+
+        public = self._game.projection.public()
+
+        resources = self._player_resources(public)
+        changed_resources = {
+            player_id: {"resources": player_resources}
+            for player_id, player_resources in resources.items()
+            if player_resources != self._resources.get(player_id)
+        }
+        if len(changed_resources) > 0:
+            delta["players"] = changed_resources
+        self._resources = resources
+
+        status = self._public_status(public)
+        for key, value in status.items():
+            if value != self._status.get(key):
+                delta[key] = value
+        self._status = status
+
+        return delta
+
+    # The private states that changed since they were last sent, by player. Only players with a socket connected are
+    # sent theirs, so the others' aren't serialized at all.
+    def private_changes(self) -> Dict[Player, dict]:
+        changes = {}
+        for player in self._game.players:
+            if not self._game.watched(player):
+                # Reconnecting players are sent their whole state, so there's nothing to compare against until then.
+                self._private.pop(player, None)
+                continue
+            private = self._game.projection.private(player)
+            if private != self._private.get(player):
+                changes[player] = private
+                self._private[player] = private
+        return changes
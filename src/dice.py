@@ -4,8 +4,9 @@ from typing import Tuple
 
 
 class Dice:
-    def __init__(self, count: int = 1):
+    def __init__(self, count: int = 1, rng: random.Random = None):
         self.count = count
+        self.random = rng if rng is not None else random.Random()
 
     def roll(self) -> [int]:
         return [self._roll() for _ in range(self.count)]
@@ -17,4 +18,4 @@ class Dice:
 
 class D6(Dice):
     def _roll(self):
-        return random.randint(1, 6)
+        return self.random.randint(1, 6)
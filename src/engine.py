@@ -0,0 +1,101 @@
+import random
+from abc import ABC, abstractmethod
+from typing import List, Optional, Dict, Iterable, Iterator
+
+from src.game import Goatan
+from src.player import Player
+from src.action import Action, ActionType
+from src import error
+
+
+class Agent(ABC):
+    @abstractmethod
+    def act(self, game: Goatan, player: Player, actions: List[Action]) -> Action:
+        pass
+
+
+class RandomAgent(Agent):
+    def __init__(self, seed: Optional[int] = None):
+        self.random = random.Random(seed)
+
+    def act(self, game: Goatan, player: Player, actions: List[Action]) -> Action:
+        # Choosing the action type first keeps the many bank trades from drowning out everything else.
+        by_type: Dict[ActionType, List[Action]] = {}
+        for action in actions:
+            by_type.setdefault(action.type, []).append(action)
+
+        action_type = self.random.choice(list(by_type))
+        return self.random.choice(by_type[action_type])
+
+
+class ScriptedAgent(Agent):
+    def __init__(self, script: Iterable[Action], fallback: Optional[Agent] = None):
+        self._script: Iterator[Action] = iter(script)
+        self._fallback = fallback
+
+    def act(self, game: Goatan, player: Player, actions: List[Action]) -> Action:
+        action = next(self._script, None)
+        if action is not None:
+            return action
+        if self._fallback is None:
+            raise error.InvalidState("Script finished before the game")
+        return self._fallback.act(game, player, actions)
+
+
+class GameEngine:
+    def __init__(self, agents: List[Agent], radius: int = 2, seed: Optional[int] = None, max_actions: int = 10000,
+                 balanced: bool = False):
+        assert 0 < len(agents) <= 6
+
+        self.seed = seed
+        self.max_actions = max_actions
+        self.actions = 0
+
+        self.game = Goatan(seed=seed)
+        for index in range(len(agents)):
+            self.game.join(f"agent-{index}")
+
+        self._agents: Dict[Player, Agent] = {
+            self.game.players.player_for_user(f"agent-{index}"): agent for index, agent in enumerate(agents)
+        }
+
+        self.game.initialize(radius=radius, balanced=balanced)
+
+    @property
+    def finished(self) -> bool:
+        return self.victor is not None
+
+    @property
+    def victor(self) -> Optional[Player]:
+        return self.game.win_condition.victor(self.game.board)
+
+    @property
+    def active_player(self) -> Player:
+        return self.game.phase.active_player
+
+    def legal_actions(self, player: Player) -> List[Action]:
+        return self.game.legal_actions(player)
+
+    def step(self) -> Action:
+        player = self.active_player
+        actions = self.legal_actions(player)
+        action = self._agents[player].act(self.game, player, actions)
+        action.apply(self.game, player)
+        self.actions += 1
+        return action
+
+    def run(self) -> Optional[Player]:
+        while not self.finished and self.actions < self.max_actions:
+            self.step()
+        return self.victor
+
+    def serialize(self) -> dict:
+        victor = self.victor
+        points = self.game.win_condition.serialize()
+        return {
+            "seed": self.seed,
+            "actions": self.actions,
+            "version": self.game.version,
+            "victor": victor.name if victor is not None else None,
+            "points": {player.name: points.get(player.id, {}).get("total", 0) for player in self._agents},
+        }
@@ -2,8 +2,10 @@ from abc import ABC, abstractmethod
 
 from src.player import Player
 from src.piece import PieceType
-from src.util import GameItem
 from src.resource import Transaction, Resource
+from src import wire
+from src.wire import Protocol
+from src.error import GameError
 
 
 class Event(ABC):
@@ -18,24 +20,104 @@ class Sendable(Event):
     def serialize(self) -> dict:
         pass
 
+    # Events are sent encoded, so that an event sent to a whole room is only encoded once.
+    def encode(self, protocol: Protocol = Protocol.JSON) -> bytes:
+        return wire.encode(self.serialize(), protocol)
+
 
 class Receivable(Event):
     @staticmethod
     @abstractmethod
-    def deserialize(_dict: dict):
+    def deserialize(data, protocol: Protocol = Protocol.JSON):
         pass
 
 
 class GameState(Sendable):
-    def __init__(self, game):
+    def __init__(self, game, player: Player):
         self.game = game
+        self.player = player
 
     @property
     def name(self) -> str:
         return "game_state"
 
     def serialize(self) -> dict:
-        return self.game.serialize()
+        return self.game.projection.state(self.player)
+
+    def encode(self, protocol: Protocol = Protocol.JSON) -> bytes:
+        return self.game.projection.encoded_state(self.player, protocol)
+
+
+class GameDelta(Sendable):
+    def __init__(self, delta: dict):
+        self.delta = delta
+
+    @property
+    def name(self) -> str:
+        return "game_delta"
+
+    def serialize(self) -> dict:
+        return self.delta
+
+
+class PrivateState(Sendable):
+    def __init__(self, version: int, private: dict):
+        self.version = version
+        self.private = private
+
+    @property
+    def name(self) -> str:
+        return "private_state"
+
+    def serialize(self) -> dict:
+        return {
+            "version": self.version,
+            **self.private,
+        }
+
+
+class BoardTopology(Sendable):
+    def __init__(self, game):
+        self.game = game
+
+    @property
+    def name(self) -> str:
+        return "board_topology"
+
+    def serialize(self) -> dict:
+        return self.game.board.serialize_topology()
+
+    def encode(self, protocol: Protocol = Protocol.JSON) -> bytes:
+        return self.game.topology_payload(protocol)
+
+
+# The expected production of every intersection, for clients that ask for it. Only sent when numpy is installed.
+class BoardAnalytics(Sendable):
+    def __init__(self, game):
+        self.game = game
+
+    @property
+    def name(self) -> str:
+        return "board_analytics"
+
+    def serialize(self) -> dict:
+        return self.game.board_analytics().serialize()
+
+    def encode(self, protocol: Protocol = Protocol.JSON) -> bytes:
+        return self.game.analytics_payload(protocol)
+
+
+# Tells a client which protocol the rest of its events are encoded with. Always sent as JSON.
+class ProtocolInfo(Sendable):
+    def __init__(self, protocol: Protocol):
+        self.protocol = protocol
+
+    @property
+    def name(self) -> str:
+        return "protocol"
+
+    def serialize(self) -> dict:
+        return {"protocol": self.protocol.value}
 
 
 class PlayerInfo(Sendable):
@@ -50,8 +132,21 @@ class PlayerInfo(Sendable):
         return self.player.serialize()
 
 
+# Tells a client why a command it sent wasn't carried out.
+class ActionError(Sendable):
+    def __init__(self, error: GameError):
+        self.error = error
+
+    @property
+    def name(self) -> str:
+        return "action_error"
+
+    def serialize(self) -> dict:
+        return self.error.serialize()
+
+
 class Place(Receivable):
-    def __init__(self, piece_type: PieceType, item: GameItem):
+    def __init__(self, piece_type: PieceType, item: int):
         self.piece_type = piece_type
         self.item = item
 
@@ -60,10 +155,15 @@ class Place(Receivable):
         return "place"
 
     @staticmethod
-    def deserialize(_dict: dict):
+    def deserialize(data, protocol: Protocol = Protocol.JSON):
+        _dict = wire.decode(data, protocol)
+        item = _dict["item"]
+        # Clients take ids from object keys, which are strings in javascript.
+        if isinstance(item, str) and item.isdigit():
+            item = int(item)
         return Place(
             PieceType(_dict["piece_type"]),
-            _dict["item"],
+            item,
         )
 
 
@@ -72,7 +172,8 @@ class BankTrade(Receivable):
         self.transaction = transaction
 
     @staticmethod
-    def deserialize(_dict: dict):
+    def deserialize(data, protocol: Protocol = Protocol.JSON):
+        _dict = wire.decode(data, protocol)
         transaction_dict = {Resource(resource_str): value for resource_str, value in _dict.items()}
         return BankTrade(Transaction(transaction_dict))
 
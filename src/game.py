@@ -1,9 +1,13 @@
+import logging
 import string
 import random
 import queue
-from typing import Dict, Optional
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, Callable, Set, List
 from enum import Enum, auto
-from flask_socketio import emit
 
 from src.board import Board
 from src import board_generator
@@ -13,22 +17,160 @@ from src.player import PlayerManager, Player
 from src import phase
 from src import error
 from src import event
+from src import hint
+from src import delta
+from src.projection import Projection
+from src.wire import Protocol
+from src import wire
 from src.piece import PieceType, House, Road
 from src.resource import Transaction
 from src import victory
+from src.action_log import ActionLog
+from src.action import Action
+from src import analytics
+from src.dice import D6
+from src.payout import PayoutIndex
+from src.market import Bank
+from src.journal import Journal
+
+logger = logging.getLogger(__name__)
+
+# Sends an event to a socket or room: emitter(name, payload, to=...)
+Emitter = Callable[..., None]
+
+
+# How long games may stay in memory without being used, in seconds. None keeps them forever.
+class EvictionPolicy:
+    def __init__(
+            self,
+            lobby_ttl: Optional[float] = None,
+            game_ttl: Optional[float] = None,
+            finished_ttl: Optional[float] = None,
+            max_games: Optional[int] = None,
+            interval: float = 60,
+    ):
+        self.lobby_ttl = lobby_ttl
+        self.game_ttl = game_ttl
+        self.finished_ttl = finished_ttl
+        # Beyond this many games the least recently used ones are evicted, whatever their TTL.
+        self.max_games = max_games
+        # How often to look for expired games.
+        self.interval = interval
+
+    def ttl(self, game: "Goatan") -> Optional[float]:
+        if game.state == GameState.LOBBY:
+            return self.lobby_ttl
+        if game.finished:
+            return self.finished_ttl
+        return self.game_ttl
 
 
 class GameManager:
-    def __init__(self):
-        self.games: Dict[str, Goatan] = {}
+    def __init__(
+            self,
+            emitter: Optional[Emitter] = None,
+            snapshots=None,
+            logs=None,
+            eviction: Optional[EvictionPolicy] = None,
+    ):
+        # Least recently used first.
+        self.games: OrderedDict[str, Goatan] = OrderedDict()
+        self.emitter = emitter
+        self.snapshots = snapshots
+        self.logs = logs
+        self.eviction = eviction if eviction is not None else EvictionPolicy()
+
+        self._last_used: Dict[str, float] = {}
+        # Games with connected sockets are never evicted, since the sockets would keep using the evicted copy.
+        self._retained: Dict[str, int] = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.RLock()
 
     def create_game(self):
-        game = Goatan()
-        self.games[game.id] = game
+        game = Goatan(self.emitter, self.snapshots, self.logs)
+        self._add(game)
         return game
 
+    def _add(self, game: "Goatan"):
+        if game.detached:
+            raise error.InvalidState("Clones can't be registered")
+        with self._lock:
+            self.games[game.id] = game
+            self._last_used[game.id] = time.monotonic()
+        self._sweep_if_due()
+
     def get(self, id_: str):
-        return self.games.get(id_)
+        with self._lock:
+            game = self.games.get(id_)
+            if game is not None:
+                self.games.move_to_end(id_)
+                self._last_used[id_] = time.monotonic()
+                return game
+
+            # Games that were running before a restart, or that were evicted, are loaded the first time they're
+            # needed. Logs are written as actions happen while snapshots are written in the background, so a game's
+            # log is never behind its snapshot.
+            if self.logs is not None:
+                game = self.logs.restore(id_, self.emitter, self.snapshots)
+            if game is None and self.snapshots is not None:
+                game = self.snapshots.restore(id_, self.emitter, self.logs)
+
+        if game is not None:
+            self._add(game)
+        return game
+
+    def retain(self, id_: str):
+        with self._lock:
+            self._retained[id_] = self._retained.get(id_, 0) + 1
+
+    def release(self, id_: str):
+        with self._lock:
+            count = self._retained.pop(id_, 0) - 1
+            if count > 0:
+                self._retained[id_] = count
+            self._last_used[id_] = time.monotonic()
+
+    def _sweep_if_due(self):
+        if time.monotonic() - self._last_sweep >= self.eviction.interval:
+            self.sweep()
+
+    def sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            self._last_sweep = now
+
+            expired = []
+            for id_, game in self.games.items():
+                ttl = self.eviction.ttl(game)
+                if ttl is not None and now - self._last_used[id_] >= ttl:
+                    expired.append(id_)
+
+            excess = len(self.games) - len(expired) - (self.eviction.max_games or len(self.games))
+            for id_ in self.games:
+                if excess <= 0:
+                    break
+                if id_ not in expired:
+                    expired.append(id_)
+                    excess -= 1
+
+            for id_ in expired:
+                if id_ not in self._retained:
+                    self._evict(id_)
+
+    def _evict(self, id_: str):
+        game = self.games.pop(id_)
+        self._last_used.pop(id_)
+
+        # Evicted games can be loaded again from their log or snapshot. The log is already up to date, so only games
+        # without one need a final snapshot.
+        if self.logs is None and self.snapshots is not None:
+            self.snapshots.save(game)
+        game.close()
+        logger.info(f"evicted game {id_}")
+
+    # Where to find a game that another worker is responsible for, see src.cluster. Every game is local by default.
+    def owner_url(self, id_: str) -> Optional[str]:
+        return None
 
 
 class GameState(Enum):
@@ -39,17 +181,46 @@ class GameState(Enum):
 
 
 class Goatan(GameItem):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, emitter: Optional[Emitter] = None, snapshots=None, logs=None, seed: Optional[int] = None):
+        self.id = self._generate_id()
+
+        # Games without an emitter run headless, e.g. in simulations.
+        self._emitter = emitter
+        self._snapshots = snapshots
+        self._logs = logs
+        self._log: Optional[ActionLog] = None
+
+        # Everything random in a game is drawn from its own generator, so that its log can be replayed exactly.
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.random = random.Random(self.seed)
 
-        self.players = PlayerManager()
+        self.players = PlayerManager(self.random)
         self.state = GameState.LOBBY
 
         self.board = None
+        self._topology_payloads: Dict[Protocol, bytes] = {}
+        self._analytics: Optional[analytics.BoardAnalytics] = None
+        self._analytics_payloads: Dict[Protocol, bytes] = {}
+        # The protocols of the sockets that connected to the game. Broadcasts are encoded once for each of them.
+        self.protocols: Set[Protocol] = {Protocol.JSON}
+        # The number of sockets each player has connected to the game. Private changes are only worked out for the
+        # players that would be sent them.
+        self._watchers: Dict[Player, int] = {}
         self.phases = []
         self.phase: Optional[phase.GamePhase] = None
+        self._legal_moves: Optional[hint.LegalMoves] = None
+        self._payouts: Optional[PayoutIndex] = None
+        self._bank: Optional[Bank] = None
         self.win_condition = victory.VictoryPoint(5)
 
+        # Incremented on every synchronized change to the game state.
+        self.version = 0
+        self._deltas: Optional[delta.DeltaTracker] = None
+        self.projection = Projection(self)
+
+        # Only clones keep a journal, see clone().
+        self.journal: Optional[Journal] = None
+
     @staticmethod
     def _generate_id():
         return "".join([
@@ -57,35 +228,228 @@ class Goatan(GameItem):
             for _ in range(8)
         ])
 
-    def emit_event(self, event_: event.Sendable, to=None):
+    # Sends an event to a socket or room that uses the given protocol, or to everyone in the game if there's no target.
+    def emit_event(self, event_: event.Sendable, to=None, protocol: Protocol = Protocol.JSON):
+        if self._emitter is None:
+            return
         if to is None:
-            to = self.id
-        emit(
+            for protocol_ in self.protocols:
+                self.emit_event(event_, self.room(protocol_), protocol_)
+            return
+        self._emitter(
             event_.name,
-            event_.serialize(),
+            event_.encode(protocol),
             to=to,
         )
 
+    # Sockets join the rooms of their protocol, so that each room is sent a single encoding of every event.
+    def room(self, protocol: Protocol = Protocol.JSON) -> str:
+        if protocol == Protocol.JSON:
+            return self.id
+        return f"{self.id}:{protocol.value}"
+
+    def use_protocol(self, protocol: Protocol):
+        self.protocols.add(protocol)
+
+    def watch(self, player: Player):
+        self._watchers[player] = self._watchers.get(player, 0) + 1
+
+    def unwatch(self, player: Player):
+        watchers = self._watchers.get(player, 0) - 1
+        if watchers > 0:
+            self._watchers[player] = watchers
+        else:
+            self._watchers.pop(player, None)
+
+    def watched(self, player: Player) -> bool:
+        return player in self._watchers
+
+    @property
+    def log(self) -> ActionLog:
+        # Opened on first use rather than on construction, since restored games only get their id afterwards.
+        if self._log is None:
+            self._log = self._logs.open(self.id) if self._logs is not None else ActionLog()
+            if len(self._log) == 0:
+                self._log.append({"action": "create", "version": self.version, "game": self.id, "seed": self.seed})
+        return self._log
+
+    def join(self, user_id: str) -> Optional[Player]:
+        if self.players.player_for_user(user_id) is not None:
+            return None
+
+        player = self.players.register_user(user_id)
+        self.log.append({"action": "join", "version": self.version, "user": user_id})
+        return player
+
+    def leave(self, player: Player):
+        self.players.remove_player(player)
+        self.log.append({"action": "leave", "version": self.version, "user": player.user_id})
+
     def initialize(self, **kwargs):
         assert self.state == GameState.LOBBY
 
         radius = 2
         if "radius" in kwargs:
-            radius = min(int(kwargs["radius"]), 10)
-        generator = board_generator.StandardGenerator(radius=radius)
-        self.board = generator.generate()
+            radius = min(int(kwargs["radius"]), board_generator.MAX_RADIUS)
+        # Settings from the lobby form are strings, and checkboxes are only sent when they're checked.
+        balanced = kwargs.get("balanced") in (True, "true", "on")
+        generator = board_generator.StandardGenerator(radius=radius, rng=self.random, balanced=balanced)
 
-        self.state = GameState.PLACEMENT
         self.players.finalize()
+        self.start(generator.generate())
+        if self._emitter is not None:
+            self._deltas = delta.DeltaTracker(self)
+        self.log.append({"action": "initialize", "version": self.version, "settings": kwargs})
+
+        if self._snapshots is not None:
+            self._snapshots.save(self)
+
+    # Sets up the phases for a board. The players must be finalized.
+    def start(self, board: Board):
+        self.board = board
+
+        self.state = GameState.PLACEMENT
+        self.win_condition.attach(self.board)
+        self._start_phases(hint.LegalMoves(self.board, self.players), PayoutIndex(self.board), Bank())
+
+    # The phases follow the board through its legal moves and payouts, which clones copy from the original game.
+    def _start_phases(self, legal_moves: hint.LegalMoves, payouts: PayoutIndex, bank: Bank):
+        self._legal_moves = legal_moves
+        self._payouts = payouts
+        self._bank = bank
         self.phases = [
-            phase.Placement(self.board, self.players),
-            phase.Game(self.board, self.players, self.win_condition),
+            phase.Placement(self.board, self.players, legal_moves),
+            phase.Game(self.board, self.players, self.win_condition, legal_moves, D6(2, self.random), bank, payouts),
             phase.Finished(self.board, self.players, self.win_condition),
         ]
         self.phase = self.phases.pop(0)
 
+    # Connects a game that was rebuilt headless, e.g. by replaying its log, to the server's stores.
+    def resume(self, emitter: Optional[Emitter] = None, snapshots=None, logs=None):
+        if self.detached:
+            raise error.InvalidState("Clones can't be connected to the server")
+        self._emitter = emitter
+        self._snapshots = snapshots
+        self._logs = logs
+        if logs is not None:
+            self._log = logs.open(self.id)
+
+    @property
+    def finished(self) -> bool:
+        return self.board is not None and self.win_condition.victor(self.board) is not None
+
+    # The actions the player can take, e.g. for bots. Only the active player has any.
+    def legal_actions(self, player: Player) -> List[Action]:
+        if self.phase is None or self.finished:
+            return []
+        return self.phase.legal_actions(player)
+
+    # Releases the game's files once it's no longer kept in memory.
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def restored(self):
+        # Clients can't rely on anything they were sent before the game was restored.
+        self.version += 1
+        if self.board is not None:
+            self._deltas = delta.DeltaTracker(self)
+
+    # A headless copy of a started game that can take back its actions, e.g. for bots searching ahead. The tiles and the
+    # topology are shared. The piece tables are copied, and so are the listeners' indexes, rather than being rebuilt by
+    # placing the pieces again. That makes cloning cost a copy of the piece tables and the open intersections, plus
+    # work in proportion to the pieces and legal moves. The clone's own log only has the actions taken on it, under the
+    # clone's own id, see detached.
+    def clone(self) -> "Goatan":
+        if self.board is None:
+            raise error.InvalidState("Only started games can be cloned")
+
+        game = Goatan(seed=self.seed)
+        game.random.setstate(self.random.getstate())
+        game.version = self.version
+
+        players = {}
+        for player in self.players:
+            copy = Player(player.id, player.user_id, player.name, player.color)
+            copy.resources = player.resources.copy()
+            players[player] = copy
+        game.players.restore(list(players.values()), self.players.available_colors, self.players.finalized)
+
+        # Listeners are cloned in the order they subscribed to the original board.
+        board = self.board.clone(players)
+        game.board = board
+        game.state = self.state
+        game.win_condition = self.win_condition.clone(board, players)
+        game._start_phases(
+            self._legal_moves.clone(board, players), self._payouts.clone(board, players), self._bank.clone(),
+        )
+
+        while len(game.phases) > len(self.phases):
+            game.phase = game.phases.pop(0)
+        game.phase.load_state(self.phase.save_state())
+
+        game.journal = Journal()
+        board.journal = game.journal
+        for player in game.players:
+            player.journal = game.journal
+        return game
+
+    # Clones are detached from the server. They have their own id, so they can't be mistaken for the game they were
+    # cloned from, and can't be registered with a GameManager or connected to sockets and stores.
+    @property
+    def detached(self) -> bool:
+        return self.journal is not None
+
+    # Takes back the last action of a clone. Only the changes the action made are reverted.
+    def undo(self):
+        if self.journal is None or not self.journal.undo():
+            raise error.InvalidAction("Nothing to undo")
+        # Versions are reused after an undo, so whatever was cached for them is stale.
+        self.projection = Projection(self)
+
+    # Everything an action changes outside the board and the players' resources, which journal their own changes. The
+    # phase's turn state is small enough to be restored as a whole. Only rolls draw from the game's generator, whose
+    # state is comparatively expensive to save.
+    def _checkpoint(self, draws: bool):
+        self.journal.mark()
+
+        phase_ = self.phase
+        phases = self.phases.copy()
+        phase_state = phase_.save_state()
+        state = self.state
+        version = self.version
+        log_length = len(self.log.entries)
+        random_state = self.random.getstate() if draws else None
+
+        def restore():
+            self.phase = phase_
+            self.phases = phases
+            phase_.load_state(phase_state)
+            self.state = state
+            self.version = version
+            del self.log.entries[log_length:]
+            if random_state is not None:
+                self.random.setstate(random_state)
+
+        self.journal.record(restore)
+
+    # Actions that fail halfway through leave a journaled game as it was.
+    @contextmanager
+    def _undoable(self, draws: bool = False):
+        if self.journal is None:
+            yield
+            return
+
+        self._checkpoint(draws)
+        try:
+            yield
+        except Exception:
+            self.journal.undo()
+            raise
+
     def end_turn(self, player: Player):
-        print(f"end turn for {player.id}")
+        logger.info(f"end turn for {player.id}")
 
         if self.phase is None:
             raise error.InvalidState()
@@ -93,11 +457,12 @@ class Goatan(GameItem):
         if player != self.phase.active_player:
             raise error.InvalidAction(f"{player.id} is not the active player")
 
-        self.phase.end_turn()
-        self._synchronize_game_state()
+        with self._undoable():
+            self.phase.end_turn()
+            self._synchronize_game_state(player, {"action": "end_turn", "user": player.user_id})
 
-    def place(self, player: Player, piece_type: PieceType, location_id: str):
-        print(f"place {piece_type} for {player.id} on id {location_id}")
+    def place(self, player: Player, piece_type: PieceType, location_id: int):
+        logger.info(f"place {piece_type} for {player.id} on id {location_id}")
 
         if self.phase.active_player != player:
             raise error.InvalidAction(f"{player.id} is not the active player")
@@ -110,41 +475,137 @@ class Goatan(GameItem):
         if piece is None:
             raise error.InvalidAction(f"Invalid piece type {piece_type}")
 
-        self.phase.place_piece(piece, location_id)
-        self._synchronize_game_state()
+        with self._undoable():
+            self.phase.place_piece(piece, location_id)
+            self._synchronize_game_state(player, {
+                "action": "place", "user": player.user_id, "piece_type": piece_type.value, "location": location_id,
+            })
 
     def roll(self, player: Player):
-        print(f"roll for {player.id}")
+        logger.info(f"roll for {player.id}")
 
         if self.phase.active_player != player:
             raise error.InvalidAction(f"{player.id} is not the active player")
 
-        self.phase.roll()
-        self._synchronize_game_state()
+        with self._undoable(draws=True):
+            self.phase.roll()
+            self._synchronize_game_state(player, {
+                "action": "roll", "user": player.user_id, "result": self.phase.roll_result,
+            })
 
     def bank_trade(self, player: Player, transaction: Transaction):
-        print(f"bank trade for {player.id}")
+        logger.info(f"bank trade for {player.id}")
 
         if self.phase.active_player != player:
             raise error.InvalidAction(f"{player.id} is not the active player")
 
-        self.phase.bank_trade(transaction)
-        self._synchronize_game_state()
-
-    def _synchronize_game_state(self):
+        with self._undoable():
+            self.phase.bank_trade(transaction)
+            self._synchronize_game_state(player, {
+                "action": "bank_trade", "user": player.user_id, "transaction": transaction.serialize(),
+            })
+
+    # Whether the search of a longest road ran out of steps when a piece was placed, see LongestRoad.refine.
+    @property
+    def refining(self) -> bool:
+        if self.board is None or self.finished:
+            return False
+        longest_road = self.win_condition.longest_road()
+        return longest_road is not None and longest_road.refinable
+
+    # Searches those longest roads further, between actions. It can hand over the longest road, so it's logged and
+    # replayed like an action, but it's nobody's action, so nobody wins by it.
+    def refine_longest_road(self):
+        if not self.refining:
+            return
+        logger.info("refine longest road")
+
+        with self._undoable():
+            self.win_condition.longest_road().refine()
+            self._synchronize_game_state(None, {"action": "refine_longest_road"})
+
+    def topology_payload(self, protocol: Protocol = Protocol.JSON) -> bytes:
+        # The topology never changes after initialization, so it's encoded once and sent to each client as is.
+        payload = self._topology_payloads.get(protocol)
+        if payload is None:
+            payload = wire.encode(self.board.serialize_topology(), protocol)
+            self._topology_payloads[protocol] = payload
+        return payload
+
+    # The board's production statistics, computed the first time they're needed. None without numpy.
+    def board_analytics(self) -> Optional[analytics.BoardAnalytics]:
+        if self._analytics is None and self.board is not None and analytics.available():
+            self._analytics = analytics.BoardAnalytics(self.board.topology, self.board.tile_list, seed=self.seed)
+        return self._analytics
+
+    def analytics_payload(self, protocol: Protocol = Protocol.JSON) -> bytes:
+        payload = self._analytics_payloads.get(protocol)
+        if payload is None:
+            payload = wire.encode(self.board_analytics().serialize(), protocol)
+            self._analytics_payloads[protocol] = payload
+        return payload
+
+    def _synchronize_game_state(self, player: Optional[Player], entry: dict):
+        if player is not None:
+            self.win_condition.action_taken(player)
         if self.phase.finished:
             self.phase = self.phases.pop(0)
-        self.emit_event(event.GameState(self))
-
+        self.version += 1
+        self.log.append({**entry, "version": self.version})
+
+        # Changes keep accumulating in the tracker until there's someone to send them to. Private changes go out first,
+        # so that clients can apply them together with the delta of the same version.
+        if self._emitter is not None:
+            for player, private in self._deltas.private_changes().items():
+                for protocol in self.protocols:
+                    self.emit_event(
+                        event.PrivateState(self.version, private), self.player_room(player, protocol), protocol,
+                    )
+            self.emit_event(event.GameDelta(self._deltas.delta()))
+
+        if self._snapshots is not None:
+            self._snapshots.save(self)
+
+    # The room of all of a player's sockets, for what only that player may see.
+    def player_room(self, player: Player, protocol: Protocol = Protocol.JSON) -> str:
+        return f"{self.room(protocol)}/{player.id}"
+
+    # Everything at once, e.g. for simulations. Clients are sent their projection instead, see src.projection.
     def serialize(self):
         return {
-            "board": self.board.serialize(),
+            **self.serialize_public(),
             "hints": self.phase.serialize_hints(),
+            "bank_trades": self.phase.serialize_bank_trades(),
+        }
+
+    def serialize_public(self):
+        return {
+            "version": self.version,
+            "pieces": self.board.serialize_pieces(),
             "players": self.players.serialize(),
+            **self.serialize_status(),
+        }
+
+    # Only the active player can act, so everyone else's hints are empty.
+    def serialize_private(self, player: Player):
+        if player == self.phase.active_player:
+            hints = self.phase.serialize_hints()
+        else:
+            hints = {"intersections": {}, "edges": {}}
+
+        return {
+            "hints": hints,
+            "bank_trades": {player.id: self.phase.serialize_player_bank_trades(player)},
+        }
+
+    def serialize_status(self):
+        longest_road = self.win_condition.longest_road()
+        return {
             "active_player": self.phase.active_player.id,
             "roll": self.phase.roll_result,
             "expecting_roll": self.phase.expecting_roll,
             "phase": self.phase.name(),
-            "bank_trades": self.phase.serialize_bank_trades(),
+            "points": self.win_condition.serialize(),
+            "longest_road": longest_road.serialize() if longest_road is not None else None,
             "victor": victor.serialize() if (victor := self.win_condition.victor(self.board)) is not None else None
         }
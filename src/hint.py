@@ -0,0 +1,120 @@
+from typing import Dict, Set, Iterable
+
+from src.board import Board, BoardListener
+from src.piece import Settlement, Road, PieceType
+from src.player import Player, PlayerManager
+
+
+# Legal placement locations per player, kept up to date from board placements. Only the board is considered here;
+# turn state and affordability are checked by the phases when the hints are read.
+class LegalMoves(BoardListener):
+    def __init__(self, board: Board, players: PlayerManager):
+        self._board = board
+
+        # Intersections that don't border a house.
+        self.open_intersections: Set[int] = set()
+
+        # Open intersections that border a road of the player.
+        self._houses: Dict[Player, Set[int]] = {player: set() for player in players}
+
+        # Empty edges that border a settlement or road of the player.
+        self._roads: Dict[Player, Set[int]] = {player: set() for player in players}
+
+        # Incremented whenever the legal moves of the player change.
+        self._versions: Dict[Player, int] = {player: 0 for player in players}
+
+        # Nothing borders a piece on an empty board, so every intersection is open and there are no legal moves yet.
+        if len(board.settled_intersections) == 0 and len(board.settled_edges) == 0:
+            self.open_intersections.update(range(board.topology.intersection_count))
+        else:
+            for intersection in range(board.topology.intersection_count):
+                self._refresh_intersection(intersection)
+            for edge in range(board.topology.edge_count):
+                self._refresh_edge(edge)
+
+        board.subscribe(self)
+
+    # The legal moves of a cloned game, copied rather than worked out again from the clone's board.
+    def clone(self, board: Board, players: Dict[Player, Player]) -> "LegalMoves":
+        legal_moves = LegalMoves.__new__(LegalMoves)
+        legal_moves._board = board
+        legal_moves.open_intersections = self.open_intersections.copy()
+        legal_moves._houses = {players[player]: houses.copy() for player, houses in self._houses.items()}
+        legal_moves._roads = {players[player]: roads.copy() for player, roads in self._roads.items()}
+        legal_moves._versions = {players[player]: version for player, version in self._versions.items()}
+        board.subscribe(legal_moves)
+        return legal_moves
+
+    def houses(self, player: Player) -> Set[int]:
+        return self._houses[player]
+
+    def roads(self, player: Player) -> Set[int]:
+        return self._roads[player]
+
+    def version(self, player: Player) -> int:
+        return self._versions[player]
+
+    @staticmethod
+    def _update(locations: Set[int], location: int, legal: bool) -> bool:
+        if legal == (location in locations):
+            return False
+
+        if legal:
+            locations.add(location)
+        else:
+            locations.remove(location)
+        return True
+
+    def _refresh_intersection(self, intersection: int):
+        board = self._board
+
+        open_ = not board.intersection_borders_house(intersection)
+        self._update(self.open_intersections, intersection, open_)
+
+        for player, houses in self._houses.items():
+            legal = open_ and board.intersection_borders_road_for_player(intersection, player)
+            if self._update(houses, intersection, legal):
+                self._versions[player] += 1
+
+    def _refresh_edge(self, edge: int):
+        board = self._board
+
+        empty = board.roads[edge] is None
+        for player, roads in self._roads.items():
+            legal = empty and board.edge_borders_settlement_or_road_for_player(edge, player)
+            if self._update(roads, edge, legal):
+                self._versions[player] += 1
+
+    def settlement_set(self, intersection: int, settlement: Settlement):
+        topology = self._board.topology
+
+        # The settlement closes its own intersection and the neighboring ones, and opens its edges to its owner.
+        self._refresh_intersection(intersection)
+        for neighbor in topology.neighbors_of_intersection(intersection):
+            self._refresh_intersection(neighbor)
+        for edge in topology.edges_of_intersection(intersection):
+            self._refresh_edge(edge)
+
+    def road_set(self, edge: int, road: Road):
+        topology = self._board.topology
+
+        # The road fills its own edge, and opens its intersections and neighboring edges to its owner.
+        self._refresh_edge(edge)
+        for intersection in topology.intersections_of_edge(edge):
+            self._refresh_intersection(intersection)
+        for neighbor in topology.neighbors_of_edge(edge):
+            self._refresh_edge(neighbor)
+
+    def serialize(self, houses: Iterable[int], roads: Iterable[int]):
+        return {
+            "intersections": {
+                intersection: {
+                    "type": PieceType.HOUSE.value,
+                } for intersection in sorted(houses)
+            },
+            "edges": {
+                edge: {
+                    "type": PieceType.ROAD.value,
+                } for edge in sorted(roads)
+            },
+        }
@@ -1,20 +1,27 @@
-import pprint
-from flask_socketio import Namespace, emit, ConnectionRefusedError, join_room, send
+import logging
+from flask_socketio import Namespace, ConnectionRefusedError, join_room
 from flask import request
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Callable, Hashable
 from abc import ABCMeta, abstractmethod
 
 from src.game import GameManager, Goatan, GameState
+from src.actor import ActorPool
 from src.user import User
 from src.player import Player
 from src import error
 from src import event
+from src import bot
+from src.wire import Protocol
+
+logger = logging.getLogger(__name__)
 
 
 class Authenticated:
-    def __init__(self, game: Goatan, player: Player):
+    def __init__(self, game: Goatan, player: Optional[Player], protocol: Protocol = Protocol.JSON):
         self.game: Goatan = game
-        self.player: Player = player
+        # Lobby sockets only get their player once they've joined the game on its actor.
+        self.player: Optional[Player] = player
+        self.protocol: Protocol = protocol
 
     @staticmethod
     def _authenticate(token: dict, games: GameManager):
@@ -31,15 +38,34 @@ class Authenticated:
         if player is None:
             return None
 
-        return Authenticated(game, player)
+        return Authenticated(game, player, Protocol.negotiate(token.get("protocol")))
+
+    @staticmethod
+    def _check_owner(token: dict, games: GameManager):
+        # Clients that reached the wrong worker are told which one owns their game, so they can connect there.
+        owner_url = games.owner_url(token.get("game", ""))
+        if owner_url is not None:
+            raise ConnectionRefusedError({"message": "Game is owned by another worker", "owner": owner_url})
 
     @staticmethod
     def from_token(token: dict, games: GameManager):
+        Authenticated._check_owner(token, games)
         auth = Authenticated._authenticate(token, games)
         if auth is None:
             raise ConnectionRefusedError("Invalid user for game")
         return auth
 
+    # Users connecting to a lobby don't need to be in the game yet, since they join it once they're connected.
+    @staticmethod
+    def for_lobby(token: dict, games: GameManager):
+        Authenticated._check_owner(token, games)
+        game_id = token.get("game")
+        user_id = token.get("user")
+        game = games.get(game_id) if game_id is not None else None
+        if game is None or user_id is None:
+            raise ConnectionRefusedError("Invalid user for game")
+        return Authenticated(game, game.players.player_for_user(user_id))
+
     def __str__(self):
         return f"{self.game}, {self.player}"
 
@@ -47,157 +73,281 @@ class Authenticated:
         return str(self)
 
 
-class AuthenticatedNamespace(Namespace, metaclass=ABCMeta):
-    def __init__(self, games: GameManager):
+# The sockets of a namespace and the games they belong to. Shared by the flask namespaces below and the asyncio ones in
+# src.async_interface.
+class SocketRegistry:
+    def __init__(self, games: GameManager, actors: ActorPool):
         self.games: GameManager = games
+        self.actors: ActorPool = actors
         self.auths: Dict[str, Authenticated] = {}  # sid : auth
 
-        super().__init__(self.namespace_str)
-
-    @property
-    @abstractmethod
-    def namespace_str(self) -> str:
-        pass
-
     def register_socket(self, sid: str, token: dict) -> Authenticated:
-        auth = Authenticated.from_token(token, self.games)
+        return self._register(sid, Authenticated.from_token(token, self.games))
+
+    def _register(self, sid: str, auth: Authenticated) -> Authenticated:
         self.auths[sid] = auth
+        self.games.retain(auth.game.id)
         return auth
 
     def unregister_socket(self, sid: str):
         if sid in self.auths:
-            self.auths.pop(sid)
+            auth = self.auths.pop(sid)
+            self.games.release(auth.game.id)
 
     def get_auth(self, sid: str) -> Authenticated:
         return self.auths.get(sid)
 
+    # Sends an event in the namespace from any thread, e.g. from a command on an actor's worker.
+    @abstractmethod
+    def _emit(self, name: str, payload, to: str):
+        pass
 
-class GoatanNamespace(AuthenticatedNamespace):
-    def __init__(self, games: GameManager):
-        super().__init__(games)
+    # Tells the socket that sent a command why it failed.
+    def report_error(self, sid: str, game: Goatan, e: error.GameError):
+        auth = self.get_auth(sid)
+        game.emit_event(event.ActionError(e), to=sid, protocol=auth.protocol if auth is not None else Protocol.JSON)
+
+    # Everything that touches a game runs on its actor, one command at a time. Handlers don't wait for their commands,
+    # so events for other games keep being handled in the meantime. Commands that fail or are refused are reported to
+    # the socket that sent them, if any, and logged otherwise. Required commands are never refused, see
+    # ActorPool.submit.
+    def submit(self, game: Goatan, action: Callable[[], None], key: Optional[Hashable] = None, sid: Optional[str] = None,
+               required: bool = False):
+        def command():
+            try:
+                action()
+            except error.GameError as e:
+                self._reject(sid, game, e)
+                return
+            except Exception:
+                logger.exception(f"command for {game.id} failed")
+                if sid is not None:
+                    self.report_error(sid, game, error.InvalidState("The server failed to handle the command"))
+                return
+
+            # Only a command that went through can have handed the turn to a bot, or left a longest road to search
+            # further, which is done in a command of its own so that no action waits for it.
+            if bot.waiting(game):
+                self.submit_bots(game)
+            if game.refining:
+                self.submit(game, game.refine_longest_road, key=("refine", game.id))
 
-    @property
-    def namespace_str(self) -> str:
-        return "/goatan"
+        try:
+            self.actors.submit(game.id, command, key, required)
+        except error.GameError as e:
+            self._reject(sid, game, e)
+
+    def _reject(self, sid: Optional[str], game: Goatan, e: error.GameError):
+        if sid is not None:
+            self.report_error(sid, game, e)
+        else:
+            logger.warning(f"command for {game.id} was rejected: {e}")
+
+    # Bots take their turns on the game's actor like everyone else, one action per command, so that the other players'
+    # commands are interleaved with theirs. Each of their commands submits the next one while it's still a bot's turn.
+    # A bot whose action failed isn't submitted again, since it would only fail the same way, and the failure is logged
+    # instead. Bot commands are keyed, so they can't pile up, and required, so that a busy game can't drop its bots.
+    def submit_bots(self, game: Goatan):
+        self.submit(game, lambda: bot.play(game), key=("bot", game.id), required=True)
+
+    # The game namespace's handlers, shared by the flask and asyncio namespaces. Sockets are registered and put in the
+    # rooms of their game first, see game_rooms.
+    @staticmethod
+    def game_rooms(auth: Authenticated) -> List[str]:
+        return [auth.game.room(auth.protocol), auth.game.player_room(auth.player, auth.protocol)]
+
+    def send_state(self, sid: str, token: dict):
+        auth = self.get_auth(sid)
+        game = auth.game
+
+        def send():
+            game.use_protocol(auth.protocol)
+            game.watch(auth.player)
+            game.emit_event(event.ProtocolInfo(auth.protocol), to=sid)
+            game.emit_event(event.PlayerInfo(auth.player), to=sid, protocol=auth.protocol)
+
+            # Reconnecting clients can keep applying deltas if they're still up to date. Restored games start a
+            # version ahead of their snapshot, so clients of a restored game always reload the board.
+            if token.get("version") != game.version:
+                game.emit_event(event.BoardTopology(game), to=sid, protocol=auth.protocol)
+                if token.get("analytics") and game.board_analytics() is not None:
+                    game.emit_event(event.BoardAnalytics(game), to=sid, protocol=auth.protocol)
+                game.emit_event(event.GameState(game, auth.player), to=sid, protocol=auth.protocol)
+
+        # Connecting clients are left on a blank board without their state, so it's sent however busy the game is.
+        self.submit(game, send, key=("connect", sid), sid=sid, required=True)
+
+    def leave_game(self, sid: str):
+        auth = self.get_auth(sid)
+        self.unregister_socket(sid)
+        if auth is not None:
+            self.submit(auth.game, lambda: auth.game.unwatch(auth.player), required=True)
+
+    def sync(self, sid: str):
+        auth = self.get_auth(sid)
+        # Repeated requests from a client that's behind only need to be answered once.
+        self.submit(
+            auth.game,
+            lambda: auth.game.emit_event(event.GameState(auth.game, auth.player), to=sid, protocol=auth.protocol),
+            key=("sync", sid),
+            sid=sid,
+            required=True,
+        )
 
-    def on_connect(self, token):
-        print("client connected")
-        print(token)
-        # print(f"session id: {request.sid}")
+    def end_turn(self, sid: str):
+        auth = self.get_auth(sid)
+        self.submit(auth.game, lambda: auth.game.end_turn(auth.player), key=("end_turn", auth.player), sid=sid)
 
-        auth = self.register_socket(request.sid, token)
-        join_room(auth.game.id, namespace=self.namespace)
+    def place(self, sid: str, data):
+        auth = self.get_auth(sid)
+        place = event.Place.deserialize(data, auth.protocol)
+        self.submit(auth.game, lambda: auth.game.place(auth.player, place.piece_type, place.item), sid=sid)
 
-        auth.game.emit_event(event.PlayerInfo(auth.player), to=request.sid)
-        auth.game.emit_event(event.GameState(auth.game))
+    def roll(self, sid: str):
+        auth = self.get_auth(sid)
+        self.submit(auth.game, lambda: auth.game.roll(auth.player), key=("roll", auth.player), sid=sid)
 
-    def on_disconnect(self):
-        self.unregister_socket(request.sid)
+    def bank_trade(self, sid: str, data):
+        auth = self.get_auth(sid)
+        bank_trade = event.BankTrade.deserialize(data, auth.protocol)
+        self.submit(auth.game, lambda: auth.game.bank_trade(auth.player, bank_trade.transaction), sid=sid)
 
-    def on_end_turn(self):
-        auth = self.get_auth(request.sid)
+    # Fills the seats asked for in the lobby's settings with bots before the game starts.
+    @staticmethod
+    def start_game(game: Goatan, settings: dict):
+        bots = settings.pop("bots", None)
+        kind = settings.pop("bot", "greedy")
+        if bots:
+            bot.fill_seats(game, int(bots), kind)
+        game.initialize(**settings)
+
+
+# The lobby's sockets, shared by the flask and asyncio lobby namespaces. Joining, leaving and starting the game all run
+# on the game's actor like any other command, and everyone in the lobby is sent the outcome from there. Lobby events
+# aren't encoded, since lobbies don't negotiate a protocol.
+class LobbyRegistry(SocketRegistry):
+    def report_error(self, sid: str, game: Goatan, e: error.GameError):
+        self._emit("action_error", e.serialize(), to=sid)
+
+    def register_lobby_socket(self, sid: str, token: dict) -> Authenticated:
+        return self._register(sid, Authenticated.for_lobby(token, self.games))
+
+    # Sockets should be in the lobby's room by now, so that they're sent everyone that's in the game once they've joined.
+    def join_lobby(self, sid: str, auth: Authenticated, user_id: str):
+        game = auth.game
+
+        def join():
+            if game.players.player_for_user(user_id) is None:
+                if game.state != GameState.LOBBY:
+                    raise error.InvalidState("The game has already started")
+                game.join(user_id)
+            auth.player = game.players.player_for_user(user_id)
+
+            self._emit("player_id", {"player_id": auth.player.id}, to=sid)
+            self._emit("player_update", game.players.serialize(), to=game.id)
+
+        self.submit(game, join, key=("join", sid), sid=sid, required=True)
+
+    def leave_lobby(self, sid: str):
+        auth = self.get_auth(sid)
+        if auth is None:
+            return
+        self.unregister_socket(sid)
 
-        try:
-            auth.game.end_turn(auth.player)
-        except error.InvalidAction as e:
-            # TODO: return message
-            print(e.message())
-
-    def on_place(self, _dict):
-        auth = self.get_auth(request.sid)
-        place = event.Place.deserialize(_dict)
-        try:
-            auth.game.place(auth.player, place.piece_type, place.item)
-        except error.InvalidAction as e:
-            print(e.message())
+        def leave():
+            # Players stay in games that have started, and sockets that never joined have nothing to leave.
+            if auth.game.state != GameState.LOBBY or auth.player is None:
+                return
+            auth.game.leave(auth.player)
+            self._emit("player_update", auth.game.players.serialize(), to=auth.game.id)
 
-    def on_roll(self):
-        auth = self.get_auth(request.sid)
-        try:
-            auth.game.roll(auth.player)
-        except error.InvalidAction as e:
-            print(e.message())
+        self.submit(auth.game, leave, key=("leave", sid), required=True)
 
-    def on_bank_trade(self, _dict):
-        auth = self.get_auth(request.sid)
-        bank_trade = event.BankTrade.deserialize(_dict)
-        try:
-            auth.game.bank_trade(auth.player, bank_trade.transaction)
-        except error.InvalidAction as e:
-            print(e.message())
+    def init_game(self, sid: str, settings: list):
+        init_args = {}
+        for setting in settings:
+            init_args[setting["name"]] = setting["value"]
+        logger.debug(f"game init for {sid}: {init_args}")
+
+        auth = self.get_auth(sid)
+        game = auth.game
+
+        # Bots that start the game are submitted once the command is done, like after any other command.
+        def init():
+            if game.state != GameState.LOBBY:
+                raise error.InvalidState("The game has already started")
+            self.start_game(game, init_args)
+            self._emit("game_start", {"route": f"/game/play/{game.id}"}, to=game.id)
 
+        self.submit(game, init, key=("init", game.id), sid=sid)
 
-class LobbyNamespace(AuthenticatedNamespace):
-    def __init__(self, games: GameManager):
-        super().__init__(games)
+
+class AuthenticatedNamespace(SocketRegistry, Namespace, metaclass=ABCMeta):
+    def __init__(self, games: GameManager, actors: ActorPool):
+        SocketRegistry.__init__(self, games, actors)
+        Namespace.__init__(self, self.namespace_str)
 
     @property
+    @abstractmethod
     def namespace_str(self) -> str:
-        return "/lobby"
+        pass
 
-    def _create_player(self, token):
-        game_id = token.get("game")
-        user_id = token.get("user")
-        if game_id is None or user_id is None:
-            return None
+    def _emit(self, name: str, payload, to: str):
+        self.socketio.emit(name, payload, to=to, namespace=self.namespace)
 
-        game = self.games.get(game_id)
-        if game is None:
-            return None
 
-        player = game.players.player_for_user(user_id)
-        if player is None:
-            game.players.register_user(user_id)
+class GoatanNamespace(AuthenticatedNamespace):
+    def __init__(self, games: GameManager, actors: ActorPool):
+        super().__init__(games, actors)
 
-    def on_connect(self, token):
-        print("client connected to lobby")
-        print(token, request.sid)
+    @property
+    def namespace_str(self) -> str:
+        return "/goatan"
 
-        self._create_player(token)
+    def on_connect(self, token):
+        # Tokens identify their user, so they're never logged.
+        logger.debug(f"client {request.sid} connected")
         auth = self.register_socket(request.sid, token)
-        join_room(auth.game.id, namespace=self.namespace)
+        for room in self.game_rooms(auth):
+            join_room(room, namespace=self.namespace)
+        self.send_state(request.sid, token)
 
-        emit("player_id", {"player_id": auth.player.id})
+    def on_disconnect(self):
+        self.leave_game(request.sid)
 
-        emit(
-            "player_update",
-            auth.game.players.serialize(),
-            to=auth.game.id,
-        )
+    def on_sync(self):
+        self.sync(request.sid)
 
-    def on_disconnect(self):
-        print("client disconnected from lobby")
+    def on_end_turn(self):
+        self.end_turn(request.sid)
 
-        auth = self.get_auth(request.sid)
-        if auth is None:
-            return
-        if auth.game.state != GameState.LOBBY:
-            return
+    def on_place(self, data):
+        self.place(request.sid, data)
 
-        auth.game.players.remove_player(auth.player)
-        self.unregister_socket(request.sid)
+    def on_roll(self):
+        self.roll(request.sid)
 
-        emit(
-            "player_update",
-            auth.game.players.serialize(),
-            to=auth.game.id,
-        )
+    def on_bank_trade(self, data):
+        self.bank_trade(request.sid, data)
 
-    def on_game_init(self, settings):
-        print("game init")
 
-        init_args = {}
-        for setting in settings:
-            init_args[setting["name"]] = setting["value"]
-        pprint.pprint(init_args)
+class LobbyNamespace(LobbyRegistry, AuthenticatedNamespace):
+    def __init__(self, games: GameManager, actors: ActorPool):
+        super().__init__(games, actors)
 
-        auth = self.get_auth(request.sid)
-        auth.game.initialize(**init_args)
+    @property
+    def namespace_str(self) -> str:
+        return "/lobby"
 
-        emit(
-            "game_start",
-            {
-                "route": f"/game/play/{auth.game.id}"
-            },
-            to=auth.game.id,
-        )
+    def on_connect(self, token):
+        logger.debug(f"client {request.sid} connected to lobby")
+        auth = self.register_lobby_socket(request.sid, token)
+        join_room(auth.game.id, namespace=self.namespace)
+        self.join_lobby(request.sid, auth, token["user"])
+
+    def on_disconnect(self):
+        logger.debug(f"client {request.sid} disconnected from lobby")
+        self.leave_lobby(request.sid)
+
+    def on_game_init(self, settings):
+        self.init_game(request.sid, settings)
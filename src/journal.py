@@ -0,0 +1,38 @@
+from typing import Callable, List
+
+
+# How to revert the changes made to a game, e.g. a clone that's being searched by a bot. Everything that changes a
+# journaled game records how to undo the change, and the changes of each action are grouped behind a mark, so that undoing
+# an action only costs as much as the action itself.
+class Journal:
+    def __init__(self):
+        self._changes: List[Callable[[], None]] = []
+        self._marks: List[int] = []
+
+        # Reverting a change mustn't record another one.
+        self.recording = True
+
+    def record(self, undo: Callable[[], None]):
+        if self.recording:
+            self._changes.append(undo)
+
+    def mark(self):
+        self._marks.append(len(self._changes))
+
+    # Reverts the changes since the last mark, most recent first.
+    def undo(self) -> bool:
+        if len(self._marks) == 0:
+            return False
+
+        start = self._marks.pop()
+        self.recording = False
+        try:
+            while len(self._changes) > start:
+                self._changes.pop()()
+        finally:
+            self.recording = True
+        return True
+
+    # The number of actions that can be undone.
+    def __len__(self):
+        return len(self._marks)
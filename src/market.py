@@ -1,4 +1,4 @@
-from typing import Set
+from typing import Set, Optional
 
 from src.resource import Resource, Transaction, ResourceHaver
 from src.player import Player
@@ -39,5 +39,27 @@ class Bank(ResourceHaver):
                     continue
                 self.four_to_ones.add(transaction)
 
+        self._four_to_one_inverses = [(transaction, transaction.inverse()) for transaction in self.four_to_ones]
+        self._available: Optional[Set[Transaction]] = None
+
+    # The trades a bank offers only depend on the inventory it started with, so a copy shares them.
+    def clone(self) -> "Bank":
+        bank = Bank.__new__(Bank)
+        ResourceHaver.__init__(bank)
+        bank.resources = self.resources.copy()
+        bank.four_to_ones = self.four_to_ones
+        bank._four_to_one_inverses = self._four_to_one_inverses
+        bank._available = self._available
+        return bank
+
+    def transact(self, transaction: Transaction):
+        super().transact(transaction)
+        self._available = None
+
     def available_transactions(self, board: Board, player: Player) -> Set[Transaction]:
-        return self.four_to_ones
+        # The bank can only offer what's left in its inventory, which only changes when it trades.
+        if self._available is None:
+            self._available = {
+                transaction for transaction, inverse in self._four_to_one_inverses if self.can_transact(inverse)
+            }
+        return self._available
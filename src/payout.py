@@ -0,0 +1,66 @@
+from typing import Dict, Optional
+
+from src.board import Board, BoardListener, ResourceNumber
+from src.piece import Settlement, Road
+from src.player import Player
+from src.resource import Resource, Transaction
+
+
+# The resources each player collects per resource number, kept up to date as settlements are placed so that a roll
+# doesn't need to visit every settlement on the board.
+class PayoutIndex(BoardListener):
+    def __init__(self, board: Board):
+        self._board = board
+
+        # Resource number : player : resource : amount
+        self._payouts: Dict[ResourceNumber, Dict[Player, Dict[Resource, int]]] = {}
+
+        # The settlements that have been counted, by intersection.
+        self._settlements: Dict[int, Settlement] = {}
+
+        for intersection in board.settled_intersections:
+            self.settlement_set(intersection.index, intersection.settlement)
+
+        board.subscribe(self)
+
+    # The payouts of a cloned game, copied rather than counted again from the clone's board.
+    def clone(self, board: Board, players: Dict[Player, Player]) -> "PayoutIndex":
+        payouts = PayoutIndex.__new__(PayoutIndex)
+        payouts._board = board
+        payouts._payouts = {
+            resource_number: {players[player]: resources.copy() for player, resources in player_payouts.items()}
+            for resource_number, player_payouts in self._payouts.items()
+        }
+        payouts._settlements = {intersection: board.settlements[intersection] for intersection in self._settlements}
+        board.subscribe(payouts)
+        return payouts
+
+    def _count(self, intersection: int, settlement: Settlement, sign: int):
+        for tile_index in self._board.topology.tiles_of_intersection(intersection):
+            tile = self._board.tile_list[tile_index]
+            resource = tile.resource_type
+            if resource is None or tile.resource_number is None:
+                continue
+
+            player_payouts = self._payouts.setdefault(tile.resource_number, {})
+            resources = player_payouts.setdefault(settlement.player, {})
+            resources[resource] = resources.get(resource, 0) + sign * settlement.gather_amount
+
+    def settlement_set(self, intersection: int, settlement: Optional[Settlement]):
+        # A settlement replacing another one (e.g. an upgrade) only collects its own amount.
+        previous = self._settlements.pop(intersection, None)
+        if previous is not None:
+            self._count(intersection, previous, -1)
+
+        if settlement is not None:
+            self._settlements[intersection] = settlement
+            self._count(intersection, settlement, 1)
+
+    def road_set(self, edge: int, road: Road):
+        pass
+
+    def transactions(self, resource_number: ResourceNumber) -> Dict[Player, Transaction]:
+        return {
+            player: Transaction(resources.copy())
+            for player, resources in self._payouts.get(resource_number, {}).items()
+        }
@@ -5,9 +5,12 @@ from src.piece import PieceType, Settlement, Road, Piece, House, PlayerPiece
 from src.player import PlayerManager, Player
 from src.board import Board, ResourceNumber
 from src import error
-from src.dice import D6
-from src.resource import Transaction
+from src.dice import Dice, D6
+from src.resource import Transaction, Resource
 from src.market import Bank, Trade
+from src.hint import LegalMoves
+from src.action import Action, ActionType
+from src.payout import PayoutIndex
 from src import victory
 
 
@@ -18,7 +21,7 @@ class GamePhase(ABC):
 
         self._active_player_index = 0
 
-    def place_piece(self, piece: Piece, location_id: str):
+    def place_piece(self, piece: Piece, location_id: int):
         if not self._piece_is_placeable(location_id, piece.type):
             raise error.InvalidAction(f"{piece.type.value} cannot be placed on {location_id}")
 
@@ -29,12 +32,19 @@ class GamePhase(ABC):
     def active_player(self) -> Player:
         return self._players.get(self._active_player_index)
 
+    # The turn state of the phase as a list of integers, used for snapshots.
+    def save_state(self) -> List[int]:
+        return [self._active_player_index]
+
+    def load_state(self, state: List[int]):
+        self._active_player_index = state[0]
+
     @abstractmethod
-    def _piece_is_placeable(self, location_id: str, piece_type: PieceType) -> bool:
+    def _piece_is_placeable(self, location_id: int, piece_type: PieceType) -> bool:
         pass
 
     @abstractmethod
-    def _piece_placed(self, location_id: str, piece: Piece):
+    def _piece_placed(self, location_id: int, piece: Piece):
         pass
 
     @abstractmethod
@@ -68,6 +78,9 @@ class GamePhase(ABC):
     def serialize_bank_trades(self) -> Dict[str, List[Dict[str, int]]]:
         pass
 
+    def serialize_player_bank_trades(self, player: Player) -> List[Dict[str, int]]:
+        return self.serialize_bank_trades()[player.id]
+
     @abstractmethod
     def player_trade(self, transaction: Transaction, player: Player):
         pass
@@ -76,6 +89,11 @@ class GamePhase(ABC):
     def serialize_hints(self):
         pass
 
+    # Everything the player can do right now, read from the legal moves rather than the serialized hints.
+    @abstractmethod
+    def legal_actions(self, player: Player) -> List[Action]:
+        pass
+
     @staticmethod
     @abstractmethod
     def name():
@@ -83,14 +101,45 @@ class GamePhase(ABC):
 
 
 class Game(GamePhase):
-    def __init__(self, board: Board, players: PlayerManager, win_condition: victory.WinCondition):
+    def __init__(
+            self,
+            board: Board,
+            players: PlayerManager,
+            win_condition: victory.WinCondition,
+            legal_moves: LegalMoves,
+            dice: Dice = None,
+            bank: Bank = None,
+            payouts: PayoutIndex = None,
+    ):
         super().__init__(board, players)
         self.win_condition = win_condition
 
+        self._dice = dice if dice is not None else D6(2)
         self._roll = None
-        self._bank = Bank()
-
-    def _piece_is_placeable(self, location_id: str, piece_type: PieceType) -> bool:
+        # Cloned games start with copies of the original's bank and payouts, see Goatan.clone.
+        self._bank = bank if bank is not None else Bank()
+        self._payouts = payouts if payouts is not None else PayoutIndex(board)
+
+        # Serialized hints are reused until the active player's legal moves or affordability change.
+        self._legal_moves = legal_moves
+        self._hints_key = None
+        self._hints = None
+
+    def save_state(self) -> List[int]:
+        roll = self._roll if self._roll is not None else [0, 0]
+        return super().save_state() + roll + [self._bank.resources[resource] for resource in Resource]
+
+    def load_state(self, state: List[int]):
+        super().load_state(state)
+        self._roll = state[1:3] if state[1] != 0 else None
+
+        inventory = dict(zip(Resource, state[3:3 + len(Resource)]))
+        if inventory != self._bank.resources:
+            self._bank.transact(Transaction({
+                resource: inventory[resource] - count for resource, count in self._bank.resources.items()
+            }))
+
+    def _piece_is_placeable(self, location_id: int, piece_type: PieceType) -> bool:
         if self._roll is None:
             return False
 
@@ -101,42 +150,42 @@ class Game(GamePhase):
         else:
             return False
 
-    def _house_is_placeable(self, location_id: str) -> bool:
-        intersection = self._board.intersections.get(location_id)
+    def _house_is_placeable(self, location_id: int) -> bool:
+        intersection = self._board.intersection_index(location_id)
         if intersection is None:
             return False
 
-        if intersection.settlement is not None:
+        if self._board.settlements[intersection] is not None:
             return False
 
         if not self.active_player.can_transact(House.cost()):
             return False
 
-        if intersection.borders_house():
+        if self._board.intersection_borders_house(intersection):
             return False
 
-        if not intersection.borders_road_for_player(self.active_player):
+        if not self._board.intersection_borders_road_for_player(intersection, self.active_player):
             return False
 
         return True
 
-    def _road_is_placeable(self, location_id: str) -> bool:
-        edge = self._board.edges.get(location_id)
+    def _road_is_placeable(self, location_id: int) -> bool:
+        edge = self._board.edge_index(location_id)
         if edge is None:
             return False
 
-        if edge.road is not None:
+        if self._board.roads[edge] is not None:
             return False
 
         if not self.active_player.can_transact(Road.cost()):
             return False
 
-        if not edge.borders_settlement_or_road_for_player(self.active_player):
+        if not self._board.edge_borders_settlement_or_road_for_player(edge, self.active_player):
             return False
 
         return True
 
-    def _piece_placed(self, location_id: str, piece: Piece):
+    def _piece_placed(self, location_id: int, piece: Piece):
         if not isinstance(piece, PlayerPiece):
             return
         self.active_player.transact(piece.cost())
@@ -157,16 +206,14 @@ class Game(GamePhase):
         if self._roll is not None:
             raise error.InvalidAction("Already rolled")
 
-        self._roll = D6(2).roll()
+        self._roll = self._dice.roll()
         value = sum(self._roll)
         if value == 7:
             return
 
-        resource_number = ResourceNumber(value)
-        for intersection in self._board.settled_intersections:
-            player = intersection.settlement.player
-            for resource_type in intersection.collect(resource_number):
-                player.transact(Transaction({resource_type: 1}))
+        # Each player collects everything for the roll in a single transaction.
+        for player, transaction in self._payouts.transactions(ResourceNumber(value)).items():
+            player.transact(transaction)
 
     @property
     def roll_result(self) -> Optional[int]:
@@ -183,40 +230,63 @@ class Game(GamePhase):
         Trade(transaction).execute(self.active_player, self._bank)
 
     def serialize_bank_trades(self) -> Dict[str, List[Dict[str, int]]]:
-        return {
-            player.id: [
-                transaction.serialize() for transaction in self._bank.available_transactions(self._board, player)
-            ] for player in self._players
-        }
+        return {player.id: self.serialize_player_bank_trades(player) for player in self._players}
+
+    def serialize_player_bank_trades(self, player: Player) -> List[Dict[str, int]]:
+        return [transaction.serialize() for transaction in self._bank.available_transactions(self._board, player)]
 
     def player_trade(self, transaction: Transaction, player: Player):
         raise error.InvalidAction("Not implemented")
 
     def _placeable_settlements(self):
-        for intersection in self._board.intersections.values():
-            if self._house_is_placeable(intersection.id):
-                yield intersection
+        if self._roll is None or not self.active_player.can_transact(House.cost()):
+            return
+        for intersection in sorted(self._legal_moves.houses(self.active_player)):
+            yield self._board.intersection_list[intersection]
 
     def _placeable_roads(self):
-        for edge in self._board.edges.values():
-            if self._road_is_placeable(edge.id):
-                yield edge
+        if self._roll is None or not self.active_player.can_transact(Road.cost()):
+            return
+        for edge in sorted(self._legal_moves.roads(self.active_player)):
+            yield self._board.edge_list[edge]
 
     def serialize_hints(self):
-        return {
-            "intersections": {
-                intersection.id: {
-                    "type": PieceType.HOUSE.value,
-                } for intersection in self._board.intersections.values()
-                    if self._piece_is_placeable(intersection.id, PieceType.HOUSE)
-            },
-            "edges": {
-                edge.id: {
-                    "type": PieceType.ROAD.value,
-                } for edge in self._board.edges.values()
-                    if self._piece_is_placeable(edge.id, PieceType.ROAD)
-            },
-        }
+        player = self.active_player
+        can_build_house = self._roll is not None and player.can_transact(House.cost())
+        can_build_road = self._roll is not None and player.can_transact(Road.cost())
+
+        key = (player, can_build_house, can_build_road, self._legal_moves.version(player))
+        if key != self._hints_key:
+            self._hints_key = key
+            self._hints = self._legal_moves.serialize(
+                self._legal_moves.houses(player) if can_build_house else (),
+                self._legal_moves.roads(player) if can_build_road else (),
+            )
+        return self._hints
+
+    def legal_actions(self, player: Player) -> List[Action]:
+        if player != self.active_player:
+            return []
+
+        actions = []
+        if self._roll is None:
+            actions.append(Action(ActionType.ROLL))
+        else:
+            if player.can_transact(House.cost()):
+                for intersection in sorted(self._legal_moves.houses(player)):
+                    actions.append(Action(ActionType.PLACE, PieceType.HOUSE, intersection))
+            if player.can_transact(Road.cost()):
+                for edge in sorted(self._legal_moves.roads(player)):
+                    actions.append(Action(ActionType.PLACE, PieceType.ROAD, edge))
+
+        for transaction in self._bank.available_transactions(self._board, player):
+            if player.can_transact(transaction):
+                actions.append(Action(ActionType.BANK_TRADE, transaction=transaction))
+
+        # Turns end once the dice have been rolled.
+        if self._roll is not None:
+            actions.append(Action(ActionType.END_TURN))
+        return actions
 
     @staticmethod
     def name():
@@ -251,14 +321,31 @@ class Placement(GamePhase):
             assert not self._finished
             self._placing_road = True
 
-    def __init__(self, board: Board, players: PlayerManager):
+    def __init__(self, board: Board, players: PlayerManager, legal_moves: LegalMoves):
         super().__init__(board, players)
+        self._legal_moves = legal_moves
 
         self._finished = False
         self._turns_incrementing = True
         self._current_turn = Placement.Turn()
 
-    def _piece_is_placeable(self, location_id: str, piece_type: PieceType) -> bool:
+    def save_state(self) -> List[int]:
+        return super().save_state() + [
+            self._finished,
+            self._turns_incrementing,
+            self._current_turn._finished,
+            self._current_turn._placing_road,
+        ]
+
+    def load_state(self, state: List[int]):
+        super().load_state(state)
+        self._finished = bool(state[1])
+        self._turns_incrementing = bool(state[2])
+        self._current_turn = Placement.Turn()
+        self._current_turn._finished = bool(state[3])
+        self._current_turn._placing_road = bool(state[4])
+
+    def _piece_is_placeable(self, location_id: int, piece_type: PieceType) -> bool:
         if piece_type == PieceType.HOUSE:
             return self._house_is_placeable(location_id)
         elif piece_type == PieceType.ROAD:
@@ -266,41 +353,44 @@ class Placement(GamePhase):
         else:
             return False
 
-    def _house_is_placeable(self, location_id: str) -> bool:
+    def _house_is_placeable(self, location_id: int) -> bool:
         if not self._current_turn.placing_house:
             return False
 
-        intersection = self._board.intersections.get(location_id)
+        intersection = self._board.intersection_index(location_id)
         if intersection is None:
             return False
 
-        if intersection.borders_house():
+        if self._board.intersection_borders_house(intersection):
             return False
 
         return True
 
-    def _road_is_placeable(self, location_id: str) -> bool:
+    def _road_is_placeable(self, location_id: int) -> bool:
         if not self._current_turn.placing_road:
             return False
 
-        edge = self._board.edges.get(location_id)
+        edge = self._board.edge_index(location_id)
         if edge is None:
             return False
 
+        return self._edge_is_placeable(edge)
+
+    def _edge_is_placeable(self, edge: int) -> bool:
         # Can't place a road on a road.
-        if edge.road is not None:
+        if self._board.roads[edge] is not None:
             return False
 
         # During the placement phase, the road can only be placed next to the house that was just
         # placed, which is a house with no roads connected to it yet.
         borders_roadless_settlement = False
-        for intersection in edge.intersections:
-            settlement = intersection.settlement
+        for intersection in self._board.topology.intersections_of_edge(edge):
+            settlement = self._board.settlements[intersection]
             if settlement is None:
                 continue
-            if settlement.player != self.active_player:
+            if settlement.player is not self.active_player:
                 continue
-            if not intersection.borders_road_for_player(self.active_player):
+            if not self._board.intersection_borders_road_for_player(intersection, self.active_player):
                 borders_roadless_settlement = True
                 break
         if not borders_roadless_settlement:
@@ -308,11 +398,11 @@ class Placement(GamePhase):
 
         return True
 
-    def _piece_placed(self, location_id: str, piece: Piece):
+    def _piece_placed(self, location_id: int, piece: Piece):
         if piece.type == PieceType.HOUSE:
             # Resources are received for the second house placed.
             if not self._turns_incrementing:
-                intersection = self._board.intersections[location_id]
+                intersection = self._board.intersection_list[location_id]
                 for resource_type in intersection.collect():
                     self.active_player.transact(Transaction({resource_type: 1}))
             self._current_turn.placed_house()
@@ -322,7 +412,8 @@ class Placement(GamePhase):
     def end_turn(self):
         assert not self.finished
 
-        if not self._current_turn.finished:
+        # Players that have nowhere left to place their pieces, e.g. on small boards, pass the rest of their turn.
+        if not self._current_turn.finished and self._can_place():
             raise error.InvalidAction("Turn is not finished")
         self._current_turn = Placement.Turn()
 
@@ -365,30 +456,34 @@ class Placement(GamePhase):
     def _placeable_settlements(self):
         if not self._current_turn.placing_house:
             return []
-        for intersection_id in self._board.intersections:
-            if self._house_is_placeable(intersection_id):
-                yield intersection_id, PieceType.HOUSE
+        return self._legal_moves.open_intersections
 
     def _placeable_roads(self):
         if not self._current_turn.placing_road:
             return []
-        for location_id in self._board.edges:
-            if self._road_is_placeable(location_id):
-                yield location_id, PieceType.ROAD
+        # Any placeable road borders one of the active player's settlements.
+        return [edge for edge in self._legal_moves.roads(self.active_player) if self._edge_is_placeable(edge)]
+
+    def _can_place(self) -> bool:
+        return len(self._placeable_settlements()) > 0 or len(self._placeable_roads()) > 0
 
     def serialize_hints(self):
-        return {
-            "intersections": {
-                intersection_id: {
-                    "type": piece_type.value,
-                } for intersection_id, piece_type in self._placeable_settlements()
-            },
-            "edges": {
-                edge_id: {
-                    "type": piece_type.value,
-                } for edge_id, piece_type in self._placeable_roads()
-            }
-        }
+        return self._legal_moves.serialize(self._placeable_settlements(), self._placeable_roads())
+
+    def legal_actions(self, player: Player) -> List[Action]:
+        if player != self.active_player or self._finished:
+            return []
+
+        actions = [
+            Action(ActionType.PLACE, PieceType.HOUSE, intersection)
+            for intersection in sorted(self._placeable_settlements())
+        ]
+        actions.extend(Action(ActionType.PLACE, PieceType.ROAD, edge) for edge in sorted(self._placeable_roads()))
+
+        # Turns end once both pieces have been placed, or once there's nowhere left to place them, see end_turn.
+        if len(actions) == 0:
+            actions.append(Action(ActionType.END_TURN))
+        return actions
 
     @staticmethod
     def name():
@@ -400,10 +495,10 @@ class Finished(GamePhase):
         super().__init__(board, players)
         self.win_condition = win_condition
 
-    def _piece_is_placeable(self, location_id: str, piece_type: PieceType) -> bool:
+    def _piece_is_placeable(self, location_id: int, piece_type: PieceType) -> bool:
         return False
 
-    def _piece_placed(self, location_id: str, piece: Piece):
+    def _piece_placed(self, location_id: int, piece: Piece):
         raise error.InvalidState()
 
     def end_turn(self):
@@ -439,6 +534,9 @@ class Finished(GamePhase):
             "edges": {},
         }
 
+    def legal_actions(self, player: Player) -> List[Action]:
+        return []
+
     @staticmethod
     def name():
         return "finished"
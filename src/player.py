@@ -1,4 +1,4 @@
-from typing import Dict, Optional
+from typing import Dict, Optional, List
 import random
 from enum import Enum
 
@@ -17,10 +17,10 @@ class PlayerColor(Enum):
 
 
 class Player(GameItem, ResourceHaver):
-    def __init__(self, user_id, name, color: PlayerColor):
-        GameItem.__init__(self)
+    def __init__(self, id_: int, user_id, name, color: PlayerColor):
         ResourceHaver.__init__(self)
 
+        self.id = id_
         self.user_id = user_id
         self.name = name
         self.color = color
@@ -49,14 +49,17 @@ class PlayerManager:
             else:
                 raise StopIteration
 
-    def __init__(self):
+    def __init__(self, rng: random.Random = None):
         self.finalized = False
+        self.random = rng if rng is not None else random.Random()
 
         self._colors = [color for color in PlayerColor]
-        random.shuffle(self._colors)
+        self.random.shuffle(self._colors)
 
         self._players: [Player] = []
         self._player_for_user: Dict[str, Player] = {}  # User id : Player
+        # Players are numbered in the order they joined. Ids aren't reused when players leave the lobby.
+        self._next_id = 0
 
     def register_user(self, user_id: str):
         if self.player_for_user(user_id) is not None:
@@ -65,7 +68,8 @@ class PlayerManager:
         assert not self.finalized
         assert len(self._colors) > 0
 
-        player = Player(user_id, f"Player {len(self._players) + 1}", self._colors.pop())
+        player = Player(self._next_id, user_id, f"Player {len(self._players) + 1}", self._colors.pop())
+        self._next_id += 1
         self._players.append(player)
         self._player_for_user[user_id] = player
         return player
@@ -83,13 +87,29 @@ class PlayerManager:
         return self._player_for_user.get(user_id)
 
     def finalize(self):
-        random.shuffle(self._players)
+        self.random.shuffle(self._players)
         self.finalized = True
 
+    @property
+    def available_colors(self) -> List[PlayerColor]:
+        return self._colors.copy()
+
+    def restore(self, players: List[Player], available_colors: List[PlayerColor], finalized: bool):
+        self._players = players
+        self._player_for_user = {player.user_id: player for player in players}
+        self._next_id = max([player.id + 1 for player in players], default=0)
+        self._colors = available_colors
+        self.finalized = finalized
+
+    def index(self, player: Player) -> int:
+        return self._players.index(player)
+
     def serialize(self):
+        # Both views share the same player dicts, so each player is only serialized once.
+        players = [player.serialize() for player in self._players]
         return {
-            "players": [player.serialize() for player in self._players],
-            "player_map": {player.id: player.serialize() for player in self._players}
+            "players": players,
+            "player_map": {player["id"]: player for player in players}
         }
 
     def __len__(self):
@@ -0,0 +1,64 @@
+from typing import Dict, Tuple
+
+from src.player import Player
+from src.util import encode_json
+from src.wire import Protocol
+from src import wire
+
+
+# The state of a game as each of its players sees it. The public part is the same for everyone and is serialized once
+# per version. The private part, a player's own hints and bank trades, is only serialized for the players that ask for
+# it. Both are cached until the game's version changes, so reconnects and repeated requests cost nothing.
+class Projection:
+    def __init__(self, game):
+        self._game = game
+
+        self._public_version = None
+        self._public = None
+        self._private: Dict[Player, Tuple[int, dict]] = {}
+
+        self._encoded_public_version = None
+        self._encoded_public = None
+        self._encoded: Dict[Tuple[Player, Protocol], Tuple[int, bytes]] = {}
+
+    def public(self) -> dict:
+        if self._public_version != self._game.version:
+            self._public = self._game.serialize_public()
+            self._public_version = self._game.version
+        return self._public
+
+    def private(self, player: Player) -> dict:
+        cached = self._private.get(player)
+        if cached is not None and cached[0] == self._game.version:
+            return cached[1]
+
+        private = self._game.serialize_private(player)
+        self._private[player] = (self._game.version, private)
+        return private
+
+    def state(self, player: Player) -> dict:
+        return {
+            **self.public(),
+            **self.private(player),
+        }
+
+    def encoded_public(self) -> bytes:
+        if self._encoded_public_version != self._game.version:
+            self._encoded_public = encode_json(self.public())
+            self._encoded_public_version = self._game.version
+        return self._encoded_public
+
+    def encoded_state(self, player: Player, protocol: Protocol = Protocol.JSON) -> bytes:
+        cached = self._encoded.get((player, protocol))
+        if cached is not None and cached[0] == self._game.version:
+            return cached[1]
+
+        if protocol == Protocol.JSON:
+            # Both parts are JSON objects without keys in common, so the private members are spliced into the public
+            # object rather than encoding the public part again for every player.
+            private = encode_json(self.private(player))
+            encoded = self.encoded_public()[:-1] + b"," + private[1:]
+        else:
+            encoded = wire.encode(self.state(player), protocol)
+        self._encoded[(player, protocol)] = (self._game.version, encoded)
+        return encoded
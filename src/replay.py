@@ -0,0 +1,118 @@
+import json
+import os
+from typing import List, Optional
+
+from src.action_log import ActionLog
+from src.game import Goatan, Emitter
+from src.piece import PieceType
+from src.resource import Transaction, Resource
+from src import error
+
+
+def _apply(game: Goatan, entry: dict):
+    action = entry["action"]
+    if action == "join":
+        game.join(entry["user"])
+        return
+    if action == "leave":
+        game.leave(game.players.player_for_user(entry["user"]))
+        return
+    if action == "initialize":
+        game.initialize(**entry["settings"])
+        return
+    if action == "refine_longest_road":
+        game.refine_longest_road()
+        return
+
+    player = game.players.player_for_user(entry["user"])
+    if player is None:
+        raise error.InvalidState(f"Unknown user {entry['user']} at version {entry['version']}")
+
+    if action == "place":
+        game.place(player, PieceType(entry["piece_type"]), entry["location"])
+    elif action == "roll":
+        game.roll(player)
+        # The dice are drawn from the game's generator, so a different roll means the log doesn't match this code.
+        if game.phase.roll_result != entry["result"]:
+            raise error.InvalidState(
+                f"Replay diverged at version {entry['version']}: rolled {game.phase.roll_result}, "
+                f"logged {entry['result']}"
+            )
+    elif action == "end_turn":
+        game.end_turn(player)
+    elif action == "bank_trade":
+        transaction = Transaction({Resource(resource): amount for resource, amount in entry["transaction"].items()})
+        game.bank_trade(player, transaction)
+    else:
+        raise error.InvalidState(f"Unknown action {action}")
+
+
+# Rebuilds a game from its log, up to and including the given version. The game is replayed headless, so no deltas are
+# sent and no hints are computed along the way; they're only worked out once the final state is used.
+def replay(entries: List[dict], version: Optional[int] = None) -> Goatan:
+    if len(entries) == 0 or entries[0]["action"] != "create" or entries[0]["version"] != 0:
+        raise error.InvalidState("Log doesn't start with the creation of its game")
+
+    header = entries[0]
+    game = Goatan(seed=header["seed"])
+    game.id = header["game"]
+
+    for entry in entries[1:]:
+        if version is not None and entry["version"] > version:
+            break
+        _apply(game, entry)
+        # Restoring a game skips a version, which the replayed game has to skip as well.
+        game.version = entry["version"]
+
+    return game
+
+
+class ActionLogStore:
+    EXTENSION = ".log"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, game_id: str) -> str:
+        # Game ids come from clients, so they can't be trusted as file names.
+        if not game_id.isalnum():
+            raise error.InvalidAction(f"Invalid game id {game_id}")
+        return os.path.join(self.directory, game_id + self.EXTENSION)
+
+    def read(self, game_id: str) -> Optional[List[dict]]:
+        try:
+            with open(self._path(game_id)) as f:
+                lines = f.read().splitlines()
+        except (FileNotFoundError, error.InvalidAction):
+            return None
+
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Only the last line can be cut off, by a crash while it was being written.
+                break
+        return entries
+
+    def open(self, game_id: str) -> ActionLog:
+        entries = self.read(game_id)
+        if entries is None:
+            entries = []
+        # Rewritten in full so that a line cut off by a crash doesn't end up in the middle of the log.
+        path = self._path(game_id)
+        with open(path + ".tmp", "w") as f:
+            f.writelines(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries)
+        os.replace(path + ".tmp", path)
+        return ActionLog(entries, open(path, "a"))
+
+    def restore(self, game_id: str, emitter: Optional[Emitter] = None, snapshots=None) -> Optional[Goatan]:
+        entries = self.read(game_id)
+        if not entries:
+            return None
+
+        game = replay(entries)
+        game.resume(emitter, snapshots, self)
+        game.restored()
+        return game
@@ -1,7 +1,8 @@
 from enum import Enum
-from typing import Dict, Self
+from typing import Dict, Self, Optional
 from abc import ABC, abstractmethod
-import json
+
+from src.journal import Journal
 
 
 class Resource(Enum):
@@ -26,11 +27,15 @@ class Transaction:
             resources[resource] *= -1
         return Transaction(resources)
 
+    def _amounts(self) -> tuple:
+        return tuple(self.resources[resource] for resource in Resource)
+
     def __hash__(self):
-        return hash(json.dumps(self.serialize(), sort_keys=True))
+        return hash(self._amounts())
 
+    # Hashes can collide, e.g. hash(-1) == hash(-2), so the amounts themselves are compared.
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        return isinstance(other, Transaction) and self._amounts() == other._amounts()
 
     def serialize(self) -> Dict[str, int]:
         return {
@@ -43,8 +48,15 @@ class ResourceHaver:
     def __init__(self):
         self.resources = {resource_type: 0 for resource_type in Resource}
 
+        # Set for the players of journaled games.
+        self.journal: Optional[Journal] = None
+
     def transact(self, transaction: Transaction):
         assert self.can_transact(transaction)
+        if self.journal is not None:
+            previous = self.resources.copy()
+            self.journal.record(lambda: self.resources.update(previous))
+
         for resource in transaction.resources:
             self.resources[resource] += transaction.resources[resource]
 
@@ -0,0 +1,71 @@
+import os
+from typing import Optional, Tuple
+
+from src.game import GameManager, Emitter, EvictionPolicy
+from src.user import UserManager
+from src.snapshot import SnapshotStore, DirectorySnapshotStore, SqliteSnapshotStore
+from src.replay import ActionLogStore
+from src.cluster import ShardRouter, ShardedGameManager, SignedUserManager
+
+# Both servers, app.py and async_app.py, are configured through the environment.
+MESSAGE_QUEUE = os.environ.get("GOATAN_MESSAGE_QUEUE")
+SHARD_URLS = os.environ.get("GOATAN_SHARD_URLS")
+PORT = int(os.environ.get("GOATAN_PORT", 8000))
+
+
+def _seconds(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    # "none" keeps them forever.
+    return None if value.lower() == "none" else float(value)
+
+
+# Abandoned lobbies, finished games and users are dropped from memory after a while. Games are loaded again from their
+# log or snapshot if they're needed later, and are gone for good if neither is configured.
+def eviction_policy() -> EvictionPolicy:
+    max_games = os.environ.get("GOATAN_MAX_GAMES")
+    return EvictionPolicy(
+        lobby_ttl=_seconds("GOATAN_LOBBY_TTL", 60 * 60),
+        game_ttl=_seconds("GOATAN_GAME_TTL", 24 * 60 * 60),
+        finished_ttl=_seconds("GOATAN_FINISHED_TTL", 10 * 60),
+        max_games=int(max_games) if max_games is not None else None,
+    )
+
+
+def user_ttl() -> Optional[float]:
+    return _seconds("GOATAN_USER_TTL", 24 * 60 * 60)
+
+
+# Games are snapshotted after every action when a snapshot directory or sqlite file is configured, and survive restarts.
+def snapshot_store() -> Optional[SnapshotStore]:
+    path = os.environ.get("GOATAN_SNAPSHOTS")
+    if path is None:
+        return None
+    if path.endswith((".db", ".sqlite")):
+        return SqliteSnapshotStore(path)
+    return DirectorySnapshotStore(path)
+
+
+# Every action is also appended to a per-game log when a log directory is configured, so games can be replayed.
+def action_log_store() -> Optional[ActionLogStore]:
+    path = os.environ.get("GOATAN_LOGS")
+    if path is None:
+        return None
+    return ActionLogStore(path)
+
+
+# Sharded deployments run one worker per core, see run_cluster.py. Each worker owns a share of the games and sends
+# clients of the other games to their owners.
+def managers(emitter: Emitter) -> Tuple[UserManager, GameManager]:
+    snapshots = snapshot_store()
+    logs = action_log_store()
+
+    eviction = eviction_policy()
+
+    if SHARD_URLS is None:
+        return UserManager(user_ttl()), GameManager(emitter, snapshots, logs, eviction)
+
+    router = ShardRouter(SHARD_URLS.split(","), int(os.environ["GOATAN_SHARD"]))
+    users = SignedUserManager(os.environ["GOATAN_SECRET"], user_ttl())
+    return users, ShardedGameManager(router, emitter, snapshots, logs, eviction)
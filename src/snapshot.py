@@ -0,0 +1,359 @@
+import logging
+import os
+import queue
+import sqlite3
+import struct
+import sys
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from typing import Optional, Dict, List
+
+from src.board import Board, Tile, TileType, ResourceNumber
+from src import board_generator
+from src.game import Goatan, GameState, Emitter
+from src.piece import PieceType, House, Road
+from src.player import Player, PlayerColor
+from src.resource import Resource
+from src.topology import SIDES
+from src import error
+
+logger = logging.getLogger(__name__)
+
+# Snapshots start with the magic bytes and the format version, and every integer is little-endian. Board items are
+# referenced by their topology index and players by their turn order, so no ids but the game's and players' are stored.
+MAGIC = b"GOAT"
+FORMAT_VERSION = 5
+
+TILE_TYPES = list(TileType)
+RESOURCE_NUMBERS = [None] + list(ResourceNumber)
+PIECE_TYPES = list(PieceType)
+COLORS = list(PlayerColor)
+PIECES = {
+    PieceType.HOUSE: House,
+    PieceType.ROAD: Road,
+}
+
+
+class _Writer:
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def pack(self, format_: str, *values):
+        self._parts.append(struct.pack("<" + format_, *values))
+
+    def string(self, value: str):
+        encoded = value.encode()
+        self.pack("H", len(encoded))
+        self._parts.append(encoded)
+
+    def array(self, values: array):
+        if sys.byteorder != "little":
+            values = array(values.typecode, values)
+            values.byteswap()
+        self.pack("I", len(values))
+        self._parts.append(values.tobytes())
+
+    def bytes(self) -> bytes:
+        return b"".join(self._parts)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self._data = memoryview(data)
+        self._offset = 0
+
+    def unpack(self, format_: str):
+        format_ = "<" + format_
+        values = struct.unpack_from(format_, self._data, self._offset)
+        self._offset += struct.calcsize(format_)
+        return values
+
+    def one(self, format_: str):
+        return self.unpack(format_)[0]
+
+    def string(self) -> str:
+        length = self.one("H")
+        value = bytes(self._data[self._offset:self._offset + length]).decode()
+        self._offset += length
+        return value
+
+    def array(self, typecode: str) -> array:
+        length = self.one("I")
+        values = array(typecode)
+        values.frombytes(self._data[self._offset:self._offset + length * values.itemsize])
+        self._offset += length * values.itemsize
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+
+def encode(game: Goatan) -> bytes:
+    writer = _Writer()
+    writer.pack("4sH", MAGIC, FORMAT_VERSION)
+
+    writer.string(game.id)
+    writer.pack("BIH", game.state.value, game.version, game.win_condition.required_points)
+
+    # The generator's state is kept so that the game's log can still be replayed past the snapshot.
+    random_version, random_internal, gauss = game.random.getstate()
+    writer.pack("QB", game.seed, random_version)
+    writer.array(array("I", random_internal))
+    writer.pack("?d", gauss is not None, gauss if gauss is not None else 0.0)
+
+    players = list(game.players)
+    writer.pack("B", len(players))
+    for player in players:
+        writer.pack("H", player.id)
+        writer.string(player.user_id)
+        writer.string(player.name)
+        writer.pack("B", COLORS.index(player.color))
+        writer.pack(f"{len(Resource)}i", *[player.resources[resource] for resource in Resource])
+
+    colors = game.players.available_colors
+    writer.pack(f"BB{len(colors)}B", game.players.finalized, len(colors), *[COLORS.index(color) for color in colors])
+
+    board = game.board
+    writer.pack("?", board is not None)
+    if board is None:
+        return writer.bytes()
+
+    writer.array(board.topology.tile_neighbors)
+    writer.pack("I", board.anchor_tile.index)
+    writer.array(array("b", [TILE_TYPES.index(tile.type) for tile in board.tile_list]))
+    writer.array(array("b", [RESOURCE_NUMBERS.index(tile.resource_number) for tile in board.tile_list]))
+
+    # Pieces are stored as the turn order index of their player, and -1 for empty locations.
+    player_index = {player: index for index, player in enumerate(players)}
+    writer.array(array("b", [
+        player_index[settlement.player] if settlement is not None else -1 for settlement in board.settlements
+    ]))
+    writer.array(array("b", [
+        PIECE_TYPES.index(settlement.type) if settlement is not None else -1 for settlement in board.settlements
+    ]))
+    writer.array(array("b", [player_index[road.player] if road is not None else -1 for road in board.roads]))
+
+    # The phases that are already over aren't needed, only how many of them there were.
+    writer.pack("B", 2 - len(game.phases))
+    writer.array(array("i", game.phase.save_state()))
+    writer.array(array("i", game.win_condition.save_state()))
+
+    return writer.bytes()
+
+
+def decode(data: bytes, emitter: Optional[Emitter] = None, snapshots=None, logs=None) -> Goatan:
+    reader = _Reader(data)
+    magic, format_version = reader.unpack("4sH")
+    if magic != MAGIC:
+        raise error.InvalidState("Not a game snapshot")
+    if format_version not in (1, 2, 3, 4, FORMAT_VERSION):
+        raise error.InvalidState(f"Unsupported snapshot version {format_version}")
+
+    game = Goatan(emitter, snapshots, logs)
+    game.id = reader.string()
+    state, game.version, game.win_condition.required_points = reader.unpack("BIH")
+
+    # Version 1 snapshots were taken before games had their own generator, and just get a fresh one.
+    if format_version >= 2:
+        game.seed, random_version = reader.unpack("QB")
+        random_internal = tuple(reader.array("I"))
+        has_gauss, gauss = reader.unpack("?d")
+        game.random.setstate((random_version, random_internal, gauss if has_gauss else None))
+
+    # Players had uuids before version 3, and are numbered in turn order instead.
+    players = []
+    for index in range(reader.one("B")):
+        if format_version >= 3:
+            player_id = reader.one("H")
+        else:
+            reader.string()
+            player_id = index
+        user_id = reader.string()
+        name = reader.string()
+        player = Player(player_id, user_id, name, COLORS[reader.one("B")])
+        player.resources = dict(zip(Resource, reader.unpack(f"{len(Resource)}i")))
+        players.append(player)
+
+    finalized, color_count = reader.unpack("BB")
+    colors = [COLORS[index] for index in reader.unpack(f"{color_count}B")]
+    game.players.restore(players, colors, bool(finalized))
+
+    if not reader.one("?"):
+        game.state = GameState(state)
+        return game
+
+    tile_neighbors = reader.array("i")
+    anchor_tile = reader.one("I")
+    tile_types = reader.array("b")
+    resource_numbers = reader.array("b")
+
+    board = Board()
+    for index in range(len(tile_neighbors) // SIDES):
+        tile = Tile()
+        tile.type = TILE_TYPES[tile_types[index]]
+        tile.resource_number = RESOURCE_NUMBERS[resource_numbers[index]]
+        board.add_tile(tile)
+    board.initialize(board.tile_list[anchor_tile], board_generator.topology(tile_neighbors))
+
+    game.start(board)
+    game.state = GameState(state)
+
+    # The phases listen to the board, so pieces are placed once they exist.
+    settlement_players = reader.array("b")
+    settlement_types = reader.array("b")
+    road_players = reader.array("b")
+    for intersection, player_index in enumerate(settlement_players):
+        if player_index < 0:
+            continue
+        piece = PIECES[PIECE_TYPES[settlement_types[intersection]]](players[player_index])
+        board.set_piece(piece, intersection)
+    for edge, player_index in enumerate(road_players):
+        if player_index < 0:
+            continue
+        board.set_piece(Road(players[player_index]), edge)
+
+    for _ in range(reader.one("B")):
+        game.phase = game.phases.pop(0)
+    game.phase.load_state(list(reader.array("i")))
+    # Before version 4, the win condition's state was whatever placing the pieces again led to. Before version 5 it
+    # didn't have the victor, which was anyone with the required points.
+    if format_version >= 4:
+        game.win_condition.load_state(list(reader.array("i")))
+    if format_version < 5:
+        for player in players:
+            game.win_condition.action_taken(player)
+
+    game.restored()
+    return game
+
+
+# Snapshots are encoded on the caller's thread, which is cheap and sees a consistent game, and written on a background
+# thread. Only the latest snapshot of a game is kept if it's saved again before it has been written. A snapshot that
+# fails to be written is tried again up to write_attempts times in all, and then dropped, so that a failing store never
+# stops the writer or blocks flush().
+class SnapshotStore(ABC):
+    def __init__(self, write_attempts: int = 3):
+        self.write_attempts = write_attempts
+        self._pending: Dict[str, bytes] = {}
+        self._failures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+
+        self._writer = threading.Thread(target=self._write_pending, daemon=True)
+        self._writer.start()
+
+    def save(self, game: Goatan):
+        data = encode(game)
+        with self._lock:
+            already_queued = game.id in self._pending
+            self._pending[game.id] = data
+        if not already_queued:
+            self._queue.put(game.id)
+
+    def restore(self, game_id: str, emitter: Optional[Emitter] = None, logs=None) -> Optional[Goatan]:
+        with self._lock:
+            data = self._pending.get(game_id)
+        if data is None:
+            data = self._read(game_id)
+        if data is None:
+            return None
+        return decode(data, emitter, self, logs)
+
+    def flush(self):
+        self._queue.join()
+
+    def _write_pending(self):
+        while True:
+            game_id = self._queue.get()
+            with self._lock:
+                data = self._pending[game_id]
+            try:
+                self._write(game_id, data)
+                failed = False
+            except Exception:
+                logger.exception(f"failed to write the snapshot of {game_id}")
+                failed = True
+
+            # The snapshot stays pending until it's written so that it can still be restored in the meantime. A newer
+            # snapshot gets its own attempts.
+            with self._lock:
+                if self._pending[game_id] is not data:
+                    self._failures.pop(game_id, None)
+                    self._queue.put(game_id)
+                elif not failed:
+                    self._failures.pop(game_id, None)
+                    self._pending.pop(game_id)
+                else:
+                    failures = self._failures.get(game_id, 0) + 1
+                    if failures < self.write_attempts:
+                        self._failures[game_id] = failures
+                        self._queue.put(game_id)
+                    else:
+                        logger.error(f"dropped the snapshot of {game_id} after {failures} failed writes")
+                        self._failures.pop(game_id, None)
+                        self._pending.pop(game_id)
+            self._queue.task_done()
+
+    @abstractmethod
+    def _write(self, game_id: str, data: bytes):
+        pass
+
+    @abstractmethod
+    def _read(self, game_id: str) -> Optional[bytes]:
+        pass
+
+
+class DirectorySnapshotStore(SnapshotStore):
+    EXTENSION = ".goatan"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        super().__init__()
+
+    def _path(self, game_id: str) -> str:
+        # Game ids come from clients, so they can't be trusted as file names.
+        if not game_id.isalnum():
+            raise error.InvalidAction(f"Invalid game id {game_id}")
+        return os.path.join(self.directory, game_id + self.EXTENSION)
+
+    def _write(self, game_id: str, data: bytes):
+        path = self._path(game_id)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def _read(self, game_id: str) -> Optional[bytes]:
+        try:
+            with open(self._path(game_id), "rb") as f:
+                return f.read()
+        except (FileNotFoundError, error.InvalidAction):
+            return None
+
+
+class SqliteSnapshotStore(SnapshotStore):
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute("CREATE TABLE IF NOT EXISTS snapshots (game_id TEXT PRIMARY KEY, data BLOB)")
+        self._connection().commit()
+        super().__init__()
+
+    # sqlite connections can't be shared between threads.
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            self._local.connection = connection
+        return connection
+
+    def _write(self, game_id: str, data: bytes):
+        connection = self._connection()
+        connection.execute("INSERT OR REPLACE INTO snapshots (game_id, data) VALUES (?, ?)", (game_id, data))
+        connection.commit()
+
+    def _read(self, game_id: str) -> Optional[bytes]:
+        row = self._connection().execute("SELECT data FROM snapshots WHERE game_id = ?", (game_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
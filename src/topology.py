@@ -0,0 +1,217 @@
+from array import array
+from typing import Iterator, Optional
+
+SIDES = 6
+
+# Fixed slot widths of the flat adjacency tables. Unused slots are padded with NONE.
+EDGE_TILES = 2
+EDGE_INTERSECTIONS = 2
+INTERSECTION_TILES = 3
+INTERSECTION_EDGES = 3
+
+NONE = -1
+
+# The change in axial coordinates (q, r) towards the neighbor on each side of a tile, by TileSide value.
+DIRECTIONS = [(0, -1), (1, -1), (1, 0), (0, 1), (-1, 1), (-1, 0)]
+
+
+# The grid position that owns each corner and side of a tile, as an offset from the tile along with the slot the corner or
+# side has there, by TileSide value. A tile's corner on side s is shared with the neighbors on sides s and s + 1, where it
+# is their corner on sides s + 2 and s + 4. A tile's side s is its neighbor's side s + 3 on that side.
+OWNED_CORNERS = 2
+OWNED_SIDES = 3
+CORNER_OWNERS = [(0, 0, 0), (0, 0, 1), (0, 1, 0), (-1, 1, 1), (-1, 1, 0), (-1, 0, 1)]
+SIDE_OWNERS = [(0, 0, 0), (0, 0, 1), (0, 0, 2), (0, 1, 0), (-1, 1, 1), (-1, 0, 2)]
+
+
+def _table(width: int, count: int = 0) -> array:
+    return array("i", [NONE]) * (width * count)
+
+
+# Integer-indexed board topology. Tiles, edges and intersections are identified by their index, and all adjacency is
+# stored in flat fixed-width tables, e.g. the intersections of tile t are tile_intersections[t * SIDES:(t + 1) * SIDES],
+# indexed by TileSide value. Tiles also have axial coordinates relative to tile 0, two per tile in tile_coordinates.
+class Topology:
+    def __init__(self, tile_neighbors: array, tile_coordinates: Optional[array] = None):
+        assert len(tile_neighbors) % SIDES == 0
+
+        self.tile_count = len(tile_neighbors) // SIDES
+        self.edge_count = 0
+        self.intersection_count = 0
+
+        self.tile_neighbors = tile_neighbors
+        self.tile_coordinates = tile_coordinates if tile_coordinates is not None else self._coordinates()
+        self.tile_edges = _table(SIDES, self.tile_count)
+        self.tile_intersections = _table(SIDES, self.tile_count)
+
+        # A tile adds at most SIDES edges and intersections. The tables are sized for that, and trimmed afterwards.
+        limit = SIDES * self.tile_count
+        self.edge_tiles = _table(EDGE_TILES, limit)
+        self.edge_intersections = _table(EDGE_INTERSECTIONS, limit)
+
+        self.intersection_tiles = _table(INTERSECTION_TILES, limit)
+        self.intersection_edges = _table(INTERSECTION_EDGES, limit)
+        self.intersection_neighbors = _table(INTERSECTION_EDGES, limit)
+
+        self._construct()
+
+        del self.edge_tiles[EDGE_TILES * self.edge_count:]
+        del self.edge_intersections[EDGE_INTERSECTIONS * self.edge_count:]
+        del self.intersection_tiles[INTERSECTION_TILES * self.intersection_count:]
+        del self.intersection_edges[INTERSECTION_EDGES * self.intersection_count:]
+        del self.intersection_neighbors[INTERSECTION_EDGES * self.intersection_count:]
+
+    # Every corner and side of a tile is worked out arithmetically from the tile's coordinates, in a single pass over the
+    # tiles. Each grid position owns two corners and three sides, those by TileSide 0 and 1 and by TileSide 0 to 2, and
+    # the other corners and sides of a tile belong to the positions given by CORNER_OWNERS and SIDE_OWNERS. Positions
+    # are indexed in a dense grid over the tiles' bounding box plus a margin, so finding the intersection or edge a tile
+    # shares with its neighbors is a single array lookup.
+    #
+    # Items are numbered in the order tiles first reach them, going around each tile's sides in order, which is the
+    # order boards have always been numbered in, so the logs of older games still replay onto the same boards.
+    def _construct(self):
+        neighbors = self.tile_neighbors
+        coordinates = self.tile_coordinates
+        tile_edges = self.tile_edges
+        tile_intersections = self.tile_intersections
+        edge_tiles = self.edge_tiles
+        edge_intersections = self.edge_intersections
+        intersection_tiles = self.intersection_tiles
+        intersection_edges = self.intersection_edges
+        intersection_neighbors = self.intersection_neighbors
+        if self.tile_count == 0:
+            return
+
+        q_min = min(coordinates[0::2]) - 1
+        r_min = min(coordinates[1::2]) - 1
+        rows = max(coordinates[1::2]) - r_min + 2
+        columns = max(coordinates[0::2]) - q_min + 2
+
+        # The offset of each corner's and side's owner from the tile, in grid slots, plus the slot within the owner, along
+        # with the sides next to the corner or side.
+        corners = [
+            (side, (dq * rows + dr) * OWNED_CORNERS + corner, (side + 1) % SIDES)
+            for side, (dq, dr, corner) in enumerate(CORNER_OWNERS)
+        ]
+        sides = [
+            (side, (dq * rows + dr) * OWNED_SIDES + owned, (side - 1) % SIDES)
+            for side, (dq, dr, owned) in enumerate(SIDE_OWNERS)
+        ]
+        corner_grid = _table(OWNED_CORNERS, rows * columns)
+        side_grid = _table(OWNED_SIDES, rows * columns)
+
+        # How many edges each intersection has been given so far.
+        intersection_degrees = bytearray(SIDES * self.tile_count)
+
+        intersection_count = 0
+        edge_count = 0
+        for tile in range(self.tile_count):
+            base = tile * SIDES
+            position = (coordinates[tile * 2] - q_min) * rows + coordinates[tile * 2 + 1] - r_min
+
+            # The intersection on a tile's side is shared with the neighbors on that side and the next.
+            for side, offset, next_side in corners:
+                slot = position * OWNED_CORNERS + offset
+                intersection = corner_grid[slot]
+                if intersection == NONE:
+                    intersection = intersection_count
+                    intersection_count += 1
+                    corner_grid[slot] = intersection
+
+                    start = intersection * INTERSECTION_TILES
+                    intersection_tiles[start] = tile
+                    for neighbor in (neighbors[base + side], neighbors[base + next_side]):
+                        if neighbor != NONE:
+                            start += 1
+                            intersection_tiles[start] = neighbor
+                tile_intersections[base + side] = intersection
+
+            # The edge on a tile's side connects the intersections on its side and the previous side.
+            for side, offset, previous_side in sides:
+                slot = position * OWNED_SIDES + offset
+                edge = side_grid[slot]
+                if edge == NONE:
+                    edge = edge_count
+                    edge_count += 1
+                    side_grid[slot] = edge
+
+                    edge_tiles[edge * EDGE_TILES] = tile
+                    edge_tiles[edge * EDGE_TILES + 1] = neighbors[base + side]
+
+                    intersection_0 = tile_intersections[base + side]
+                    intersection_1 = tile_intersections[base + previous_side]
+                    edge_intersections[edge * EDGE_INTERSECTIONS] = intersection_0
+                    edge_intersections[edge * EDGE_INTERSECTIONS + 1] = intersection_1
+
+                    slot_0 = intersection_0 * INTERSECTION_EDGES + intersection_degrees[intersection_0]
+                    slot_1 = intersection_1 * INTERSECTION_EDGES + intersection_degrees[intersection_1]
+                    intersection_edges[slot_0] = edge
+                    intersection_edges[slot_1] = edge
+                    intersection_neighbors[slot_0] = intersection_1
+                    intersection_neighbors[slot_1] = intersection_0
+                    intersection_degrees[intersection_0] += 1
+                    intersection_degrees[intersection_1] += 1
+                tile_edges[base + side] = edge
+
+        self.intersection_count = intersection_count
+        self.edge_count = edge_count
+
+    # Walks the tiles from tile 0 to find their coordinates, for tables that weren't built from coordinates.
+    def _coordinates(self) -> array:
+        coordinates = array("i", [0]) * (2 * self.tile_count)
+        visited = bytearray(self.tile_count)
+        tiles = [0] if self.tile_count > 0 else []
+        for tile in tiles:
+            visited[tile] = True
+            q, r = coordinates[tile * 2], coordinates[tile * 2 + 1]
+            for side, (dq, dr) in enumerate(DIRECTIONS):
+                neighbor = self.tile_neighbors[tile * SIDES + side]
+                if neighbor != NONE and not visited[neighbor]:
+                    visited[neighbor] = True
+                    coordinates[neighbor * 2] = q + dq
+                    coordinates[neighbor * 2 + 1] = r + dr
+                    tiles.append(neighbor)
+        return coordinates
+
+    def coordinates_of_tile(self, tile: int) -> (int, int):
+        return self.tile_coordinates[tile * 2], self.tile_coordinates[tile * 2 + 1]
+
+    @staticmethod
+    def _slots(table: array, index: int, width: int) -> Iterator[int]:
+        start = index * width
+        for slot in range(start, start + width):
+            value = table[slot]
+            if value != NONE:
+                yield value
+
+    def neighbors_of_tile(self, tile: int) -> Iterator[int]:
+        return self._slots(self.tile_neighbors, tile, SIDES)
+
+    def tiles_of_edge(self, edge: int) -> Iterator[int]:
+        return self._slots(self.edge_tiles, edge, EDGE_TILES)
+
+    def intersections_of_edge(self, edge: int) -> (int, int):
+        start = edge * EDGE_INTERSECTIONS
+        return self.edge_intersections[start], self.edge_intersections[start + 1]
+
+    def other_intersection(self, edge: int, intersection: int) -> int:
+        intersection_0, intersection_1 = self.intersections_of_edge(edge)
+        if intersection_0 == intersection:
+            return intersection_1
+        assert intersection_1 == intersection
+        return intersection_0
+
+    def tiles_of_intersection(self, intersection: int) -> Iterator[int]:
+        return self._slots(self.intersection_tiles, intersection, INTERSECTION_TILES)
+
+    def edges_of_intersection(self, intersection: int) -> Iterator[int]:
+        return self._slots(self.intersection_edges, intersection, INTERSECTION_EDGES)
+
+    def neighbors_of_intersection(self, intersection: int) -> Iterator[int]:
+        return self._slots(self.intersection_neighbors, intersection, INTERSECTION_EDGES)
+
+    def neighbors_of_edge(self, edge: int) -> Iterator[int]:
+        for intersection in self.intersections_of_edge(edge):
+            for neighbor in self.edges_of_intersection(intersection):
+                if neighbor != edge:
+                    yield neighbor
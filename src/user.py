@@ -1,21 +1,59 @@
-from typing import Dict
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
 
 from src.util import GameItem
 
 
 class UserManager:
-    def __init__(self):
-        self.users: Dict[str, User] = {}
+    def __init__(self, ttl: Optional[float] = None, max_users: Optional[int] = None):
+        # Least recently seen first. Users that haven't been seen for ttl seconds are forgotten. Games still know their
+        # players by user id, so forgotten users can keep playing the games they joined.
+        self.users: OrderedDict[str, User] = OrderedDict()
+        self.ttl = ttl
+        self.max_users = max_users
+
+        self._last_seen: Dict[str, float] = {}
+        self._lock = threading.Lock()
 
     def create_user(self):
         user = User()
-        self.users[user.id] = user
+        self._add(user)
         return user
 
+    def _add(self, user: "User"):
+        now = time.monotonic()
+        with self._lock:
+            self.users[user.id] = user
+            self._last_seen[user.id] = now
+            self._evict(now)
+
     def get(self, id_: str):
-        return self.users.get(id_)
+        with self._lock:
+            user = self.users.get(id_)
+            if user is not None:
+                self.users.move_to_end(id_)
+                self._last_seen[id_] = time.monotonic()
+            return user
+
+    def _evict(self, now: float):
+        while len(self.users) > 0:
+            id_ = next(iter(self.users))
+            expired = self.ttl is not None and now - self._last_seen[id_] >= self.ttl
+            excess = self.max_users is not None and len(self.users) > self.max_users
+            if not expired and not excess:
+                break
+            self.users.pop(id_)
+            self._last_seen.pop(id_)
 
 
 class User(GameItem):
     def __init__(self):
-        super().__init__()
+        self.id = self._generate_id()
+
+    # User ids are kept in cookies and identify players to the server, so they can't be guessed.
+    @staticmethod
+    def _generate_id():
+        return secrets.token_urlsafe(12)
@@ -1,19 +1,29 @@
-from abc import ABC, abstractmethod
-import uuid
+from abc import ABC
+import json
+from typing import Union
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+
+# Compact JSON as bytes, with orjson when it's installed. Integer ids are used as keys, which JSON turns into strings.
+def encode_json(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+# Board items and players are numbered densely within their game, which is all the id they need. Only games and users,
+# which are looked up from outside of any game, have string ids.
 class GameItem(ABC):
-    def __init__(self):
-        self.id = self._generate_id()
+    __slots__ = ()
 
-    @staticmethod
-    def _generate_id():
-        return str(uuid.uuid4())
+    id: Union[int, str]
 
     def __eq__(self, other):
-        if other is None:
-            return False
-        return self.id == other.id
+        return self is other or (type(other) is type(self) and self.id == other.id)
 
     def __hash__(self):
         return hash(self.id)
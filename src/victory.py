@@ -1,28 +1,588 @@
 from abc import ABC, abstractmethod
-from typing import Optional
-from src.board import Board
+from typing import Optional, Callable, Dict, List, FrozenSet, Set, Iterable, Tuple
+from src.board import Board, BoardListener
+from src.piece import Settlement, Road
 from src.player import Player
 
 
 class WinCondition(ABC):
+    @abstractmethod
+    def attach(self, board: Board):
+        pass
+
     @abstractmethod
     def victor(self, board: Board) -> Optional[Player]:
         pass
 
+    @abstractmethod
+    def points(self, player: Player) -> int:
+        pass
+
+    # Called once each of the player's actions is done, which is when the player can win. Points also change while
+    # other players act, e.g. when a settlement breaks a rival's road, but nobody wins on someone else's action.
+    @abstractmethod
+    def action_taken(self, player: Player):
+        pass
+
+    @abstractmethod
+    def serialize(self) -> dict:
+        pass
+
+    # The longest roads, for win conditions that score them.
+    def longest_road(self) -> Optional["LongestRoad"]:
+        return None
+
+    # What can't be rebuilt by placing the board's pieces again, e.g. who got to a tied longest road first. Used for
+    # snapshots and clones.
+    def save_state(self) -> List[int]:
+        return []
+
+    def load_state(self, state: List[int]):
+        pass
+
+    # A copy for a cloned game with the given board and players, with the same points, see Goatan.clone.
+    @abstractmethod
+    def clone(self, board: Board, players: Dict[Player, Player]) -> "WinCondition":
+        pass
+
+
+# A source of victory points. Sources follow the board and report changes to a player's points as they happen, so the
+# totals never need to be recounted.
+class ScoringSource(BoardListener, ABC):
+    def __init__(self):
+        self._award: Optional[Callable[[Player, str, int], None]] = None
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        pass
+
+    def attach(self, board: Board, award: Callable[[Player, str, int], None]):
+        self._award = award
+        board.subscribe(self)
+
+    def award(self, player: Player, points: int):
+        self._award(player, self.name, points)
+
+    # A copy for a cloned game that hasn't been attached yet. The points it gave are copied by the win condition.
+    @abstractmethod
+    def clone(self, board: Board, players: Dict[Player, Player]) -> "ScoringSource":
+        pass
+
+    def save_state(self) -> List[int]:
+        return []
+
+    def load_state(self, state: List[int]):
+        pass
+
+
+class SettlementPoints(ScoringSource):
+    def __init__(self):
+        super().__init__()
+        self._settlements: Dict[int, Settlement] = {}
+
+    @property
+    def name(self) -> str:
+        return "settlements"
+
+    def clone(self, board: Board, players: Dict[Player, Player]) -> "SettlementPoints":
+        source = SettlementPoints()
+        source._settlements = {intersection: board.settlements[intersection] for intersection in self._settlements}
+        return source
+
+    def settlement_set(self, intersection: int, settlement: Optional[Settlement]):
+        previous = self._settlements.pop(intersection, None)
+        if previous is not None:
+            self.award(previous.player, -1)
+
+        if settlement is not None:
+            self._settlements[intersection] = settlement
+            self.award(settlement.player, 1)
+
+    def road_set(self, edge: int, road: Road):
+        pass
+
+
+# Points for the longest road of at least min_length segments. Whoever holds it keeps it until another player's road is
+# strictly longer, and if the holder's road is broken by a settlement and several others tie for the longest, nobody
+# holds it.
+#
+# Each player's roads are kept as connected components, with the length of the longest trail through each. A trail may
+# not pass through another player's settlement. A placement only rebuilds the components of the edges next to it, and
+# only the longest trails of the rebuilt components are searched again, so its cost depends on the size of those
+# components rather than on the board.
+class LongestRoad(ScoringSource):
+    # How many steps the search of a component may take when a piece is placed, how many times more each refinement of a
+    # component takes than the last, see refine, and the most it takes. Placing a piece in a game to the default points
+    # takes a couple of thousand steps at most, and the steps of a placement take a few dozen milliseconds even on a
+    # board covered in one player's roads.
+    STEPS = 10000
+    REFINE_FACTOR = 4
+    MAX_STEPS = 16 * STEPS
+
+    def __init__(self, points: int = 2, min_length: int = 5):
+        super().__init__()
+        self.points = points
+        self.min_length = min_length
+        self.holder: Optional[Player] = None
+
+        self._board: Optional[Board] = None
+        # The counted roads' players by edge, and the component each road belongs to.
+        self._roads: Dict[int, Player] = {}
+        self._components: Dict[int, FrozenSet[int]] = {}
+        self._component_lengths: Dict[FrozenSet[int], int] = {}
+        self._player_components: Dict[Player, Set[FrozenSet[int]]] = {}
+        self._lengths: Dict[Player, int] = {}
+        # The steps of the last search of each component whose first search ran out of them, 0 once a refinement
+        # finished it. The same by component and the intersections in its way, with the length, so that a component
+        # that comes back, e.g. on undo, keeps its length.
+        self._steps: Dict[FrozenSet[int], int] = {}
+        self._searched: Dict[Tuple[FrozenSet[int], FrozenSet[int]], Tuple[int, int]] = {}
+
+    @property
+    def name(self) -> str:
+        return "longest_road"
+
+    def attach(self, board: Board, award: Callable[[Player, str, int], None]):
+        super().attach(board, award)
+        self._board = board
+
+    # Components are never modified once they're built, so they're shared with the copy.
+    def clone(self, board: Board, players: Dict[Player, Player]) -> "LongestRoad":
+        source = LongestRoad(self.points, self.min_length)
+        source.holder = players[self.holder] if self.holder is not None else None
+        source._roads = {edge: players[player] for edge, player in self._roads.items()}
+        source._components = self._components.copy()
+        source._component_lengths = self._component_lengths.copy()
+        source._player_components = {
+            players[player]: components.copy() for player, components in self._player_components.items()
+        }
+        source._lengths = {players[player]: length for player, length in self._lengths.items()}
+        source._steps = self._steps.copy()
+        source._searched = self._searched.copy()
+        return source
+
+    def length(self, player: Player) -> int:
+        return self._lengths.get(player, 0)
+
+    # Whether the search of any component ran out of steps before it was sure of its length, and can be refined.
+    @property
+    def refinable(self) -> bool:
+        return any(0 < steps < self.MAX_STEPS for steps in self._steps.values())
+
+    # Searches the components whose search ran out of steps again, each with REFINE_FACTOR times the steps of its last
+    # search, which finds at least what that one did. Meant to run between actions, so that placing a piece never waits
+    # for more than STEPS. Components still unfinished after MAX_STEPS keep the longest trail found. Returns whether any
+    # components can be refined further.
+    def refine(self) -> bool:
+        journal = self._board.journal
+        for component, previous_steps in list(self._steps.items()):
+            if not 0 < previous_steps < self.MAX_STEPS:
+                continue
+            player = self._roads[next(iter(component))]
+            previous_length = self._component_lengths[component]
+            previous_player_length = self._lengths[player]
+
+            steps = min(previous_steps * self.REFINE_FACTOR, self.MAX_STEPS)
+            length, finished = self._longest_trail(player, component, steps)
+            length = max(length, previous_length)
+            steps = 0 if finished else steps
+            self._component_lengths[component] = length
+            self._steps[component] = steps
+            self._searched[self._search_key(player, component)] = (length, steps)
+            self._lengths[player] = max(previous_player_length, length)
+
+            if journal is not None:
+                journal.record(
+                    self._restorer(player, component, previous_length, previous_steps, previous_player_length),
+                )
+
+        self._update_holder()
+        return self.refinable
+
+    def _restorer(self, player: Player, component: FrozenSet[int], length: int, steps: int, player_length: int):
+        def restore():
+            self._component_lengths[component] = length
+            self._steps[component] = steps
+            self._lengths[player] = player_length
+        return restore
+
+    def settlement_set(self, intersection: int, settlement: Optional[Settlement]):
+        # A settlement can only break or join the roads of players with at least two roads through it.
+        edges: Dict[Player, List[int]] = {}
+        for edge in self._board.topology.edges_of_intersection(intersection):
+            player = self._roads.get(edge)
+            if player is not None:
+                edges.setdefault(player, []).append(edge)
+
+        changed = False
+        for player, player_edges in edges.items():
+            if len(player_edges) > 1:
+                # Trails through a settlement of someone else's are broken.
+                self._rebuild(player, player_edges, settlement is None or settlement.player == player)
+                changed = True
+        if changed:
+            self._update_holder()
+
+    def road_set(self, edge: int, road: Optional[Road]):
+        previous = self._roads.pop(edge, None)
+        if road is not None:
+            self._roads[edge] = road.player
+
+        if previous is not None and (road is None or previous != road.player):
+            self._rebuild(previous, [edge], True)
+        if road is not None:
+            self._rebuild(road.player, [edge], True)
+        self._update_holder()
+
+    def _passable(self, intersection: int, player: Player) -> bool:
+        settlement = self._board.settlements[intersection]
+        return settlement is None or settlement.player == player
+
+    # Replaces the player's components that touch the given edges with the components their roads form now. When the
+    # trails of the old components are still trails, a component that grew out of one is at least as long as it was,
+    # which matters when its search runs out of steps.
+    def _rebuild(self, player: Player, edges: Iterable[int], trails_kept: bool):
+        topology = self._board.topology
+        components = self._player_components.setdefault(player, set())
+
+        replaced: Dict[FrozenSet[int], int] = {}
+        roads: Set[int] = set()
+        for edge in edges:
+            for touched in (edge, *topology.neighbors_of_edge(edge)):
+                component = self._components.get(touched)
+                if component is not None and component in components:
+                    components.discard(component)
+                    replaced[component] = self._component_lengths.pop(component)
+                    self._steps.pop(component, None)
+                    roads.update(component)
+                elif self._roads.get(touched) == player:
+                    roads.add(touched)
+
+        for road in roads:
+            self._components.pop(road, None)
+        roads = {road for road in roads if self._roads.get(road) == player}
+
+        while len(roads) > 0:
+            start = roads.pop()
+            members = {start}
+            stack = [start]
+            while len(stack) > 0:
+                edge = stack.pop()
+                for intersection in topology.intersections_of_edge(edge):
+                    if not self._passable(intersection, player):
+                        continue
+                    for neighbor in topology.edges_of_intersection(intersection):
+                        if neighbor in roads:
+                            roads.remove(neighbor)
+                            members.add(neighbor)
+                            stack.append(neighbor)
+
+            component = frozenset(members)
+            components.add(component)
+            self._component_lengths[component] = self._search(
+                player, component, replaced if trails_kept else {},
+            )
+            for edge in component:
+                self._components[edge] = component
+
+        if len(components) > 0:
+            self._lengths[player] = max(self._component_lengths[component] for component in components)
+        else:
+            self._lengths.pop(player, None)
+
+    def _search_key(self, player: Player, component: FrozenSet[int]) -> Tuple[FrozenSet[int], FrozenSet[int]]:
+        topology = self._board.topology
+        return component, frozenset(
+            intersection for edge in component for intersection in topology.intersections_of_edge(edge)
+            if not self._passable(intersection, player)
+        )
+
+    # The length of a new component, which is exact unless the search runs out of steps. Otherwise it's the longest
+    # trail found, or what a component it grew out of or an earlier search of the same component had if that's longer.
+    def _search(self, player: Player, component: FrozenSet[int], replaced: Dict[FrozenSet[int], int]) -> int:
+        length, finished = self._longest_trail(player, component, self.STEPS)
+        if finished:
+            return length
+
+        steps = self.STEPS
+        key = self._search_key(player, component)
+        searched = self._searched.get(key)
+        if searched is not None and searched[0] >= length:
+            length, steps = searched
+        for old, old_length in replaced.items():
+            if old <= component:
+                length = max(length, old_length)
+
+        self._steps[component] = steps
+        self._searched[key] = (length, steps)
+        return length
+
+    # The search is exact if it finishes within the given steps, and returns whether it did. Runs of roads through
+    # intersections that only join two of them and can be passed are contracted into weighted chains, which leaves the
+    # intersections where the component branches, ends or can't be passed. A longest trail can always be made to start
+    # at one of those, unless the component is a single loop, which can start anywhere, and it's more likely to start
+    # where an odd number of roads meet, so those are tried first.
+    #
+    # Every pair of odd intersections beyond a trail's two ends leaves at least one road out, which bounds how much
+    # longer a trail can get with the chains it can still reach. Branches that can't beat the longest trail found are
+    # cut, and so are ones reaching an intersection with the same chains left but no more length than before, since
+    # nothing they could still find is new. When the bound leaves nothing out the remaining roads are walked in one go.
+    #
+    # The cost still grows exponentially with the loops in a component: components of the 30 or so roads a game to the
+    # default points reaches finish within a fraction of the steps, but dense networks of 50 or more roads can take
+    # seconds, hence the steps. The search only depends on the component, the settlements around it and the steps, so
+    # it always finds the same trail.
+    def _longest_trail(self, player: Player, component: FrozenSet[int], steps: int) -> Tuple[int, bool]:
+        topology = self._board.topology
+
+        degrees: Dict[int, int] = {}
+        for edge in component:
+            for intersection in topology.intersections_of_edge(edge):
+                degrees[intersection] = degrees.get(intersection, 0) + 1
+        odd = sum(1 for degree in degrees.values() if degree % 2 == 1)
+        bound = len(component) - max(odd - 2, 0) // 2
+
+        blocked = {intersection for intersection in degrees if not self._passable(intersection, player)}
+        branches = sorted(
+            intersection for intersection, degree in degrees.items() if degree != 2 or intersection in blocked
+        )
+        if len(branches) == 0:
+            return len(component), True
+
+        # Chains by branch: (chain bit, length, the branch at the other end).
+        chains: Dict[int, List[Tuple[int, int, int]]] = {branch: [] for branch in branches}
+        chain_count = 0
+        walked: Set[int] = set()
+        for branch in branches:
+            for first in topology.edges_of_intersection(branch):
+                if first not in component or first in walked:
+                    continue
+                walked.add(first)
+                length = 1
+                edge = first
+                intersection = topology.other_intersection(first, branch)
+                while intersection not in chains:
+                    edge = next(
+                        other for other in topology.edges_of_intersection(intersection)
+                        if other != edge and other in component
+                    )
+                    walked.add(edge)
+                    length += 1
+                    intersection = topology.other_intersection(edge, intersection)
+
+                bit = 1 << chain_count
+                chain_count += 1
+                chains[branch].append((bit, length, intersection))
+                if intersection != branch:
+                    chains[intersection].append((bit, length, branch))
+
+        # The longest trail found so far, the longest one each intersection was reached with by the chains that can
+        # still be reached from it, and whether the search ran out of steps.
+        longest = 0
+        reached: Dict[Tuple[int, int], int] = {}
+        cut = False
+
+        def extend(intersection: int, available: int, length: int):
+            nonlocal longest, steps, cut
+            if steps <= 0:
+                cut = True
+                return
+
+            reachable = 0
+            remaining = 0
+            joined = {intersection}
+            passable = intersection not in blocked
+            stack = [intersection]
+            while len(stack) > 0:
+                current = stack.pop()
+                for bit, chain_length, other in chains[current]:
+                    if available & bit and not reachable & bit:
+                        reachable |= bit
+                        remaining += chain_length
+                        if other not in joined:
+                            joined.add(other)
+                            if other in blocked:
+                                passable = False
+                            else:
+                                stack.append(other)
+            # Each step is an intersection walked over, so that the steps bound the time whatever the component.
+            steps -= len(joined)
+            if reachable == 0:
+                return
+
+            key = (intersection, reachable)
+            if reached.get(key, -1) >= length:
+                return
+            reached[key] = length
+
+            odd = 0
+            odd_start = False
+            for current in joined:
+                degree = sum(2 if other == current else 1 for bit, _, other in chains[current] if reachable & bit)
+                if degree % 2 == 1:
+                    odd += 1
+                    odd_start = odd_start or current == intersection
+            reachable_bound = remaining - (odd - 2) // 2 if odd_start else remaining - odd // 2
+            if length + reachable_bound <= longest:
+                return
+            # Nothing left over and nothing in the way, so every remaining road can be walked in one go.
+            if passable and reachable_bound == remaining:
+                longest = length + remaining
+                return
+
+            for bit, chain_length, other in chains[intersection]:
+                if reachable & bit:
+                    longest = max(longest, length + chain_length)
+                    if other not in blocked:
+                        extend(other, reachable & ~bit, length + chain_length)
+
+        every_chain = (1 << chain_count) - 1
+        for start in sorted(branches, key=lambda branch: degrees[branch] % 2 == 0):
+            extend(start, every_chain, 0)
+            if longest >= bound or cut:
+                break
+        return longest, longest >= bound or not cut
+
+    def _update_holder(self):
+        holder = self.holder
+        if holder is not None:
+            length = self._lengths.get(holder, 0)
+            if length >= self.min_length and all(other <= length for other in self._lengths.values()):
+                return
+
+        best = max(self._lengths.values(), default=0)
+        leaders = [player for player, length in self._lengths.items() if length == best]
+        self._hold(leaders[0] if best >= self.min_length and len(leaders) == 1 else None)
+
+    def _hold(self, player: Optional[Player]):
+        previous = self.holder
+        if player == previous:
+            return
+
+        if previous is not None:
+            self.award(previous, -self.points)
+        self.holder = player
+        if player is not None:
+            self.award(player, self.points)
+
+        journal = self._board.journal
+        if journal is not None:
+            journal.record(lambda: self._hold(previous))
+
+    # The holder, and the length and steps of each component whose search ran out of steps by one of its edges, since
+    # they depend on how the component was built and refined.
+    def save_state(self) -> List[int]:
+        state = [self.holder.id if self.holder is not None else -1]
+        for component, steps in self._steps.items():
+            state += [min(component), self._component_lengths[component], steps]
+        return state
+
+    def load_state(self, state: List[int]):
+        for offset in range(1, len(state), 3):
+            edge, length, steps = state[offset:offset + 3]
+            component = self._components[edge]
+            player = self._roads[edge]
+            self._component_lengths[component] = length
+            self._steps[component] = steps
+            self._searched[self._search_key(player, component)] = (length, steps)
+            self._lengths[player] = max(self._component_lengths[other] for other in self._player_components[player])
+
+        # The holder always has roads on the board.
+        self._hold(next((player for player in self._lengths if player.id == state[0]), None))
+
+    def serialize(self) -> dict:
+        return {
+            "holder": self.holder.id if self.holder is not None else None,
+            "lengths": {player.id: length for player, length in self._lengths.items()},
+        }
+
 
 class VictoryPoint(WinCondition):
-    def __init__(self, required_points: int):
+    def __init__(self, required_points: int, sources: List[ScoringSource] = None):
         self.required_points = required_points
+        self.sources = sources if sources is not None else [SettlementPoints(), LongestRoad()]
+
+        self._board: Optional[Board] = None
+        self._points: Dict[Player, int] = {}
+        self._breakdown: Dict[Player, Dict[str, int]] = {}
+        self._victor: Optional[Player] = None
+
+    def attach(self, board: Board):
+        self._board = board
+        for source in self.sources:
+            source.attach(board, self._award)
+
+    def _award(self, player: Player, source: str, points: int):
+        total = self._points.get(player, 0) + points
+        self._points[player] = total
+
+        # Sources that no longer give the player any points aren't listed, e.g. a longest road that was taken over.
+        breakdown = self._breakdown.setdefault(player, {})
+        breakdown[source] = breakdown.get(source, 0) + points
+        if breakdown[source] == 0:
+            del breakdown[source]
+            if len(breakdown) == 0:
+                del self._breakdown[player]
+                del self._points[player]
+
+    def points(self, player: Player) -> int:
+        return self._points.get(player, 0)
+
+    # The first player to have the required points at the end of one of their own actions wins.
+    def action_taken(self, player: Player):
+        if self._victor is None and self.points(player) >= self.required_points:
+            self._win(player)
+
+    def _win(self, player: Optional[Player]):
+        previous = self._victor
+        self._victor = player
+
+        journal = self._board.journal
+        if journal is not None:
+            journal.record(lambda: self._win(previous))
 
     def victor(self, board: Board) -> Optional[Player]:
-        points = {}
-        for intersection in board.settled_intersections:
-            player = intersection.settlement.player
-            if player not in points:
-                points[player] = 0
-            points[player] += 1
+        return self._victor
 
-            if points[player] >= self.required_points:
-                return player
+    def clone(self, board: Board, players: Dict[Player, Player]) -> "VictoryPoint":
+        win_condition = VictoryPoint(
+            self.required_points, [source.clone(board, players) for source in self.sources],
+        )
+        win_condition._points = {players[player]: points for player, points in self._points.items()}
+        win_condition._breakdown = {
+            players[player]: breakdown.copy() for player, breakdown in self._breakdown.items()
+        }
+        win_condition._victor = players[self._victor] if self._victor is not None else None
+        win_condition.attach(board)
+        return win_condition
 
-        return None
+    def longest_road(self) -> Optional[LongestRoad]:
+        return next((source for source in self.sources if isinstance(source, LongestRoad)), None)
+
+    # Each source's state, prefixed by its length, and then the victor.
+    def save_state(self) -> List[int]:
+        state = []
+        for source in self.sources:
+            source_state = source.save_state()
+            state += [len(source_state)] + source_state
+        return state + [self._victor.id if self._victor is not None else -1]
+
+    def load_state(self, state: List[int]):
+        offset = 0
+        for source in self.sources:
+            length = state[offset]
+            source.load_state(state[offset + 1:offset + 1 + length])
+            offset += 1 + length
+
+        # The victor always has points. Snapshots from before the victor was saved leave it to the caller.
+        if offset < len(state):
+            self._win(next((player for player in self._points if player.id == state[offset]), None))
+
+    def serialize(self) -> dict:
+        return {
+            player.id: {
+                "total": points,
+                **self._breakdown[player],
+            } for player, points in self._points.items()
+        }
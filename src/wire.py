@@ -0,0 +1,35 @@
+from enum import Enum
+from typing import Optional
+
+from src.util import encode_json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# How events are encoded for a socket. Clients ask for a protocol when they connect and get JSON unless they ask for
+# something else that the server supports.
+class Protocol(Enum):
+    JSON = "json"
+    MSGPACK = "msgpack"
+
+    @staticmethod
+    def negotiate(name: Optional[str]) -> "Protocol":
+        if name == Protocol.MSGPACK.value and msgpack is not None:
+            return Protocol.MSGPACK
+        return Protocol.JSON
+
+
+def encode(value, protocol: Protocol = Protocol.JSON) -> bytes:
+    if protocol == Protocol.MSGPACK:
+        return msgpack.packb(value)
+    return encode_json(value)
+
+
+def decode(data, protocol: Protocol = Protocol.JSON):
+    if protocol == Protocol.MSGPACK:
+        return msgpack.unpackb(data)
+    # socket.io already decodes JSON.
+    return data
@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from src import error
+from src.actor import ActorPool
+
+
+# A pool that's stuck on a command for the game until the returned event is set, so that everything submitted for the
+# game meanwhile stays pending. The other worker is free for other games.
+def blocked_pool(game_id: str = "game", max_pending: int = 4):
+    pool = ActorPool(workers=2, max_pending=max_pending)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    pool.submit(game_id, block)
+    assert started.wait(5)
+    return pool, release
+
+
+def test_commands_run_in_order():
+    pool, release = blocked_pool(max_pending=100)
+    ran = []
+    futures = [pool.submit("game", lambda index=index: ran.append(index) or index) for index in range(50)]
+    release.set()
+    assert [future.result(5) for future in futures] == list(range(50))
+    assert ran == list(range(50))
+
+
+def test_keyed_commands_are_coalesced():
+    pool, release = blocked_pool()
+    calls = []
+    first = pool.submit("game", lambda: calls.append("first") or "first", key="state")
+    second = pool.submit("game", lambda: calls.append("second") or "second", key="state")
+    other = pool.submit("game", lambda: "other", key="other")
+    assert second is first
+    release.set()
+    assert first.result(5) == "first"
+    assert other.result(5) == "other"
+    assert calls == ["first"]
+
+    # Once the command has run, the key can be used again.
+    assert pool.submit("game", lambda: "again", key="state").result(5) == "again"
+
+
+def test_full_mailbox_refuses_commands():
+    pool, release = blocked_pool(max_pending=2)
+    futures = [pool.submit("game", lambda: None) for _ in range(2)]
+    with pytest.raises(error.InvalidAction):
+        pool.submit("game", lambda: None)
+
+    # Coalesced and required commands are still accepted, and so are other games' commands.
+    keyed = pool.submit("game", lambda: "keyed", key="state", required=True)
+    assert pool.submit("game", lambda: "ignored", key="state") is keyed
+    assert pool.submit("other", lambda: "other").result(5) == "other"
+    assert not keyed.done()
+    release.set()
+    assert keyed.result(5) == "keyed"
+    for future in futures:
+        future.result(5)
+    # Caught up, so commands are accepted again.
+    assert pool.submit("game", lambda: "accepted").result(5) == "accepted"
+
+
+def test_failures_reach_the_caller():
+    pool = ActorPool(workers=2)
+
+    def fail():
+        raise error.InvalidAction("Nope")
+
+    with pytest.raises(error.InvalidAction):
+        pool.submit("game", fail).result(5)
+    assert pool.call("game", lambda: "still running") == "still running"
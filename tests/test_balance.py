@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+from src import board_generator
+from src.balance import Balancer, PIPS, HOT_PIPS
+from src.board import Tile, TileType, ResourceNumber
+
+
+@pytest.mark.parametrize("radius", [1, 2, 5])
+def test_balanced_boards_meet_constraints(radius):
+    for seed in range(40):
+        board = board_generator.StandardGenerator(radius=radius, rng=random.Random(seed), balanced=True).generate()
+        tiles = board.tile_list
+        for tile in range(board.topology.tile_count):
+            for neighbor in board.topology.neighbors_of_tile(tile):
+                assert tiles[tile].type != tiles[neighbor].type
+                numbers = (tiles[tile].resource_number, tiles[neighbor].resource_number)
+                assert not all(number is not None and PIPS[number] == HOT_PIPS for number in numbers)
+
+
+# Four 6s and 8s can't be kept apart on seven tiles, since the center touches all the others.
+def test_impossible_tiles_are_reported():
+    topology = board_generator.layout(1).topology
+    tiles = []
+    types = [TileType.WOOD, TileType.SHEEP, TileType.WHEAT, TileType.BRICK, TileType.STONE]
+    types += [TileType.WOOD, TileType.SHEEP]
+    numbers = [ResourceNumber.SIX, ResourceNumber.SIX, ResourceNumber.EIGHT, ResourceNumber.EIGHT]
+    numbers += [ResourceNumber.TWO, ResourceNumber.THREE, ResourceNumber.FOUR]
+    for type_, number in zip(types, numbers):
+        tile = Tile()
+        tile.type = type_
+        tile.resource_number = number
+        tiles.append(tile)
+
+    assert not Balancer(topology, random.Random(0)).balance(tiles)
+    assert sorted(tile.resource_number.value for tile in tiles) == sorted(number.value for number in numbers)
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from src import error
+from src.engine import GameEngine, RandomAgent
+from src.game import GameManager
+
+
+def started_game(seed: int = 1, actions: int = 40):
+    engine = GameEngine([RandomAgent(seed), RandomAgent(seed + 1), RandomAgent(seed + 2)], seed=seed)
+    for _ in range(actions):
+        engine.step()
+    return engine.game
+
+
+def test_clone_is_detached():
+    game = started_game()
+    clone = game.clone()
+    assert clone.detached
+    assert not game.detached
+    assert clone.id != game.id
+
+    games = GameManager()
+    with pytest.raises(error.InvalidState):
+        games._add(clone)
+    with pytest.raises(error.InvalidState):
+        clone.resume(lambda name, payload, to=None: None)
+
+
+def serialized(game) -> str:
+    return json.dumps(game.serialize(), sort_keys=True, default=str)
+
+
+@pytest.mark.parametrize("seed,actions", [(1, 0), (2, 30), (3, 120), (4, 300)])
+def test_clone_action_undo(seed, actions):
+    game = started_game(seed, actions)
+    # Rolled turns have trades and placements to try, rather than only the roll.
+    while len(game.legal_actions(game.phase.active_player)) == 1:
+        game.legal_actions(game.phase.active_player)[0].apply(game, game.phase.active_player)
+    original = serialized(game)
+    clone = game.clone()
+    assert serialized(clone) == original
+
+    for action in clone.legal_actions(clone.phase.active_player):
+        action.apply(clone, clone.phase.active_player)
+        clone.undo()
+        assert serialized(clone) == original
+    assert serialized(game) == original
+
+
+# Actions taken on a clone never show up in the game it was cloned from.
+def test_clone_is_independent():
+    game = started_game(5, 150)
+    original = serialized(game)
+    clone = game.clone()
+    for _ in range(40):
+        player = clone.phase.active_player
+        clone.legal_actions(player)[-1].apply(clone, player)
+    assert serialized(game) == original
+    for _ in range(40):
+        clone.undo()
+    assert serialized(clone) == original
@@ -0,0 +1,99 @@
+import threading
+import time
+
+from src import bot
+from src.action import Action, ActionType
+from src.actor import ActorPool
+from src.engine import Agent
+from src.game import GameManager, Goatan
+from src.interface import SocketRegistry
+
+
+class Registry(SocketRegistry):
+    def _emit(self, name: str, payload, to: str):
+        pass
+
+
+# Ends its turn when it can't, so every action it takes is rejected.
+class RejectedAgent(Agent):
+    def __init__(self):
+        self.calls = 0
+
+    def act(self, game, player, actions):
+        self.calls += 1
+        return Action(ActionType.END_TURN)
+
+
+def bot_game(seed: int = 1) -> Goatan:
+    game = Goatan(seed=seed)
+    bot.fill_seats(game, 2)
+    game.initialize(radius=2)
+    return game
+
+
+def wait_for(condition, timeout: float = 30) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_bots_play_until_the_game_ends():
+    registry = Registry(GameManager(), ActorPool(workers=2))
+    game = bot_game()
+    registry.submit_bots(game)
+    assert wait_for(lambda: game.finished)
+
+
+# A bot whose action is rejected would only be rejected again, so it isn't submitted again.
+def test_rejected_bot_is_not_resubmitted():
+    actors = ActorPool(workers=2)
+    registry = Registry(GameManager(), actors)
+    game = bot_game()
+    agent = RejectedAgent()
+    bot._agents[game] = {player: agent for player in game.players}
+
+    registry.submit_bots(game)
+    done = threading.Event()
+    # Commands for a game run in order, so the bot's command is done once this one runs.
+    wait_for(lambda: agent.calls > 0)
+    actors.submit(game.id, done.set)
+    assert done.wait(5)
+    time.sleep(0.1)
+    assert agent.calls == 1
+    assert game.version == 0
+
+
+def connected_game():
+    emitted = []
+    games = GameManager(emitter=lambda name, payload, to=None: emitted.append((name, to)))
+    registry = Registry(games, ActorPool(workers=2))
+    game = games.create_game()
+    for user in range(2):
+        game.join(f"user {user}")
+    game.initialize(radius=2)
+    for user in range(2):
+        registry.register_socket(f"sid {user}", {"game": game.id, "user": f"user {user}"})
+    return registry, game, emitted
+
+
+# The handlers shared by both kinds of namespace take the socket's id, and work out the player from it.
+def test_shared_handlers():
+    registry, game, emitted = connected_game()
+    registry.send_state("sid 0", {})
+    assert wait_for(lambda: ("game_state", "sid 0") in emitted)
+
+    active = f"sid {game.phase.active_player.id}"
+    inactive = next(sid for sid in ("sid 0", "sid 1") if sid != active)
+    registry.roll(inactive)
+    assert wait_for(lambda: ("action_error", inactive) in emitted)
+
+    intersection = next(iter(game.phase.serialize_hints()["intersections"]))
+    registry.place(active, {"piece_type": "house", "item": intersection})
+    assert wait_for(lambda: game.version == 1)
+    assert game.board.settlements[int(intersection)] is not None
+
+    registry.leave_game(active)
+    assert registry.get_auth(active) is None
@@ -0,0 +1,133 @@
+import random
+import time
+
+import pytest
+
+from src import board_generator
+from src.board import Board
+from src.piece import House, Road
+from src.player import Player, PlayerColor
+from src.victory import LongestRoad
+
+
+# The longest trail through the player's roads, by trying every trail from every intersection.
+def brute_force_length(board: Board, player: Player) -> int:
+    topology = board.topology
+    roads = {edge for edge, road in enumerate(board.roads) if road is not None and road.player == player}
+    longest = 0
+
+    def extend(intersection: int, used: set, length: int):
+        nonlocal longest
+        longest = max(longest, length)
+        settlement = board.settlements[intersection]
+        if length > 0 and settlement is not None and settlement.player != player:
+            return
+        for edge in topology.edges_of_intersection(intersection):
+            if edge in roads and edge not in used:
+                used.add(edge)
+                extend(topology.other_intersection(edge, intersection), used, length + 1)
+                used.remove(edge)
+
+    for intersection in {intersection for edge in roads for intersection in topology.intersections_of_edge(edge)}:
+        extend(intersection, set(), 0)
+    return longest
+
+
+# Roads and settlements are placed, replaced and taken away at random, without the rules of the game. Roads mostly
+# grow out of the player's own, so the networks have far more loops and broken trails than games do.
+@pytest.mark.parametrize("seed", range(8))
+def test_length_matches_brute_force(seed):
+    rng = random.Random(seed)
+    board = board_generator.StandardGenerator(radius=2, rng=rng).generate()
+    topology = board.topology
+    players = [Player(0, 0, "user 0", PlayerColor.WHITE), Player(1, 1, "user 1", PlayerColor.BLACK)]
+    longest_road = LongestRoad()
+    longest_road.attach(board, lambda player, source, points: None)
+
+    for placement in range(160):
+        kind = rng.random()
+        player = rng.choice(players)
+        if kind < 0.8:
+            edges = [
+                edge for edge in range(topology.edge_count)
+                if board.roads[edge] is None and board.edge_borders_road_for_player(edge, player)
+            ]
+            if len(edges) == 0 or rng.random() < 0.1:
+                edges = range(topology.edge_count)
+            board.set_road(Road(player), rng.choice(edges))
+        elif kind < 0.87:
+            board.set_road(None, rng.randrange(topology.edge_count))
+        elif kind < 0.95:
+            board.set_settlement(House(player), rng.randrange(topology.intersection_count))
+        else:
+            board.set_settlement(None, rng.randrange(topology.intersection_count))
+
+        # Searches that run out of steps find a trail that isn't the longest, until they're refined.
+        if placement % 4 == 3:
+            lengths = {player: brute_force_length(board, player) for player in players}
+            for player in players:
+                assert longest_road.length(player) <= lengths[player]
+            while longest_road.refine():
+                pass
+            for player in players:
+                assert longest_road.length(player) == lengths[player]
+
+
+# Roads of one player grown out from one edge until they cover the board, the densest network there can be.
+def dense_roads(board: Board, player: Player, seed: int):
+    rng = random.Random(seed)
+    topology = board.topology
+    placed = set()
+    frontier = {0}
+    while len(frontier) > 0:
+        edge = rng.choice(sorted(frontier))
+        frontier.remove(edge)
+        placed.add(edge)
+        yield edge
+        frontier.update(neighbor for neighbor in topology.neighbors_of_edge(edge) if neighbor not in placed)
+
+
+# Placing a road never takes more than the steps, and what's found doesn't shrink while the network grows.
+def test_dense_placements_are_bounded():
+    board = board_generator.StandardGenerator(radius=2, rng=random.Random(0)).generate()
+    player = Player(0, 0, "user 0", PlayerColor.WHITE)
+    longest_road = LongestRoad()
+    longest_road.attach(board, lambda player, source, points: None)
+
+    length = 0
+    refinable = 0
+    for edge in dense_roads(board, player, 0):
+        start = time.perf_counter()
+        board.set_road(Road(player), edge)
+        assert time.perf_counter() - start < 0.5
+        assert longest_road.length(player) >= length
+        length = longest_road.length(player)
+        refinable += longest_road.refinable
+    assert refinable > 0
+
+
+def test_refined_lengths_survive_save_state():
+    board = board_generator.StandardGenerator(radius=2, rng=random.Random(0)).generate()
+    player = Player(0, 0, "user 0", PlayerColor.WHITE)
+    longest_road = LongestRoad()
+    longest_road.attach(board, lambda player, source, points: None)
+    edges = []
+    for edge in dense_roads(board, player, 1):
+        board.set_road(Road(player), edge)
+        edges.append(edge)
+        if len(edges) == 60:
+            break
+    assert longest_road.refinable
+    length = longest_road.length(player)
+    longest_road.refine()
+    assert longest_road.length(player) >= length
+
+    # The same roads placed in another order find other trails, until the state is loaded.
+    copy = board_generator.StandardGenerator(radius=2, rng=random.Random(0)).generate()
+    restored = LongestRoad()
+    restored.attach(copy, lambda player, source, points: None)
+    for edge in reversed(edges):
+        copy.set_road(Road(player), edge)
+    restored.load_state(longest_road.save_state())
+    assert restored.length(player) == longest_road.length(player)
+    assert restored.save_state() == longest_road.save_state()
@@ -0,0 +1,49 @@
+import pytest
+
+from src import board_generator, error
+from src.action import Action, ActionType
+from src.game import Goatan
+
+
+def small_game(players: int) -> Goatan:
+    game = Goatan(seed=1)
+    for user in range(players):
+        game.join(f"user {user}")
+    game.players.finalize()
+    game.start(board_generator.StandardGenerator(radius=0, rng=game.random).generate())
+    return game
+
+
+def take_first_action(game: Goatan):
+    player = game.phase.active_player
+    actions = game.legal_actions(player)
+    assert len(actions) > 0
+    actions[0].apply(game, player)
+
+
+# A single tile only has room for three houses, so the fourth player has nowhere to place theirs.
+def test_turn_without_legal_placements_can_end():
+    game = small_game(4)
+    for _ in range(3 * 3):
+        take_first_action(game)
+
+    player = game.phase.active_player
+    assert game.legal_actions(player) == [Action(ActionType.END_TURN)]
+    game.end_turn(player)
+    # The last player places twice in a row, so the turn comes back to them.
+    assert game.phase.active_player is player
+    assert game.legal_actions(player) == [Action(ActionType.END_TURN)]
+
+
+def test_legal_actions_finish_placement():
+    game = small_game(4)
+    while game.phase.name() == "placement":
+        take_first_action(game)
+    assert game.phase.name() == "game"
+
+
+def test_turn_with_legal_placements_cannot_end():
+    game = small_game(2)
+    take_first_action(game)
+    with pytest.raises(error.InvalidAction):
+        game.end_turn(game.phase.active_player)
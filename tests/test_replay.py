@@ -0,0 +1,110 @@
+import json
+import random
+
+import pytest
+
+from src import error
+from src.game import Goatan
+from src.replay import replay, ActionLogStore
+from src.victory import LongestRoad
+
+
+def state(game) -> str:
+    return json.dumps(game.serialize(), sort_keys=True, default=str)
+
+
+def play(game, actions: int, seed: int, states: dict = None):
+    rng = random.Random(seed)
+    for _ in range(actions):
+        if game.finished:
+            return
+        player = game.phase.active_player
+        rng.choice(game.legal_actions(player)).apply(game, player)
+        if states is not None:
+            states[game.version] = state(game)
+
+
+def new_game(seed: int, logs=None) -> Goatan:
+    game = Goatan(logs=logs, seed=seed)
+    for user in range(3):
+        game.join(f"user {user}")
+    game.initialize(radius=2)
+    return game
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_replay_matches_game(seed):
+    game = new_game(seed)
+    states = {}
+    play(game, 300, seed, states)
+
+    replayed = replay(game.log.entries)
+    assert replayed.id == game.id
+    assert replayed.version == game.version
+    assert state(replayed) == state(game)
+
+    for version in list(states)[::25]:
+        assert state(replay(game.log.entries, version)) == states[version]
+
+
+# With few enough steps, longest roads are refined between the actions, which the replay has to do the same way.
+def test_replay_matches_refined_longest_roads(monkeypatch):
+    monkeypatch.setattr(LongestRoad, "STEPS", 1)
+    game = new_game(6)
+    rng = random.Random(6)
+    for _ in range(400):
+        if game.finished:
+            break
+        player = game.phase.active_player
+        rng.choice(game.legal_actions(player)).apply(game, player)
+        game.refine_longest_road()
+    assert any(entry["action"] == "refine_longest_road" for entry in game.log.entries)
+
+    assert state(replay(game.log.entries)) == state(game)
+
+
+def test_replay_needs_creation():
+    game = new_game(4)
+    with pytest.raises(error.InvalidState):
+        replay(game.log.entries[1:])
+
+
+# Rolls are logged with their result, so a log that doesn't match the code's dice is caught.
+def test_replay_detects_divergent_rolls():
+    game = new_game(5)
+    play(game, 100, 5)
+    entries = [dict(entry) for entry in game.log.entries]
+    roll = next(entry for entry in entries if entry["action"] == "roll")
+    roll["result"] = 1
+    with pytest.raises(error.InvalidState):
+        replay(entries)
+
+
+def test_store_restores_game(tmp_path):
+    logs = ActionLogStore(str(tmp_path))
+    game = new_game(6, logs)
+    play(game, 150, 6)
+    game.close()
+
+    restored = logs.restore(game.id)
+    # Clients can't rely on anything they were sent before the game was restored.
+    assert restored.version == game.version + 1
+    restored.version = game.version
+    assert state(restored) == state(game)
+    assert logs.restore("missing") is None
+
+
+# A crash can cut off the last line of a log, which is dropped along with the action it was for.
+def test_store_ignores_cut_off_line(tmp_path):
+    logs = ActionLogStore(str(tmp_path))
+    game = new_game(7, logs)
+    play(game, 50, 7)
+    game.close()
+
+    path = tmp_path / f"{game.id}{ActionLogStore.EXTENSION}"
+    lines = path.read_text().splitlines()
+    path.write_text("\n".join(lines[:-1]) + "\n" + lines[-1][:len(lines[-1]) // 2])
+
+    entries = logs.read(game.id)
+    assert len(entries) == len(lines) - 1
+    assert replay(entries).version == entries[-1]["version"]
@@ -0,0 +1,15 @@
+from src.resource import Resource, Transaction
+
+
+def test_transactions_with_colliding_hashes_differ():
+    assert hash(-1) == hash(-2)
+    assert Transaction({Resource.BRICK: -1}) != Transaction({Resource.BRICK: -2})
+    assert Transaction({Resource.BRICK: -1}) not in [Transaction({Resource.BRICK: -2})]
+
+
+def test_equal_transactions():
+    transaction = Transaction({Resource.WOOD: -4, Resource.SHEEP: 1})
+    assert transaction == Transaction({Resource.SHEEP: 1, Resource.WOOD: -4})
+    assert hash(transaction) == hash(Transaction({Resource.SHEEP: 1, Resource.WOOD: -4}))
+    assert transaction.inverse().inverse() == transaction
+    assert transaction != transaction.inverse()
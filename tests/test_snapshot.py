@@ -0,0 +1,123 @@
+import json
+import random
+import threading
+from typing import Dict, Optional
+
+import pytest
+
+from src import error, snapshot
+from src.engine import GameEngine, RandomAgent
+from src.game import Goatan, GameState
+
+
+def started_game(seed: int = 1, actions: int = 60):
+    engine = GameEngine([RandomAgent(seed), RandomAgent(seed + 1), RandomAgent(seed + 2)], seed=seed)
+    for _ in range(actions):
+        engine.step()
+    return engine.game
+
+
+class MemorySnapshotStore(snapshot.SnapshotStore):
+    def __init__(self, failing: bool = False):
+        self.failing = failing
+        self.writes: Dict[str, bytes] = {}
+        self.attempts = 0
+        super().__init__()
+
+    def _write(self, game_id: str, data: bytes):
+        self.attempts += 1
+        if self.failing:
+            raise OSError("No space left on device")
+        self.writes[game_id] = data
+
+    def _read(self, game_id: str) -> Optional[bytes]:
+        return self.writes.get(game_id)
+
+
+def flushed(store: snapshot.SnapshotStore) -> bool:
+    flush = threading.Thread(target=store.flush, daemon=True)
+    flush.start()
+    flush.join(timeout=5)
+    return not flush.is_alive()
+
+
+def test_failing_writes_do_not_hang_flush():
+    store = MemorySnapshotStore(failing=True)
+    game = started_game()
+    store.save(game)
+    assert flushed(store)
+    assert store.attempts == store.write_attempts
+    assert store.restore(game.id) is None
+
+    # The writer is still running after the failures.
+    store.failing = False
+    store.save(game)
+    assert flushed(store)
+    assert game.id in store.writes
+
+
+def state(game) -> str:
+    serialized = game.serialize()
+    del serialized["version"]
+    return json.dumps(serialized, sort_keys=True, default=str)
+
+
+def play(game, actions: int, seed: int):
+    rng = random.Random(seed)
+    for _ in range(actions):
+        if game.finished:
+            return
+        player = game.phase.active_player
+        rng.choice(game.legal_actions(player)).apply(game, player)
+
+
+@pytest.mark.parametrize("actions", [0, 8, 60, 400])
+def test_round_trip(actions):
+    game = started_game(2, actions)
+    restored = snapshot.decode(snapshot.encode(game))
+
+    assert restored.id == game.id
+    assert restored.seed == game.seed
+    # Clients can't rely on anything they were sent before the game was restored.
+    assert restored.version == game.version + 1
+    assert state(restored) == state(game)
+    assert restored.topology_payload() == game.topology_payload()
+    assert [player.resources for player in restored.players] == [player.resources for player in game.players]
+
+    # The restored game continues exactly like the original, dice included.
+    play(game, 100, seed=actions)
+    play(restored, 100, seed=actions)
+    assert state(restored) == state(game)
+
+
+def test_round_trip_in_lobby():
+    game = Goatan(seed=3)
+    game.join("user 0")
+    game.join("user 1")
+    restored = snapshot.decode(snapshot.encode(game))
+    assert restored.state == GameState.LOBBY
+    assert restored.board is None
+    assert [player.user_id for player in restored.players] == ["user 0", "user 1"]
+
+
+def test_decode_rejects_other_data():
+    with pytest.raises(error.InvalidState):
+        snapshot.decode(b"not a snapshot at all")
+
+
+@pytest.mark.parametrize("store_type", ["directory", "sqlite"])
+def test_stores_round_trip(tmp_path, store_type):
+    def open_store():
+        if store_type == "directory":
+            return snapshot.DirectorySnapshotStore(str(tmp_path))
+        return snapshot.SqliteSnapshotStore(str(tmp_path / "snapshots.db"))
+
+    game = started_game(4, 80)
+    store = open_store()
+    store.save(game)
+    store.flush()
+
+    restored = open_store().restore(game.id)
+    assert restored is not None
+    assert state(restored) == state(game)
+    assert open_store().restore("missing") is None
@@ -0,0 +1,91 @@
+import math
+
+import pytest
+
+from src import board_generator
+from src.topology import Topology, SIDES, NONE
+
+
+RADII = [0, 1, 2, 3, 7]
+
+
+# Where each corner of a tile is, with the flat sides of tiles to the north and south and unit length sides. The corner
+# on a tile's side s is between that side and the next.
+def corner_position(topology: Topology, tile: int, side: int) -> (float, float):
+    q, r = topology.coordinates_of_tile(tile)
+    angle = math.radians(60 - 60 * side)
+    x = 1.5 * q + math.cos(angle)
+    y = math.sqrt(3) * (r + q / 2) - math.sin(angle)
+    return round(x, 6), round(y, 6)
+
+
+@pytest.mark.parametrize("radius", RADII)
+def test_counts(radius):
+    topology = board_generator.layout(radius).topology
+    assert topology.tile_count == 3 * radius * (radius + 1) + 1
+    assert topology.edge_count == 9 * radius * radius + 15 * radius + 6
+    assert topology.intersection_count == 6 * radius * radius + 12 * radius + 6
+
+
+@pytest.mark.parametrize("radius", RADII)
+def test_intersections_are_distinct_corners(radius):
+    topology = board_generator.layout(radius).topology
+    positions = {}
+    for tile in range(topology.tile_count):
+        for side in range(SIDES):
+            intersection = topology.tile_intersections[tile * SIDES + side]
+            position = corner_position(topology, tile, side)
+            assert positions.setdefault(intersection, position) == position
+            assert tile in topology.tiles_of_intersection(intersection)
+    assert len(set(positions.values())) == topology.intersection_count
+
+    for intersection in range(topology.intersection_count):
+        tiles = list(topology.tiles_of_intersection(intersection))
+        assert 1 <= len(tiles) <= 3
+        assert all(intersection in topology.tile_intersections[tile * SIDES:(tile + 1) * SIDES] for tile in tiles)
+
+
+@pytest.mark.parametrize("radius", RADII)
+def test_edges_join_neighboring_corners(radius):
+    topology = board_generator.layout(radius).topology
+    for tile in range(topology.tile_count):
+        for side in range(SIDES):
+            edge = topology.tile_edges[tile * SIDES + side]
+            assert set(topology.intersections_of_edge(edge)) == {
+                topology.tile_intersections[tile * SIDES + side],
+                topology.tile_intersections[tile * SIDES + (side - 1) % SIDES],
+            }
+
+            neighbor = topology.tile_neighbors[tile * SIDES + side]
+            expected = {tile} if neighbor == NONE else {tile, neighbor}
+            assert set(topology.tiles_of_edge(edge)) == expected
+            if neighbor != NONE:
+                assert topology.tile_edges[neighbor * SIDES + (side + 3) % SIDES] == edge
+
+
+@pytest.mark.parametrize("radius", RADII)
+def test_intersection_adjacency(radius):
+    topology = board_generator.layout(radius).topology
+    degrees = [0] * topology.intersection_count
+    for edge in range(topology.edge_count):
+        intersection_0, intersection_1 = topology.intersections_of_edge(edge)
+        assert intersection_0 != intersection_1
+        for intersection, other in ((intersection_0, intersection_1), (intersection_1, intersection_0)):
+            assert edge in topology.edges_of_intersection(intersection)
+            assert other in topology.neighbors_of_intersection(intersection)
+            assert topology.other_intersection(edge, intersection) == other
+            degrees[intersection] += 1
+
+    for intersection in range(topology.intersection_count):
+        edges = list(topology.edges_of_intersection(intersection))
+        assert len(edges) == degrees[intersection]
+        assert len(edges) == (2 if len(list(topology.tiles_of_intersection(intersection))) == 1 else 3)
+
+
+# Stored boards only keep their tile neighbors, and get the same topology as the layout they were generated from.
+@pytest.mark.parametrize("radius", RADII)
+def test_topology_from_neighbors(radius):
+    layout = board_generator.layout(radius).topology
+    topology = Topology(layout.tile_neighbors)
+    for table in ("tile_edges", "tile_intersections", "edge_intersections", "intersection_edges", "tile_coordinates"):
+        assert getattr(topology, table) == getattr(layout, table)
@@ -0,0 +1,111 @@
+import random
+from typing import List, Optional, Set
+
+from src import board_generator, snapshot
+from src.board import Board
+from src.engine import GameEngine, RandomAgent
+from src.piece import House, Road
+from src.player import Player, PlayerColor
+from src.topology import Topology
+from src.victory import VictoryPoint
+
+
+# The edges of a path of the given length that doesn't touch any of the avoided intersections, and its intersections.
+def find_path(topology: Topology, length: int, avoided: Set[int]) -> (List[int], List[int]):
+    def extend(intersections: List[int], edges: List[int]) -> Optional[List[int]]:
+        if len(edges) == length:
+            return edges
+        for edge in topology.edges_of_intersection(intersections[-1]):
+            other = topology.other_intersection(edge, intersections[-1])
+            if other not in avoided and other not in intersections:
+                intersections.append(other)
+                edges.append(edge)
+                if extend(intersections, edges) is not None:
+                    return edges
+                intersections.pop()
+                edges.pop()
+        return None
+
+    for start in range(topology.intersection_count):
+        if start in avoided:
+            continue
+        intersections = [start]
+        edges = extend(intersections, [])
+        if edges is not None:
+            return edges, intersections
+    raise AssertionError("No path")
+
+
+def place_path(board: Board, player: Player, length: int, avoided: Set[int]) -> List[int]:
+    edges, intersections = find_path(board.topology, length, avoided)
+    for edge in edges:
+        board.set_road(Road(player), edge)
+    avoided.update(intersections)
+    for intersection in intersections:
+        avoided.update(board.topology.neighbors_of_intersection(intersection))
+    return intersections
+
+
+# A settlement that breaks the longest road hands it to a third player, who has the points to win but only wins on their
+# own action.
+def test_points_from_another_players_action_do_not_win():
+    board = board_generator.StandardGenerator(radius=2, rng=random.Random(1)).generate()
+    actor, rival, third = (Player(index, index, f"user {index}", color) for index, color in zip(range(3), PlayerColor))
+    win_condition = VictoryPoint(3)
+    win_condition.attach(board)
+
+    avoided: Set[int] = set()
+    rival_path = place_path(board, rival, 6, avoided)
+    third_path = place_path(board, third, 5, avoided)
+    board.set_settlement(House(third), third_path[0])
+    win_condition.action_taken(third)
+    assert win_condition.longest_road().holder == rival
+    assert win_condition.points(third) == 1
+
+    board.set_settlement(House(actor), rival_path[3])
+    assert win_condition.longest_road().holder == third
+    assert win_condition.points(third) == 3
+    win_condition.action_taken(actor)
+    assert win_condition.victor(board) is None
+
+    win_condition.action_taken(third)
+    assert win_condition.victor(board) == third
+
+
+# The game one action before its random players win.
+def game_before_victory(seed: int):
+    engine = GameEngine([RandomAgent(seed), RandomAgent(seed + 1), RandomAgent(seed + 2)], seed=seed)
+    assert engine.run() is not None
+
+    replay = GameEngine([RandomAgent(seed), RandomAgent(seed + 1), RandomAgent(seed + 2)], seed=seed)
+    for _ in range(engine.actions - 1):
+        replay.step()
+    return replay.game
+
+
+def test_undo_takes_back_victory():
+    game = game_before_victory(3)
+    clone = game.clone()
+    player = clone.phase.active_player
+    victories = 0
+    for action in clone.legal_actions(player):
+        action.apply(clone, player)
+        if clone.finished:
+            assert clone.win_condition.victor(clone.board) == player
+            victories += 1
+        clone.undo()
+        assert not clone.finished
+    assert victories > 0
+
+
+def test_snapshot_keeps_victor():
+    game = game_before_victory(4)
+    while not game.finished:
+        player = game.phase.active_player
+        game.legal_actions(player)[0].apply(game, player)
+    victor = game.win_condition.victor(game.board)
+
+    restored = snapshot.decode(snapshot.encode(game))
+    assert restored.finished
+    assert restored.win_condition.victor(restored.board).id == victor.id
+    assert restored.phase.name() == "finished"